@@ -6,7 +6,216 @@ import numpy as np
 from math import *
 from mathutils import Euler, Matrix, Quaternion, Vector
 from bpy import context, data, ops
- 
+from multiprocessing.connection import Listener
+
+
+
+def setup_scene():
+    """
+    Wipe the scene and create the materials, cameras, and light shared by all renders
+
+    Returns:
+        (dict): materials and cameras, keyed by name
+    """
+    ops.object.select_all(action='SELECT')
+    ops.object.delete(use_global=False)
+
+    # create Material
+    mat_blue = data.materials.new(name="Material_blue")
+    mat_blue.diffuse_color = (0.0553055, 0.0761522, 0.263268, 1)
+
+    mat_green = data.materials.new(name="Material_green")
+    mat_green.diffuse_color = (0.036845, 0.263268, 0.120192, 1)
+
+    mat_red = data.materials.new(name="Material_red")
+    mat_red.diffuse_color = (1, 0, 0, 1)
+
+    ## Camera Settings
+    ops.object.camera_add(enter_editmode=False, align='VIEW')
+    cam_1 = context.scene.objects['Camera']
+    cam_1.data.lens = 10
+    cam_1.data.sensor_width = 7.2481
+    cam_1.data.clip_start = 0.01
+    cam_1.data.shift_x = 0
+    cam_1.data.shift_y = 0
+    cam_1.location = (0, 0, 0)
+    cam_1.rotation_euler = Euler((0.0 * pi / 180, 180.0 * pi / 180, 180 * pi / 180))
+
+    ops.object.camera_add(enter_editmode=False, align='VIEW')
+    cam_2 = context.scene.objects['Camera.001']
+    cam_2.data.lens = 10
+    cam_2.data.sensor_width = 7.2481
+    cam_2.data.clip_start = 0.01
+    cam_2.data.shift_x = 0
+    cam_2.data.shift_y = 0
+    cam_2.location = (1, 0, 0)
+    cam_2.rotation_euler = Euler((0.0 * pi / 180, 90.0 * pi / 180, 0 * pi / 180))
+
+    ops.object.camera_add(enter_editmode=False, align='VIEW')
+    cam_3 = context.scene.objects['Camera.002']
+    cam_3.data.lens = 10
+    cam_3.data.sensor_width = 7.2481
+    cam_3.data.clip_start = 0.1
+    cam_3.data.shift_x = 0
+    cam_3.data.shift_y = 0
+    cam_3.location = (0, -0.2, -0.2)
+    cam_3.rotation_euler = Euler((0.0 * pi / 180, 150.0 * pi / 180, 270 * pi / 180))
+
+    ## Light Settings
+    bpy.ops.object.light_add(type='POINT', align='WORLD', location=(0, 0, 0))
+    light = context.scene.objects['Point']
+    light.location = (0, 0, 0)
+    light.rotation_euler = Euler((90.0 * pi / 180, 0.0 * pi / 180, 90 * pi / 180))
+    light.data.energy = 40
+
+    context.scene.render.image_settings.file_format = 'PNG'
+    context.scene.render.resolution_x = 640
+    context.scene.render.resolution_y = 480
+
+    return {'mat_blue': mat_blue, 'mat_green': mat_green, 'mat_red': mat_red, 1: cam_1, 2: cam_2, 3: cam_3}
+
+
+def clear_catheter():
+    """
+    Remove the curves and target spheres of the previous render, keeping cameras, light, and materials
+    """
+    for obj in list(data.objects):
+        if obj.name.startswith('catheter_curve_'):
+            curve_data = obj.data
+            data.objects.remove(obj, do_unlink=True)
+            data.curves.remove(curve_data)
+
+        elif obj.name.startswith('target_sphere_'):
+            mesh_data = obj.data
+            data.objects.remove(obj, do_unlink=True)
+            data.meshes.remove(mesh_data)
+
+
+def add_catheter(bezier_specs, target_specs, scene_objects):
+    """
+    Add the Bezier curves and target spheres to the scene
+
+    Args:
+        bezier_specs ((n, 4, 3) numpy array): start point, end point, control point 1, and
+            control point 2 of each Bezier curve
+        target_specs ((m, 3) numpy array or None): position of each target sphere
+        scene_objects (dict): output of setup_scene()
+    """
+    n_beziers = bezier_specs.shape[0]
+
+    for i in range(n_beziers):
+
+        # Create curve and cache reference.
+        ops.curve.primitive_bezier_curve_add(enter_editmode=False, align='WORLD', location=(0, 0, 0))
+
+        curve = context.active_object
+        curve.name = 'catheter_curve_' + str(i)
+        curve.data.resolution_u = 50
+
+        bez_points = curve.data.splines[0].bezier_points
+
+        p_start = bezier_specs[i, 0, :]
+        p_end = bezier_specs[i, 1, :]
+        c1 = bezier_specs[i, 2, :]
+        c2 = bezier_specs[i, 3, :]
+
+        # Left point.
+        bez_points[0].co = p_start
+        bez_points[0].handle_left_type = 'FREE'
+        bez_points[0].handle_right_type = 'FREE'
+        bez_points[0].handle_left = Vector((1.0, 0.0, 0.0))  # not needed
+        bez_points[0].handle_right = c1
+
+        # Top-middle point.
+        bez_points[1].co = p_end
+        bez_points[1].handle_left_type = 'FREE'
+        bez_points[1].handle_right_type = 'FREE'
+        bez_points[1].handle_left = c2
+        bez_points[1].handle_right = Vector((1.0, 0.0, 0.0))  # not needed
+
+        curve.data.bevel_depth = 0.0015
+        curve.data.bevel_resolution = 10
+        curve.data.materials.append(scene_objects['mat_blue'])
+
+    ## Target Visualization
+    if target_specs is not None:
+        n_targets = target_specs.shape[0]
+
+        for i in range(n_targets):
+            ops.mesh.primitive_uv_sphere_add(radius=0.002, location=target_specs[i, :])
+            ops.object.shade_smooth()
+
+            sphere = context.active_object
+            sphere.name = 'target_sphere_' + str(i)
+            sphere.data.materials.append(scene_objects['mat_red'])
+
+    ## Return to object mode..
+    ops.object.mode_set(mode='OBJECT')
+
+
+def render(bezier_specs, save_path, viewpoint_mode, target_specs, transparent_mode, scene_objects):
+    """
+    Render one image of the Bezier curves
+
+    Args:
+        bezier_specs ((n, 4, 3) numpy array): specs of the Bezier curves to be rendered
+        save_path (path string to png file): path to save the rendered image
+        viewpoint_mode (1, 2, or 3): camera view of rendered image
+        target_specs ((m, 3) numpy array or None): specs of the target points to be rendered
+        transparent_mode (0 or 1): whether to make the background transparent
+        scene_objects (dict): output of setup_scene()
+    """
+    if int(viewpoint_mode) not in (1, 2, 3):
+        raise ValueError('viewpoint_mode invalid: ' + str(viewpoint_mode))
+
+    clear_catheter()
+    add_catheter(bezier_specs, target_specs, scene_objects)
+
+    context.scene.render.film_transparent = int(transparent_mode) == 1
+
+    ## Render
+    context.scene.camera = scene_objects[int(viewpoint_mode)]
+    context.scene.render.filepath = save_path
+    ops.render.render(use_viewport = True, write_still = True)
+
+
+def serve(port_file):
+    """
+    Keep the scene resident and render jobs received over a local socket until the client disconnects
+
+    Args:
+        port_file (path string to file): file to write the port to once listening. The port is picked by the
+            system when binding, so no other process can take it between choosing and binding
+
+    Note:
+        Each job is a dict with keys specs, save_path, viewpoint_mode, target_specs, and transparent_mode.
+        The reply is 'ok' on success or the error message otherwise. A None job shuts the server down.
+    """
+    scene_objects = setup_scene()
+    authkey = os.environ.get('BEZIER_RENDER_AUTHKEY', '').encode()
+
+    with Listener(('localhost', 0), authkey=authkey) as listener:
+        ## Write then rename, so the client never reads a partially written port
+        with open(port_file + '.tmp', 'w') as f:
+            f.write(str(listener.address[1]))
+        os.replace(port_file + '.tmp', port_file)
+
+        with listener.accept() as conn:
+            while True:
+                try:
+                    job = conn.recv()
+                except EOFError:
+                    break
+
+                if job is None:
+                    break
+
+                try:
+                    render(job['specs'], job['save_path'], job['viewpoint_mode'], job['target_specs'],
+                           job['transparent_mode'], scene_objects)
+                    conn.send('ok')
+                except Exception as e:
+                    conn.send(repr(e))
 
 
 parser = argparse.ArgumentParser()
@@ -15,147 +224,29 @@ parser = argparse.ArgumentParser()
 _, all_arguments = parser.parse_known_args()
 double_dash_index = all_arguments.index('--')
 script_args = all_arguments[double_dash_index + 1: ]
-parser.add_argument('specs_path', help='Path to an npy file. Specs of the Bezier curves to be rendered.')
-parser.add_argument('save_path', help='Path to save the rendered images. Assume PNG.')
-parser.add_argument('viewpoint_mode', help='Setting of viewpoint option. 1 for catheter POV and 2 for side view.', default=1)
-parser.add_argument('target_specs_path', help='Path to an npy file. Specs of the target points to be rendered.', default=None)
-parser.add_argument('transparent_mode', help='Whether or not to make rendering background transparent', default=0)
-args, _ = parser.parse_known_args(script_args)
-
-
-bezier_specs = np.load(args.specs_path)
-n_beziers = bezier_specs.shape[0]
-
-
-ops.object.select_all(action='SELECT')
-ops.object.delete(use_global=False)
-
-
-# create Material
-mat_blue = data.materials.new(name="Material_blue")
-mat_blue.diffuse_color = (0.0553055, 0.0761522, 0.263268, 1)
-
-mat_green = data.materials.new(name="Material_green")
-mat_green.diffuse_color = (0.036845, 0.263268, 0.120192, 1)
-
-mat_red = data.materials.new(name="Material_red")
-mat_red.diffuse_color = (1, 0, 0, 1)
-
-
-for i in range(n_beziers):
-
-    # Create curve and cache reference.
-    ops.curve.primitive_bezier_curve_add(enter_editmode=False, align='WORLD', location=(0, 0, 0))
-
-    curve = context.active_object
-    curve.name = 'catheter_curve_' + str(i)
-    curve.data.resolution_u = 50
-
-    bez_points = curve.data.splines[0].bezier_points
-
-    p_start = bezier_specs[i, 0, :]
-    p_end = bezier_specs[i, 1, :]
-    c1 = bezier_specs[i, 2, :]
-    c2 = bezier_specs[i, 3, :]
-
-    # Left point.
-    bez_points[0].co = p_start
-    bez_points[0].handle_left_type = 'FREE'
-    bez_points[0].handle_right_type = 'FREE'
-    bez_points[0].handle_left = Vector((1.0, 0.0, 0.0))  # not needed
-    bez_points[0].handle_right = c1
-
-    # Top-middle point.
-    bez_points[1].co = p_end
-    bez_points[1].handle_left_type = 'FREE'
-    bez_points[1].handle_right_type = 'FREE'
-    bez_points[1].handle_left = c2
-    bez_points[1].handle_right = Vector((1.0, 0.0, 0.0))  # not needed
-
-    curve.data.bevel_depth = 0.0015
-    curve.data.bevel_resolution = 10
-    curve.data.materials.append(mat_blue)
-
-
-## Target Visualization
-if len(args.target_specs_path):
-    target_specs = np.load(args.target_specs_path)
-    n_targets = target_specs.shape[0]
-
-    for i in range(n_targets):
-        ops.mesh.primitive_uv_sphere_add(radius=0.002, location=target_specs[i, :])   
-        ops.object.shade_smooth()
-
-        if i == 0:
-            data.objects['Sphere'].data.materials.append(mat_red)
-        else:
-            data.objects['Sphere.' + str(i).zfill(3)].data.materials.append(mat_red)
-
-
-## Return to object mode..
-ops.object.mode_set(mode='OBJECT')
-
-## Camera Settings
-ops.object.camera_add(enter_editmode=False, align='VIEW')
-cam_1 = context.scene.objects['Camera']
-cam_1.data.lens = 10
-cam_1.data.sensor_width = 7.2481
-cam_1.data.clip_start = 0.01
-cam_1.data.shift_x = 0
-cam_1.data.shift_y = 0
-cam_1.location = (0, 0, 0)
-cam_1.rotation_euler = Euler((0.0 * pi / 180, 180.0 * pi / 180, 180 * pi / 180))
-
-ops.object.camera_add(enter_editmode=False, align='VIEW')
-cam_2 = context.scene.objects['Camera.001']
-cam_2.data.lens = 10
-cam_2.data.sensor_width = 7.2481
-cam_2.data.clip_start = 0.01
-cam_2.data.shift_x = 0
-cam_2.data.shift_y = 0
-cam_2.location = (1, 0, 0)
-cam_2.rotation_euler = Euler((0.0 * pi / 180, 90.0 * pi / 180, 0 * pi / 180))
-
-ops.object.camera_add(enter_editmode=False, align='VIEW')
-cam_3 = context.scene.objects['Camera.002']
-cam_3.data.lens = 10
-cam_3.data.sensor_width = 7.2481
-cam_3.data.clip_start = 0.1
-cam_3.data.shift_x = 0
-cam_3.data.shift_y = 0
-cam_3.location = (0, -0.2, -0.2)
-cam_3.rotation_euler = Euler((0.0 * pi / 180, 150.0 * pi / 180, 270 * pi / 180))
-
-## Light Settings
-bpy.ops.object.light_add(type='POINT', align='WORLD', location=(0, 0, 0))
-light = context.scene.objects['Point']
-light.location = (0, 0, 0)
-light.rotation_euler = Euler((90.0 * pi / 180, 0.0 * pi / 180, 90 * pi / 180))
-light.data.energy = 40
-
-context.scene.render.image_settings.file_format = 'PNG'
-context.scene.render.resolution_x = 640
-context.scene.render.resolution_y = 480
-
-if int(args.transparent_mode) == 1:
-    context.scene.render.film_transparent = True
-
-## Render
-if int(args.viewpoint_mode) == 1:
-    context.scene.camera = cam_1
-    context.scene.render.filepath = args.save_path
-    ops.render.render(use_viewport = True, write_still = True)
 
-elif int(args.viewpoint_mode) == 2:
-    context.scene.camera = cam_2
-    context.scene.render.filepath = args.save_path
-    ops.render.render(use_viewport = True, write_still = True)
-
-elif int(args.viewpoint_mode) == 3:
-    context.scene.camera = cam_3
-    context.scene.render.filepath = args.save_path
-    ops.render.render(use_viewport = True, write_still = True)
+if '--server_port_file' in script_args:
+    serve(script_args[script_args.index('--server_port_file') + 1])
 
 else:
-    print('[ERROR] viewpoint_mode invalid.')
-    exit()
+    parser.add_argument('specs_path', help='Path to an npy file. Specs of the Bezier curves to be rendered.')
+    parser.add_argument('save_path', help='Path to save the rendered images. Assume PNG.')
+    parser.add_argument('viewpoint_mode', help='Setting of viewpoint option. 1 for catheter POV and 2 for side view.', default=1)
+    parser.add_argument('target_specs_path', help='Path to an npy file. Specs of the target points to be rendered.', default=None)
+    parser.add_argument('transparent_mode', help='Whether or not to make rendering background transparent', default=0)
+    args, _ = parser.parse_known_args(script_args)
+
+    bezier_specs = np.load(args.specs_path)
+
+    if len(args.target_specs_path):
+        target_specs = np.load(args.target_specs_path)
+    else:
+        target_specs = None
+
+    scene_objects = setup_scene()
+
+    try:
+        render(bezier_specs, args.save_path, args.viewpoint_mode, target_specs, args.transparent_mode, scene_objects)
+    except ValueError:
+        print('[ERROR] viewpoint_mode invalid.')
+        exit()
@@ -0,0 +1,546 @@
+import os
+import numpy as np
+
+import camera_settings
+import transforms
+import bezier_interspace_transforms
+from bezier_set import wait_for_image_writes
+from cc_catheter import CCCatheter, VIEW_BREACH_LADDER_SIZE
+from result_cache import save_npy_atomic
+
+
+
+class BatchedSimulationExperiment:
+
+    def __init__(self, dof, loss_2d, tip_loss, interspace, viewpoint_mode, damping_weights, noise_percentage, n_iter, render_mode, render_backend='blender', save_images=True, seed=None, verbose=0):
+        """
+        Lockstep version of SimulationExperiment without reconstruction: all data points advance through
+            the inverse Jacobian control together, with stacked Jacobians and one batched pseudo-inverse per iteration
+
+        Args:
+            dof (2 or 3): DoF of control
+            loss_2d (bool): whether to use 2D loss
+            tip_loss (bool): whether to use tip loss
+            interspace (0, 1, or 2): interspace of control, same as in SimulationExperiment.execute: 0 for unispace,
+                1 for Bezier interspace with (ux, uy) parameterization, 2 for Bezier interspace with (theta, phi) parameterization
+            viewpoint_mode (1 or 2): camera view of rendered image, 1 for endoscopic view, 2 for side view
+            damping_weights (list of 3 floats): n-th term corresponds to the damping weight of the n-th DoF control feedback
+            noise_percentage: gaussian noise will be applied to the feedback.
+                The variance of that noise would be noise_percentage * feedback
+            n_iter (int): number of total iteration of optimization
+            render_mode (0 or 1): 0 for rendering no image, 1 for only rendering the image after the last iteration
+            render_backend ('blender' or 'software'): renderer to use, see SimulationExperiment
+            save_images (bool): whether to write rendered images, see SimulationExperiment
+            seed (int or None): seed of the feedback noise
+            verbose (0 or 1): amount of verbosity
+
+        Note:
+            The noise is drawn from one numpy generator for the whole batch instead of the global random module,
+                so noisy runs follow the same distribution as SimulationExperiment but not the same samples
+        """
+        if dof not in (2, 3):
+            print('[ERROR] [BatchedSimulationExperiment] DOF invalid: ', str(dof))
+            exit()
+
+        if render_mode not in (0, 1):
+            print('[ERROR] [BatchedSimulationExperiment] Render mode invalid: ', str(render_mode))
+            exit()
+
+        self.dof = dof
+        self.loss_2d = loss_2d
+        self.tip_loss = tip_loss
+        self.interspace = interspace
+        self.viewpoint_mode = viewpoint_mode
+        self.damping_weights = damping_weights
+        self.noise_percentage = noise_percentage
+        self.n_iter = n_iter
+        self.render_mode = render_mode
+        self.render_backend = render_backend
+        self.save_images = save_images
+        self.verbose = verbose
+
+        self.rng = np.random.default_rng(seed)
+        self.use_2d_pos_target = False
+
+        self.set_camera_params(camera_settings.a, camera_settings.b, camera_settings.center_x, camera_settings.center_y, camera_settings.image_size_x, camera_settings.image_size_y, camera_settings.extrinsics)
+
+
+    def set_camera_params(self, fx, fy, cx, cy, size_x, size_y, camera_extrinsics):
+        """
+        Set intrinsic and extrinsic camera parameters, see CCCatheter.set_camera_params
+        """
+        self.fx = fx
+        self.fy = fy
+        self.cx = cx
+        self.cy = cy
+        self.size_x = size_x
+        self.size_y = size_y
+        self.camera_extrinsics = np.asarray(camera_extrinsics, dtype=np.float64)
+
+
+    def set_general_parameters(self, p_0, r, n_mid_points, l):
+        """
+        Args:
+            p_0 ((3,) numpy array): start point of catheter
+            r (float): cross section radius of catheter
+            n_mid_points (int): number of middle control points
+            l ((n_data,) numpy array or float): length of catheter
+        """
+        self.p_0 = p_0
+        self.r = r
+        self.l = l
+
+        if n_mid_points == 0:
+            self.n_mid_points = 0
+        elif n_mid_points % 2 == 0:
+            self.n_mid_points = n_mid_points + 1
+        else:
+            self.n_mid_points = n_mid_points
+
+        if self.n_mid_points == 0:
+            self.s_list = np.array([1.0])
+        else:
+            self.s_list = np.linspace(0, 1, self.n_mid_points + 2)[1:]
+
+
+    def set_2dof_parameters(self, ux, uy, ux_target, uy_target):
+        """
+        Set parameters for 2DoF, one entry per data point
+
+        Args:
+            ux ((n_data,) numpy array or float): 1st pair of tendon length (responsible for catheter bending)
+            uy ((n_data,) numpy array or float): 2nd pair of tendon length (responsible for catheter bending)
+            ux_target ((n_data,) numpy array): target of 1st pair of tendon length
+            uy_target ((n_data,) numpy array): target of 2nd pair of tendon length
+        """
+        self.ux = ux
+        self.uy = uy
+        self.ux_target = ux_target
+        self.uy_target = uy_target
+
+
+    def set_3dof_parameters(self, ux, uy, ux_target, uy_target, l_target):
+        """
+        Set parameters for 3DoF, one entry per data point
+
+        Args:
+            ux ((n_data,) numpy array or float): 1st pair of tendon length (responsible for catheter bending)
+            uy ((n_data,) numpy array or float): 2nd pair of tendon length (responsible for catheter bending)
+            ux_target ((n_data,) numpy array): target of 1st pair of tendon length
+            uy_target ((n_data,) numpy array): target of 2nd pair of tendon length
+            l_target ((n_data,) numpy array): target length of bending portion of the catheter (responsible for insertion)
+        """
+        self.ux = ux
+        self.uy = uy
+        self.ux_target = ux_target
+        self.uy_target = uy_target
+        self.l_target = l_target
+
+
+    def set_2d_pos_parameters(self, ux, uy, x_target, y_target, l=0):
+        """
+        Set parameters for 2D loss, one entry per data point
+
+        Args:
+            ux ((n_data,) numpy array or float): 1st pair of tendon length (responsible for catheter bending)
+            uy ((n_data,) numpy array or float): 2nd pair of tendon length (responsible for catheter bending)
+            x_target ((n_data,) numpy array): horizontal target pixel location of end effector
+            y_target ((n_data,) numpy array): vertical target pixel location of end effector
+            l ((n_data,) numpy array or float): length of bending portion of the catheter (responsible for insertion)
+        """
+        if not (self.loss_2d and self.tip_loss):
+            print('[ERROR] Setting 2D position target is not compatible with non 2D tip loss')
+            exit()
+
+        self.ux = ux
+        self.uy = uy
+        self.x_target = x_target
+        self.y_target = y_target
+
+        if self.dof == 3:
+            self.l = l
+
+        self.use_2d_pos_target = True
+
+
+    def calculate_cc_points(self, ux, uy, l):
+        """
+        Args:
+            ux, uy, l ((n,) numpy arrays): parameters of n configurations
+
+        Returns:
+            ((n, n_s, 3) numpy array): points on the constant curvature curves at self.s_list
+        """
+        return transforms.cc_transform_3dof_batch(self.p_0, ux, uy, l, self.r, self.s_list)
+
+
+    def calculate_ux_uy(self, q):
+        """
+        Args:
+            q ((..., 3) numpy array): controlled parameters, (theta, phi, l) with interspace 2 and (ux, uy, l) otherwise
+
+        Returns:
+            ux, uy ((...) numpy arrays): tendon lengths of the parameters
+        """
+        if self.interspace == 2:
+            return bezier_interspace_transforms.calculate_ux(q[..., 0], q[..., 1], self.r), bezier_interspace_transforms.calculate_uy(q[..., 0], q[..., 1], self.r)
+
+        return q[..., 0], q[..., 1]
+
+
+    def convert_cc_points_to_2d(self, pts):
+        """
+        Args:
+            pts ((n, n_s, 3) numpy array): points on the constant curvature curves
+
+        Returns:
+            ((n, n_s, 2) numpy array): image positions, mirrored horizontally as in CCCatheter.convert_cc_points_to_2d
+        """
+        p_2d = transforms.world_to_image_transform_batch(pts, self.camera_extrinsics, self.fx, self.fy, self.cx, self.cy)
+        p_2d[..., 0] = self.size_x - p_2d[..., 0]
+
+        return p_2d
+
+
+    def check_in_view(self, p_2d):
+        """
+        Args:
+            p_2d ((n, n_s, 2) numpy array): image positions
+
+        Returns:
+            ((n,) bool numpy array): whether all points of each configuration fall inside the image
+        """
+        inside = (p_2d[..., 0] < self.size_x) & (p_2d[..., 0] >= 0) & (p_2d[..., 1] < self.size_y) & (p_2d[..., 1] >= 0)
+
+        return np.all(inside, axis=-1)
+
+
+    def calculate_jacobians(self, ux, uy, l, theta, phi, pts):
+        """
+        Stacked Jacobians of the feedback with respect to the controlled parameters
+
+        Args:
+            ux, uy, l ((n,) numpy arrays): current parameters
+            theta, phi ((n,) numpy arrays): current (theta, phi) parameters, only used with interspace 2
+            pts ((n, n_s, 3) numpy array): current points on the constant curvature curves
+
+        Returns:
+            ((n, m, dof) numpy array): Jacobians, rows ordered like the differences from calculate_p_diffs
+        """
+        if self.interspace == 0:
+            G = transforms.d_cc_transform_3dof_batch(self.p_0, ux, uy, l, self.r, self.s_list)
+        elif self.interspace == 1:
+            G = bezier_interspace_transforms.calculate_jacobian_ux_uy_l_batch(self.p_0, ux, uy, l, self.r).reshape(-1, 2, 3, 3)
+        elif self.interspace == 2:
+            G = bezier_interspace_transforms.calculate_jacobian_3dof_theta_phi_batch(self.p_0, theta, phi, l, self.r).reshape(-1, 2, 3, 3)
+        else:
+            print('[ERROR] [BatchedSimulationExperiment] Interspace invalid: ', str(self.interspace))
+            exit()
+
+        G = G[..., :self.dof]
+
+        if self.tip_loss:
+            G = G[:, -1:]
+            pts = pts[:, -1:]
+
+        if self.loss_2d:
+            G = transforms.world_to_image_interaction_matrix_batch(pts, self.camera_extrinsics, self.fx, self.fy) @ G
+
+        return G.reshape(G.shape[0], -1, self.dof)
+
+
+    def calculate_p_diffs(self, pts, p_2d):
+        """
+        Args:
+            pts ((n, n_s, 3) numpy array): current points on the constant curvature curves
+            p_2d ((n, n_s, 2) numpy array): current image positions of the points
+
+        Returns:
+            ((n, m, 1) numpy array): differences between the target and the current positions
+        """
+        if self.loss_2d:
+            current = p_2d
+            target = self.target_pts_2d
+        else:
+            current = pts
+            target = self.target_pts
+
+        if self.tip_loss:
+            current = current[:, -1:]
+            target = target[:, -1:]
+
+        return (target - current).reshape(current.shape[0], -1, 1)
+
+
+    def set_targets(self):
+        """
+        Calculate the target points and record them in the last row of the reports
+        """
+        if self.use_2d_pos_target:
+            ## The 2D target only applies to the end point, which is all tip loss uses
+            self.target_pts_2d = np.zeros((self.n_data, len(self.s_list), 2))
+            self.target_pts_2d[:, -1, 0] = np.round(self.x_target)
+            self.target_pts_2d[:, -1, 1] = np.round(self.y_target)
+
+            ## CCCatheter.set_2d_targets is given [0, x_target] and [0, y_target]
+            self.p2d_poses[:, -1, :2, :] = 0
+            self.p2d_poses[:, -1, 1, :] = self.target_pts_2d[:, -1]
+            self.target_in_view = np.ones(self.n_data, dtype=bool)
+
+            return
+
+        ux_target = np.broadcast_to(np.asarray(self.ux_target, dtype=np.float64), (self.n_data,))
+        uy_target = np.broadcast_to(np.asarray(self.uy_target, dtype=np.float64), (self.n_data,))
+
+        self.params[:, -1, 0] = ux_target
+        self.params[:, -1, 1] = uy_target
+
+        if self.dof == 3:
+            l_target = np.broadcast_to(np.asarray(self.l_target, dtype=np.float64), (self.n_data,))
+            self.params[:, -1, 2] = l_target
+        else:
+            l_target = self.l_init
+
+        self.target_pts = self.calculate_cc_points(ux_target, uy_target, l_target)
+        self.target_pts_2d = np.round(self.convert_cc_points_to_2d(self.target_pts))
+
+        self.p3d_poses[:, -1] = self.target_pts
+        self.p2d_poses[:, -1] = self.target_pts_2d
+
+        ## CCCatheter.convert_cc_points_to_2d exits on a target outside of the image
+        self.target_in_view = self.check_in_view(self.target_pts_2d)
+
+        if not np.all(self.target_in_view):
+            print('[ERROR] [BatchedSimulationExperiment] Target falls outside of image for data ', np.nonzero(~self.target_in_view)[0])
+
+
+    def execute(self):
+        """
+        Run main pipeline of inverse Jacobian control for all data points at once
+
+        Returns:
+            params ((n_data, n_iter + 2, 5) numpy array): params of each data point, see SimulationExperiment.execute
+
+        Note:
+            Data points whose targets fall outside of the image, which SimulationExperiment rejects, are marked False
+                in self.target_in_view; their reports are meaningless
+        """
+        if self.use_2d_pos_target:
+            self.n_data = np.atleast_1d(self.x_target).shape[0]
+        else:
+            self.n_data = np.atleast_1d(self.ux_target).shape[0]
+
+        ux, uy, l = [np.array(np.broadcast_to(np.asarray(x, dtype=np.float64), (self.n_data,))) for x in (self.ux, self.uy, self.l)]
+        self.l_init = l.copy()
+
+        n_s = len(self.s_list)
+        self.params = np.zeros((self.n_data, self.n_iter + 2, 5))
+        self.p3d_poses = np.zeros((self.n_data, self.n_iter + 2, n_s, 3))
+        self.p2d_poses = np.zeros((self.n_data, self.n_iter + 2, n_s, 2))
+
+        self.params[:, 0, 0] = ux
+        self.params[:, 0, 1] = uy
+
+        if self.dof == 3:
+            self.params[:, 0, 2] = l
+
+        self.set_targets()
+
+        weight_matrix = np.diag(self.damping_weights[:self.dof]).astype(np.float64)
+
+        pts = self.calculate_cc_points(ux, uy, l)
+        p_2d = self.convert_cc_points_to_2d(pts)
+        self.p3d_poses[:, 0] = pts
+        self.p2d_poses[:, 0] = p_2d
+
+        for i in range(self.n_iter):
+            theta = np.sqrt(ux**2 + uy**2) / self.r
+            phi = np.arctan2(uy, ux)
+
+            if self.interspace == 2 and i == 0:
+                self.params[:, 0, 3] = theta
+                self.params[:, 0, 4] = phi
+
+                if not self.use_2d_pos_target:
+                    self.params[:, -1, 3] = np.sqrt(self.params[:, -1, 0]**2 + self.params[:, -1, 1]**2) / self.r
+                    self.params[:, -1, 4] = np.arctan2(self.params[:, -1, 1], self.params[:, -1, 0])
+
+            p_diffs = self.calculate_p_diffs(pts, p_2d)
+            J = self.calculate_jacobians(ux, uy, l, theta, phi, pts)
+            J_T = np.transpose(J, (0, 2, 1))
+
+            d = (np.linalg.pinv(J_T @ J + weight_matrix) @ J_T @ p_diffs)[..., 0]
+
+            ## Add noise to parameter updates
+            if self.noise_percentage > 0:
+                d = d + self.rng.standard_normal(d.shape) * self.noise_percentage * d
+
+            if self.interspace == 2:
+                q_old = np.stack((theta, phi, l), axis=-1)
+            else:
+                q_old = np.stack((ux, uy, l), axis=-1)
+
+            step = np.zeros((self.n_data, 3))
+            step[:, :self.dof] = d
+
+            ## View breach prevention: the data points out of view after the full step evaluate a ladder of
+            ##     halved steps in one batch and take the largest one in view, see CCCatheter.take_in_view_step
+            active = np.arange(self.n_data)
+            scales = np.ones(1)
+            q = q_old.copy()
+
+            while len(active) > 0:
+                q_candidates = q_old[active, None, :] + scales[:, None] * step[active, None, :]
+                ux_candidates, uy_candidates = self.calculate_ux_uy(q_candidates)
+
+                pts_candidates = self.calculate_cc_points(ux_candidates.ravel(), uy_candidates.ravel(), q_candidates[..., 2].ravel())
+                p_2d_candidates = self.convert_cc_points_to_2d(pts_candidates)
+
+                in_view = self.check_in_view(p_2d_candidates).reshape(len(active), len(scales))
+                done = np.any(in_view, axis=1)
+
+                ## Halving has reached a zero step, which keeps the parameters
+                if scales[-1] == 0:
+                    done[:] = True
+
+                k = np.where(np.any(in_view, axis=1), np.argmax(in_view, axis=1), len(scales) - 1)
+                flat_k = np.arange(len(active)) * len(scales) + k
+                selected = active[done]
+
+                q[selected] = q_candidates[done, k[done]]
+                ux[selected] = ux_candidates[done, k[done]]
+                uy[selected] = uy_candidates[done, k[done]]
+                l[selected] = q_candidates[done, k[done], 2]
+                pts[selected] = pts_candidates[flat_k[done]]
+                p_2d[selected] = p_2d_candidates[flat_k[done]]
+
+                active = active[~done]
+
+                if len(active) > 0 and self.verbose > 0:
+                    print('[WARNING] View breach caught for ' + str(len(active)) + ' data points')
+
+                start = -int(np.log2(scales[-1])) + 1 if scales[-1] > 0 else 0
+                scales = 2.0 ** -np.arange(start, start + VIEW_BREACH_LADDER_SIZE)
+
+            self.params[:, i + 1, 0] = ux
+            self.params[:, i + 1, 1] = uy
+
+            if self.dof == 3:
+                self.params[:, i + 1, 2] = l
+
+            if self.interspace == 2:
+                self.params[:, i + 1, 3] = q[:, 0]
+                self.params[:, i + 1, 4] = q[:, 1]
+
+            self.p3d_poses[:, i + 1] = pts
+            self.p2d_poses[:, i + 1] = p_2d
+
+            if self.verbose > 0:
+                print('Iteration ' + str(i) + ': mean |p_diffs| = ', np.mean(np.linalg.norm(p_diffs[..., 0], axis=-1)))
+
+        return self.params
+
+
+    def write_reports(self, params_report_paths, p3d_report_paths, p2d_report_paths):
+        """
+        Save the reports of each data point, see CCCatheter.write_reports
+
+        Args:
+            params_report_paths (list of path strings to npy files): one path per data point
+            p3d_report_paths (list of path strings to npy files): one path per data point
+            p2d_report_paths (list of path strings to npy files): one path per data point
+        """
+        for k in range(self.n_data):
+            self.write_report(k, params_report_paths[k], p3d_report_paths[k], p2d_report_paths[k])
+
+
+    def write_report(self, k, params_report_path, p3d_report_path, p2d_report_path):
+        """
+        Save the reports of one data point, see CCCatheter.write_reports
+
+        Args:
+            k (int): index of the data point
+            params_report_path (path string to npy file): path to save parameters
+            p3d_report_path (path string to npy file): path to save 3D positions
+            p2d_report_path (path string to npy file): path to save 2D positions
+        """
+        save_npy_atomic(params_report_path, self.params[k])
+        save_npy_atomic(p3d_report_path, self.p3d_poses[k])
+        save_npy_atomic(p2d_report_path, self.p2d_poses[k])
+
+
+    def render_final_images(self, images_save_dirs, cc_specs_save_dirs):
+        """
+        Render the catheter after the last iteration of each data point, as SimulationExperiment does with render_mode 1
+
+        Args:
+            images_save_dirs (list of path strings to directories): one directory per data point
+            cc_specs_save_dirs (list of path strings to directories): one directory per data point
+        """
+        for k in range(self.n_data):
+            render_final_image(self.get_final_render_job(k, images_save_dirs[k], cc_specs_save_dirs[k]))
+
+        wait_for_image_writes()
+
+
+    def get_final_render_job(self, k, images_save_dir, cc_specs_save_dir):
+        """
+        Everything render_final_image needs to render one data point, so that the rendering can run in another process
+
+        Args:
+            k (int): index of the data point
+            images_save_dir (path string to directory): directory to save the image
+            cc_specs_save_dir (path string to directory): directory to save the Bezier specs
+
+        Returns:
+            (dict or None): picklable input of render_final_image, None with render_mode 0
+        """
+        if self.render_mode == 0:
+            return None
+
+        if self.use_2d_pos_target:
+            target_pts = None
+        else:
+            target_pts = np.array(self.target_pts[k])
+
+        image_save_path = os.path.join(images_save_dir, str(self.n_iter).zfill(3) + '.png')
+
+        if not self.save_images and self.render_backend == 'software':
+            image_save_path = None
+
+        return {
+            'p_0': self.p_0, 'r': self.r, 'loss_2d': self.loss_2d, 'tip_loss': self.tip_loss, 'n_mid_points': self.n_mid_points,
+            'n_iter': self.n_iter, 'camera_params': (self.fx, self.fy, self.cx, self.cy, self.size_x, self.size_y, self.camera_extrinsics),
+            'ux': self.params[k, -2, 0], 'uy': self.params[k, -2, 1], 'l': self.params[k, -2, 2] if self.dof == 3 else self.l_init[k],
+            'target_pts': target_pts, 'cc_specs_path': os.path.join(cc_specs_save_dir, str(self.n_iter).zfill(3) + '.npy'),
+            'target_specs_path': None if target_pts is None else os.path.join(cc_specs_save_dir, 'target.npy'),
+            'image_save_path': image_save_path, 'viewpoint_mode': self.viewpoint_mode, 'render_backend': self.render_backend,
+        }
+
+
+def render_final_image(render_job):
+    """
+    Render the catheter of one data point after the last iteration
+
+    Args:
+        render_job (dict or None): output of BatchedSimulationExperiment.get_final_render_job, None to render nothing
+
+    Note:
+        The image may still be queued for writing on return, see wait_for_image_writes
+    """
+    if render_job is None:
+        return
+
+    catheter = CCCatheter(render_job['p_0'], render_job['l'], render_job['r'], render_job['loss_2d'], render_job['tip_loss'],
+                          render_job['n_mid_points'], render_job['n_iter'], verbose=0)
+    catheter.set_camera_params(*render_job['camera_params'])
+    catheter.set_3dof_params(render_job['ux'], render_job['uy'], catheter.l)
+    catheter.calculate_cc_points(-1)
+    catheter.calculate_beziers_control_points()
+
+    if render_job['target_pts'] is not None:
+        catheter.target_cc_pt_list = list(render_job['target_pts'])
+        catheter.write_target_specs(render_job['target_specs_path'], show_mid_points=True)
+
+    catheter.render_beziers(render_job['cc_specs_path'], render_job['image_save_path'], render_job['target_specs_path'],
+                            render_job['viewpoint_mode'], transparent_mode=1, render_backend=render_job['render_backend'])
@@ -58,6 +58,72 @@ def d_bezier_d_p_end(s_bezier):
     return s_bezier * (3 * s_bezier - 2)
 
 
+## s values of the CC points (start, middle, end) that define the interspace Bezier curve
+BEZIER_CC_S_LIST = np.array([0.0, 0.5, 1.0])
+
+## s values on the Bezier curve of the interspace control points (middle, end)
+BEZIER_S_LIST = np.array([0.5, 1.0])
+
+## Derivatives of the Bezier control points with respect to the CC points;
+##     row i corresponds to BEZIER_S_LIST[i] and column j corresponds to BEZIER_CC_S_LIST[j]
+BEZIER_COEFFS = np.array([[d_bezier_d_p_start(s), d_bezier_d_p_mid(s), d_bezier_d_p_end(s)] for s in BEZIER_S_LIST])
+
+
+def calculate_jacobian_ux_uy_l_batch(p_start, ux, uy, l, r):
+    """
+    Calculate Jacobian of interspace control with (ux, uy, l) parameterization for a batch of configurations
+
+    Args:
+        p_start ((3,) numpy array): start point of catheter
+        ux ((n_configs,) numpy array or float): 1st pair of tendon length of each configuration
+        uy ((n_configs,) numpy array or float): 2nd pair of tendon length of each configuration
+        l ((n_configs,) numpy array or float): length of catheter of each configuration
+        r (float): cross section radius of catheter
+
+    Returns:
+        ((n_configs, 6, 3) numpy array): Jacobian of the Bezier middle and end points with respect to
+            ux, uy, and l respectively
+    """
+    G_cc = transforms.d_cc_transform_3dof_batch(p_start, ux, uy, l, r, BEZIER_CC_S_LIST)
+    J = np.einsum('bj,njkp->nbkp', BEZIER_COEFFS, G_cc)
+
+    return J.reshape(J.shape[0], 6, 3)
+
+
+def calculate_jacobian_2dof_ux_uy_batch(p_start, ux, uy, l, r):
+    """
+    Calculate Jacobian of 2DoF interspace control with (ux, uy) parameterization for a batch of configurations
+
+    Args:
+        p_start ((3,) numpy array): start point of catheter
+        ux ((n_configs,) numpy array or float): 1st pair of tendon length of each configuration
+        uy ((n_configs,) numpy array or float): 2nd pair of tendon length of each configuration
+        l ((n_configs,) numpy array or float): length of catheter of each configuration
+        r (float): cross section radius of catheter
+
+    Returns:
+        ((n_configs, 6, 2) numpy array): Jacobian of 2DoF interspace control with (ux, uy) parameterization
+    """
+    return calculate_jacobian_ux_uy_l_batch(p_start, ux, uy, l, r)[:, :, :2]
+
+
+def calculate_jacobian_3dof_ux_uy_batch(p_start, ux, uy, l, r):
+    """
+    Calculate Jacobian of 3DoF interspace control with (ux, uy) parameterization for a batch of configurations
+
+    Args:
+        p_start ((3,) numpy array): start point of catheter
+        ux ((n_configs,) numpy array or float): 1st pair of tendon length of each configuration
+        uy ((n_configs,) numpy array or float): 2nd pair of tendon length of each configuration
+        l ((n_configs,) numpy array or float): length of catheter of each configuration
+        r (float): cross section radius of catheter
+
+    Returns:
+        ((n_configs, 6, 3) numpy array): Jacobian of 3DoF interspace control with (ux, uy) parameterization
+    """
+    return calculate_jacobian_ux_uy_l_batch(p_start, ux, uy, l, r)
+
+
 def calculate_jacobian_2dof_ux_uy(p_start, ux, uy, l, r):
     """
     Calculate Jacobian of 2DoF interspace control with (ux, uy) parameterization
@@ -72,33 +138,7 @@ def calculate_jacobian_2dof_ux_uy(p_start, ux, uy, l, r):
     Returns:
         ((6, 2) numpy array): Jacobian of 2DoF interspace control with (ux, uy) parameterization
     """
-    bezier_mid_over_cc_start = d_bezier_d_p_start(0.5)
-    bezier_end_over_cc_start = d_bezier_d_p_start(1.0)
-    bezier_mid_over_cc_mid = d_bezier_d_p_mid(0.5)
-    bezier_end_over_cc_mid = d_bezier_d_p_mid(1.0)
-    bezier_mid_over_cc_end = d_bezier_d_p_end(0.5)
-    bezier_end_over_cc_end = d_bezier_d_p_end(1.0)
-
-    cc_start_over_ux = transforms.d_ux_cc_transform_3dof(p_start, ux, uy, l, r, s=0.0)
-    cc_start_over_uy = transforms.d_uy_cc_transform_3dof(p_start, ux, uy, l, r, s=0.0)
-    cc_mid_over_ux = transforms.d_ux_cc_transform_3dof(p_start, ux, uy, l, r, s=0.5)
-    cc_mid_over_uy = transforms.d_uy_cc_transform_3dof(p_start, ux, uy, l, r, s=0.5)
-    cc_end_over_ux = transforms.d_ux_cc_transform_3dof(p_start, ux, uy, l, r, s=1.0)
-    cc_end_over_uy = transforms.d_uy_cc_transform_3dof(p_start, ux, uy, l, r, s=1.0)
-
-
-    G_p_mid_ux = bezier_mid_over_cc_start * cc_start_over_ux + bezier_mid_over_cc_mid * cc_mid_over_ux + bezier_mid_over_cc_end * cc_end_over_ux
-    G_p_mid_uy = bezier_mid_over_cc_start * cc_start_over_uy + bezier_mid_over_cc_mid * cc_mid_over_uy + bezier_mid_over_cc_end * cc_end_over_uy
-    G_p_end_ux = bezier_end_over_cc_start * cc_start_over_ux + bezier_end_over_cc_mid * cc_mid_over_ux + bezier_end_over_cc_end * cc_end_over_ux
-    G_p_end_uy = bezier_end_over_cc_start * cc_start_over_uy + bezier_end_over_cc_mid * cc_mid_over_uy + bezier_end_over_cc_end * cc_end_over_uy
-
-    J = np.zeros((6, 2))
-    J[0:3, 0] = G_p_mid_ux
-    J[0:3, 1] = G_p_mid_uy
-    J[3:6, 0] = G_p_end_ux
-    J[3:6, 1] = G_p_end_uy
-
-    return J
+    return calculate_jacobian_2dof_ux_uy_batch(p_start, ux, uy, l, r)[0]
 
 
 def calculate_jacobian_3dof_ux_uy(p_start, ux, uy, l, r):
@@ -115,39 +155,7 @@ def calculate_jacobian_3dof_ux_uy(p_start, ux, uy, l, r):
     Returns:
         ((6, 3) numpy array): Jacobian of 3DoF interspace control with (ux, uy) parameterization
     """
-    bezier_mid_over_cc_start = d_bezier_d_p_start(0.5)
-    bezier_end_over_cc_start = d_bezier_d_p_start(1.0)
-    bezier_mid_over_cc_mid = d_bezier_d_p_mid(0.5)
-    bezier_end_over_cc_mid = d_bezier_d_p_mid(1.0)
-    bezier_mid_over_cc_end = d_bezier_d_p_end(0.5)
-    bezier_end_over_cc_end = d_bezier_d_p_end(1.0)
-
-    cc_start_over_ux = transforms.d_ux_cc_transform_3dof(p_start, ux, uy, l, r, s=0.0)
-    cc_start_over_uy = transforms.d_uy_cc_transform_3dof(p_start, ux, uy, l, r, s=0.0)
-    cc_start_over_l = transforms.d_l_cc_transform_3dof(p_start, ux, uy, l, r, s=0.0)
-    cc_mid_over_ux = transforms.d_ux_cc_transform_3dof(p_start, ux, uy, l, r, s=0.5)
-    cc_mid_over_uy = transforms.d_uy_cc_transform_3dof(p_start, ux, uy, l, r, s=0.5)
-    cc_mid_over_l = transforms.d_l_cc_transform_3dof(p_start, ux, uy, l, r, s=0.5)
-    cc_end_over_ux = transforms.d_ux_cc_transform_3dof(p_start, ux, uy, l, r, s=1.0)
-    cc_end_over_uy = transforms.d_uy_cc_transform_3dof(p_start, ux, uy, l, r, s=1.0)
-    cc_end_over_l = transforms.d_l_cc_transform_3dof(p_start, ux, uy, l, r, s=1.0)
-
-    G_p_mid_ux = bezier_mid_over_cc_start * cc_start_over_ux + bezier_mid_over_cc_mid * cc_mid_over_ux + bezier_mid_over_cc_end * cc_end_over_ux
-    G_p_mid_uy = bezier_mid_over_cc_start * cc_start_over_uy + bezier_mid_over_cc_mid * cc_mid_over_uy + bezier_mid_over_cc_end * cc_end_over_uy
-    G_p_mid_l = bezier_mid_over_cc_start * cc_start_over_l + bezier_mid_over_cc_mid * cc_mid_over_l + bezier_mid_over_cc_end * cc_end_over_l
-    G_p_end_ux = bezier_end_over_cc_start * cc_start_over_ux + bezier_end_over_cc_mid * cc_mid_over_ux + bezier_end_over_cc_end * cc_end_over_ux
-    G_p_end_uy = bezier_end_over_cc_start * cc_start_over_uy + bezier_end_over_cc_mid * cc_mid_over_uy + bezier_end_over_cc_end * cc_end_over_uy
-    G_p_end_l = bezier_end_over_cc_start * cc_start_over_l + bezier_end_over_cc_mid * cc_mid_over_l + bezier_end_over_cc_end * cc_end_over_l
-
-    J = np.zeros((6, 3))
-    J[0:3, 0] = G_p_mid_ux
-    J[0:3, 1] = G_p_mid_uy
-    J[0:3, 2] = G_p_mid_l
-    J[3:6, 0] = G_p_end_ux
-    J[3:6, 1] = G_p_end_uy
-    J[3:6, 2] = G_p_end_l
-
-    return J
+    return calculate_jacobian_3dof_ux_uy_batch(p_start, ux, uy, l, r)[0]
 
 
 def calculate_ux(theta, phi, r):
@@ -214,6 +222,59 @@ def d_uy_d_phi(theta, phi, r):
     return theta * r * np.cos(phi)
 
 
+def calculate_jacobian_3dof_theta_phi_batch(p_start, theta, phi, l, r):
+    """
+    Calculate Jacobian of 3DoF interspace control with (theta, phi) parameterization for a batch of configurations
+
+    Args:
+        p_start ((3,) numpy array): start point of catheter
+        theta ((n_configs,) numpy array or float): (in radians) theta parameter of each configuration
+        phi ((n_configs,) numpy array or float): (in radians) phi parameter of each configuration
+        l ((n_configs,) numpy array or float): length of catheter of each configuration
+        r (float): cross section radius of catheter
+
+    Note:
+        theta and phi together specify the 2 dimensional catheter bending
+
+    Returns:
+        ((n_configs, 6, 3) numpy array): Jacobian of 3DoF interspace control with (theta, phi) parameterization
+    """
+    theta, phi, l = np.broadcast_arrays(*[np.atleast_1d(np.asarray(x, dtype=np.float64)) for x in (theta, phi, l)])
+
+    ux = calculate_ux(theta, phi, r)
+    uy = calculate_uy(theta, phi, r)
+
+    ## Chain rule from (ux, uy, l) to (theta, phi, l)
+    U = np.zeros((theta.shape[0], 3, 3))
+    U[:, 0, 0] = d_ux_d_theta(phi, r)
+    U[:, 0, 1] = d_ux_d_phi(theta, phi, r)
+    U[:, 1, 0] = d_uy_d_theta(phi, r)
+    U[:, 1, 1] = d_uy_d_phi(theta, phi, r)
+    U[:, 2, 2] = 1
+
+    return calculate_jacobian_ux_uy_l_batch(p_start, ux, uy, l, r) @ U
+
+
+def calculate_jacobian_2dof_theta_phi_batch(p_start, theta, phi, l, r):
+    """
+    Calculate Jacobian of 2DoF interspace control with (theta, phi) parameterization for a batch of configurations
+
+    Args:
+        p_start ((3,) numpy array): start point of catheter
+        theta ((n_configs,) numpy array or float): (in radians) theta parameter of each configuration
+        phi ((n_configs,) numpy array or float): (in radians) phi parameter of each configuration
+        l ((n_configs,) numpy array or float): length of catheter of each configuration
+        r (float): cross section radius of catheter
+
+    Note:
+        theta and phi together specify the 2 dimensional catheter bending
+
+    Returns:
+        ((n_configs, 6, 2) numpy array): Jacobian of 2DoF interspace control with (theta, phi) parameterization
+    """
+    return calculate_jacobian_3dof_theta_phi_batch(p_start, theta, phi, l, r)[:, :, :2]
+
+
 def calculate_jacobian_2dof_theta_phi(p_start, theta, phi, l, r):
     """
     Calculate Jacobian of 2DoF interspace control with (theta, phi) parameterization
@@ -231,47 +292,7 @@ def calculate_jacobian_2dof_theta_phi(p_start, theta, phi, l, r):
     Returns:
         ((6, 2) numpy array): Jacobian of 2DoF interspace control with (theta, phi) parameterization
     """
-    ux = calculate_ux(theta, phi, r)
-    uy = calculate_uy(theta, phi, r)
-
-    ux_over_phi = d_ux_d_phi(theta, phi, r)
-    uy_over_phi = d_uy_d_phi(theta, phi, r)
-    ux_over_theta = d_ux_d_theta(phi, r)
-    uy_over_theta = d_uy_d_theta(phi, r)
-    
-    bezier_mid_over_cc_start = d_bezier_d_p_start(0.5)
-    bezier_end_over_cc_start = d_bezier_d_p_start(1.0)
-    bezier_mid_over_cc_mid = d_bezier_d_p_mid(0.5)
-    bezier_end_over_cc_mid = d_bezier_d_p_mid(1.0)
-    bezier_mid_over_cc_end = d_bezier_d_p_end(0.5)
-    bezier_end_over_cc_end = d_bezier_d_p_end(1.0)
-
-    cc_start_over_ux = transforms.d_ux_cc_transform_3dof(p_start, ux, uy, l, r, s=0.0)
-    cc_start_over_uy = transforms.d_uy_cc_transform_3dof(p_start, ux, uy, l, r, s=0.0)
-    cc_mid_over_ux = transforms.d_ux_cc_transform_3dof(p_start, ux, uy, l, r, s=0.5)
-    cc_mid_over_uy = transforms.d_uy_cc_transform_3dof(p_start, ux, uy, l, r, s=0.5)
-    cc_end_over_ux = transforms.d_ux_cc_transform_3dof(p_start, ux, uy, l, r, s=1.0)
-    cc_end_over_uy = transforms.d_uy_cc_transform_3dof(p_start, ux, uy, l, r, s=1.0)
-
-    cc_start_over_theta = cc_start_over_ux * ux_over_theta + cc_start_over_uy * uy_over_theta
-    cc_mid_over_theta = cc_mid_over_ux * ux_over_theta + cc_mid_over_uy * uy_over_theta
-    cc_end_over_theta = cc_end_over_ux * ux_over_theta + cc_end_over_uy * uy_over_theta
-    cc_start_over_phi = cc_start_over_ux * ux_over_phi + cc_start_over_uy * uy_over_phi
-    cc_mid_over_phi = cc_mid_over_ux * ux_over_phi + cc_mid_over_uy * uy_over_phi
-    cc_end_over_phi = cc_end_over_ux * ux_over_phi + cc_end_over_uy * uy_over_phi
-
-    G_p_mid_theta = bezier_mid_over_cc_start * cc_start_over_theta + bezier_mid_over_cc_mid * cc_mid_over_theta + bezier_mid_over_cc_end * cc_end_over_theta
-    G_p_mid_phi = bezier_mid_over_cc_start * cc_start_over_phi + bezier_mid_over_cc_mid * cc_mid_over_phi + bezier_mid_over_cc_end * cc_end_over_phi
-    G_p_end_theta = bezier_end_over_cc_start * cc_start_over_theta + bezier_end_over_cc_mid * cc_mid_over_theta + bezier_end_over_cc_end * cc_end_over_theta
-    G_p_end_phi = bezier_end_over_cc_start * cc_start_over_phi + bezier_end_over_cc_mid * cc_mid_over_phi + bezier_end_over_cc_end * cc_end_over_phi
-
-    J = np.zeros((6, 2))
-    J[0:3, 0] = G_p_mid_theta
-    J[0:3, 1] = G_p_mid_phi
-    J[3:6, 0] = G_p_end_theta
-    J[3:6, 1] = G_p_end_phi
-
-    return J
+    return calculate_jacobian_2dof_theta_phi_batch(p_start, theta, phi, l, r)[0]
 
 
 def calculate_jacobian_3dof_theta_phi(p_start, theta, phi, l, r):
@@ -291,51 +312,4 @@ def calculate_jacobian_3dof_theta_phi(p_start, theta, phi, l, r):
     Returns:
         ((6, 3) numpy array): Jacobian of 3DoF interspace control with (theta, phi) parameterization
     """
-    ux = calculate_ux(theta, phi, r)
-    uy = calculate_uy(theta, phi, r)
-
-    ux_over_phi = d_ux_d_phi(theta, phi, r)
-    uy_over_phi = d_uy_d_phi(theta, phi, r)
-    ux_over_theta = d_ux_d_theta(phi, r)
-    uy_over_theta = d_uy_d_theta(phi, r)
-    
-    bezier_mid_over_cc_start = d_bezier_d_p_start(0.5)
-    bezier_end_over_cc_start = d_bezier_d_p_start(1.0)
-    bezier_mid_over_cc_mid = d_bezier_d_p_mid(0.5)
-    bezier_end_over_cc_mid = d_bezier_d_p_mid(1.0)
-    bezier_mid_over_cc_end = d_bezier_d_p_end(0.5)
-    bezier_end_over_cc_end = d_bezier_d_p_end(1.0)
-
-    cc_start_over_ux = transforms.d_ux_cc_transform_3dof(p_start, ux, uy, l, r, s=0.0)
-    cc_start_over_uy = transforms.d_uy_cc_transform_3dof(p_start, ux, uy, l, r, s=0.0)
-    cc_start_over_l = transforms.d_l_cc_transform_3dof(p_start, ux, uy, l, r, s=0.0)
-    cc_mid_over_ux = transforms.d_ux_cc_transform_3dof(p_start, ux, uy, l, r, s=0.5)
-    cc_mid_over_uy = transforms.d_uy_cc_transform_3dof(p_start, ux, uy, l, r, s=0.5)
-    cc_mid_over_l = transforms.d_l_cc_transform_3dof(p_start, ux, uy, l, r, s=0.5)
-    cc_end_over_ux = transforms.d_ux_cc_transform_3dof(p_start, ux, uy, l, r, s=1.0)
-    cc_end_over_uy = transforms.d_uy_cc_transform_3dof(p_start, ux, uy, l, r, s=1.0)
-    cc_end_over_l = transforms.d_l_cc_transform_3dof(p_start, ux, uy, l, r, s=1.0)
-
-    cc_start_over_theta = cc_start_over_ux * ux_over_theta + cc_start_over_uy * uy_over_theta
-    cc_mid_over_theta = cc_mid_over_ux * ux_over_theta + cc_mid_over_uy * uy_over_theta
-    cc_end_over_theta = cc_end_over_ux * ux_over_theta + cc_end_over_uy * uy_over_theta
-    cc_start_over_phi = cc_start_over_ux * ux_over_phi + cc_start_over_uy * uy_over_phi
-    cc_mid_over_phi = cc_mid_over_ux * ux_over_phi + cc_mid_over_uy * uy_over_phi
-    cc_end_over_phi = cc_end_over_ux * ux_over_phi + cc_end_over_uy * uy_over_phi
-
-    G_p_mid_theta = bezier_mid_over_cc_start * cc_start_over_theta + bezier_mid_over_cc_mid * cc_mid_over_theta + bezier_mid_over_cc_end * cc_end_over_theta
-    G_p_mid_phi = bezier_mid_over_cc_start * cc_start_over_phi + bezier_mid_over_cc_mid * cc_mid_over_phi + bezier_mid_over_cc_end * cc_end_over_phi
-    G_p_mid_l = bezier_mid_over_cc_start * cc_start_over_l + bezier_mid_over_cc_mid * cc_mid_over_l + bezier_mid_over_cc_end * cc_end_over_l
-    G_p_end_theta = bezier_end_over_cc_start * cc_start_over_theta + bezier_end_over_cc_mid * cc_mid_over_theta + bezier_end_over_cc_end * cc_end_over_theta
-    G_p_end_phi = bezier_end_over_cc_start * cc_start_over_phi + bezier_end_over_cc_mid * cc_mid_over_phi + bezier_end_over_cc_end * cc_end_over_phi
-    G_p_end_l = bezier_end_over_cc_start * cc_start_over_l + bezier_end_over_cc_mid * cc_mid_over_l + bezier_end_over_cc_end * cc_end_over_l
-
-    J = np.zeros((6, 3))
-    J[0:3, 0] = G_p_mid_theta
-    J[0:3, 1] = G_p_mid_phi
-    J[0:3, 2] = G_p_mid_l
-    J[3:6, 0] = G_p_end_theta
-    J[3:6, 1] = G_p_end_phi
-    J[3:6, 2] = G_p_end_l
-
-    return J
+    return calculate_jacobian_3dof_theta_phi_batch(p_start, theta, phi, l, r)[0]
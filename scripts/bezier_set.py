@@ -1,7 +1,183 @@
 import os
+import time
+import atexit
+import shutil
+import tempfile
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Client
+import cv2
 import numpy as np
 import path_settings
+from silhouette_renderer import SilhouetteRenderer
+
+
+class BlenderRenderServer:
+
+    def __init__(self, blender_dir=path_settings.blender_dir, render_script=path_settings.bezier_render_script, startup_timeout=60):
+        """
+        Long-lived Blender process that keeps the scene resident and renders Bezier curves on request
+
+        Args:
+            blender_dir (path string to directory): directory containing the blender executable
+            render_script (path string to py file): Blender script that renders the Bezier curves
+            startup_timeout (float): seconds to wait for Blender to start listening and report its port
+        """
+        self.blender_dir = blender_dir
+        self.render_script = render_script
+        self.startup_timeout = startup_timeout
+
+        self.process = None
+        self.conn = None
+
+    def start(self):
+        """
+        Launch Blender in server mode and connect to it
+
+        Note:
+            Blender binds a port chosen by the system and writes it to a file in a private temporary directory,
+                which avoids racing other processes for a port picked here
+        """
+        authkey = os.urandom(16).hex()
+        env = dict(os.environ, BEZIER_RENDER_AUTHKEY=authkey)
+
+        port_dir = tempfile.mkdtemp(prefix='bezier_render_')
+        port_file = os.path.join(port_dir, 'port')
+
+        try:
+            self.process = subprocess.Popen(
+                ['./blender', '-b', '-P', self.render_script, '--', '--server_port_file', port_file],
+                cwd=self.blender_dir, env=env)
+
+            deadline = time.time() + self.startup_timeout
+
+            while not os.path.isfile(port_file):
+                if self.process.poll() is not None or time.time() > deadline:
+                    self.close()
+                    raise RuntimeError('Blender render server failed to start')
+                time.sleep(0.1)
+
+            with open(port_file) as f:
+                port = int(f.read())
+
+        finally:
+            shutil.rmtree(port_dir, ignore_errors=True)
+
+        self.conn = Client(('localhost', port), authkey=authkey.encode())
+
+    def is_alive(self):
+        """
+        Returns:
+            (bool): whether the Blender process is running and connected
+        """
+        return self.conn is not None and self.process is not None and self.process.poll() is None
+
+    def render(self, specs, img_save_path, target_specs=None, viewpoint_mode=1, transparent_mode=0):
+        """
+        Render one image
+
+        Args:
+            specs ((n, 4, 3) numpy array): specs of the Bezier curves to render
+            img_save_path (path string to png file): path to save the rendered image, relative paths
+                are resolved against blender_dir
+            target_specs ((m, 3) numpy array or None): 3D positions of target points to render
+            viewpoint_mode (1 or 2): camera view of rendered image, 1 for endoscopic view, 2 for side view
+            transparent_mode (0 or 1): whether to make the background transparent for the rendered image
+        """
+        if not self.is_alive():
+            self.start()
+
+        self.conn.send({
+            'specs': np.asarray(specs),
+            'save_path': img_save_path,
+            'viewpoint_mode': viewpoint_mode,
+            'target_specs': target_specs,
+            'transparent_mode': transparent_mode
+        })
+        reply = self.conn.recv()
+
+        if reply != 'ok':
+            raise RuntimeError('Blender render server failed to render ' + img_save_path + ': ' + reply)
+
+    def close(self):
+        """
+        Shut down the Blender process
+        """
+        if self.conn is not None:
+            try:
+                self.conn.send(None)
+                self.conn.close()
+            except OSError:
+                pass
+            self.conn = None
+
+        if self.process is not None:
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+            self.process = None
+
+
+_render_server = None
+_render_server_pid = None
+
+
+def get_render_server():
+    """
+    Returns:
+        (BlenderRenderServer): render server shared by all BezierSet instances of this process,
+            started on first use and shut down at exit
+
+    Note:
+        A process forked after the server was started gets its own server, it must not share the connection
+    """
+    global _render_server, _render_server_pid
+
+    if _render_server is None or _render_server_pid != os.getpid():
+        _render_server = BlenderRenderServer()
+        _render_server_pid = os.getpid()
+        atexit.register(_render_server.close)
+
+    return _render_server
+
+
+_image_writer = None
+_image_writer_pid = None
+_pending_image_writes = []
+
+
+def write_image_async(img_save_path, img):
+    """
+    Write an image to disk on a background thread so that encoding the PNG stays off the critical path
+
+    Args:
+        img_save_path (path string to png file): path to save the image
+        img ((size_y, size_x, c) uint8 numpy array): image to save, must not be modified afterwards
+    """
+    global _image_writer, _image_writer_pid, _pending_image_writes
+
+    ## A forked process inherits the executor of its parent but not its thread, so it starts its own
+    if _image_writer is None or _image_writer_pid != os.getpid():
+        _image_writer = ThreadPoolExecutor(max_workers=1)
+        _image_writer_pid = os.getpid()
+        _pending_image_writes = []
+        atexit.register(wait_for_image_writes)
+
+    _pending_image_writes.append(_image_writer.submit(cv2.imwrite, img_save_path, img))
+
+
+def wait_for_image_writes():
+    """
+    Block until all images queued by write_image_async in this process are on disk
+    """
+    ## Writes inherited from the parent of a forked process are never run in this process
+    if _image_writer_pid != os.getpid():
+        return
+
+    while _pending_image_writes:
+        if not _pending_image_writes.pop(0).result():
+            print('[WARNING] [BezierSet] Failed to write a rendered image')
 
 
 class BezierSet:
@@ -51,25 +227,60 @@ class BezierSet:
         self.specs_path = specs_path
         np.save(specs_path, self.specs)
 
-    def render(self, img_save_path, target_specs_path=None, viewpoint_mode=1, transparent_mode=0):
+    def render(self, img_save_path, target_specs_path=None, viewpoint_mode=1, transparent_mode=0, use_server=True, backend='blender'):
         """
         Call Blender to render the Bezier curves
 
         Args:
-            img_save_path (path string to png file): path to save the rendered image
+            img_save_path (path string to png file): path to save the rendered image. With the 'software'
+                backend the image is written in the background (see wait_for_image_writes), or not at all if None
             target_specs_path (path stirng to npy file): path to an existing target specs file
             viewpoint_mode (1 or 2): camera view of rendered image, 1 for endoscopic view, 2 for side view
             transparent_mode (0 or 1): whether to make the background transparent for the rendered image, 0 for not transparent, 1 for transparent
+            use_server (bool): whether to render with the persistent Blender render server instead of
+                launching Blender for this image only
+            backend ('blender' or 'software'): renderer to use, 'software' rasterizes the tube silhouette
+                with SilhouetteRenderer and does not need Blender
+
+        Returns:
+            ((size_y, size_x, c) uint8 numpy array or None): rendered image with the 'software' backend,
+                None with the 'blender' backend, whose image is only available at img_save_path
         """
-        os.chdir(path_settings.blender_dir)
+        if backend == 'software':
+            if target_specs_path:
+                target_specs = np.load(target_specs_path)
+            else:
+                target_specs = None
+
+            img = SilhouetteRenderer().render(self.specs, target_specs, viewpoint_mode, transparent_mode)
+
+            if img_save_path:
+                write_image_async(img_save_path, img)
+
+            return img
+
+        if use_server:
+            if target_specs_path:
+                target_specs = np.load(target_specs_path)
+            else:
+                target_specs = None
+
+            try:
+                get_render_server().render(self.specs, img_save_path, target_specs, viewpoint_mode, transparent_mode)
+                return
+            except (RuntimeError, OSError, EOFError) as e:
+                print('[WARNING] [BezierSet] Render server unavailable, falling back to a single Blender run: ', e)
+                get_render_server().close()
 
+        ## Run Blender from its directory without changing the working directory of this process,
+        ## which would leak into other jobs running in the same process
         if target_specs_path:
             subprocess.run([
                 './blender', '-b', '-P', path_settings.bezier_render_script, '--', '--specs_path', self.specs_path,
                 '--save_path', img_save_path, '--viewpoint_mode',
                 str(viewpoint_mode), '--target_specs_path', target_specs_path, '--transparent_mode',
                 str(transparent_mode)
-            ])
+            ], cwd=path_settings.blender_dir)
 
         else:
             subprocess.run([
@@ -77,7 +288,7 @@ class BezierSet:
                 self.specs_path, '--save_path', img_save_path, '--viewpoint_mode',
                 str(viewpoint_mode), '--target_specs_path', '', '--transparent_mode',
                 str(transparent_mode)
-            ])   # run in background
+            ], cwd=path_settings.blender_dir)   # run in background
             # subprocess.run([
             #     './blender', '-P', path_settings.bezier_render_script, '--', '--specs_path', self.specs_path,
             #     '--save_path', img_save_path, '--viewpoint_mode',
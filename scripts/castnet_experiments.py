@@ -4,7 +4,8 @@ import numpy as np
 
 import path_settings
 from experiment_setup import experiments
-from simulation_experiment import SimulationExperiment
+from experiment_runner import ParallelExperimentRunner, make_job
+from workspace_atlas import WorkspaceAtlas
 
 
 
@@ -17,6 +18,10 @@ noise_percentage = 0.25
 ux_init = 0.00001
 uy_init = 0.00001
 l_init = 0.2
+render_backend = 'blender'   ## 'blender' or 'software' (no Blender needed)
+n_workers = os.cpu_count()   ## number of worker processes, 1 to run serially in this process
+batch_simulation = True      ## run methods without reconstruction as lockstep batches of all data points
+atlas_seeding = True         ## start each target from the nearest workspace atlas sample instead of ux_init, uy_init
 
 identifiers_of_interest = ['UN008', 'UN009', 'IA008', 'IA009', 'IA108', 'IA109', 'UN012', 'UN013', 'IA012', 'IA013', 'IA112', 'IA113']
 
@@ -32,66 +37,50 @@ y_targets = np.arange(5, 480 - 5, spacing)
 combinations = list(itertools.product(x_targets, y_targets))
 
 n_data = len(combinations)
-print('Number of cast-net data points: ', n_data)
-
-
-for identifier in identifiers_of_interest:
-    print('~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~')
-    print('Running cast-net experiment for ', identifier)
-    print('~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~')
-
-    exp = experiments[identifier]
-    dof = exp['dof']
-    loss_2d = exp['loss_2d']
-    tip_loss = exp['tip_loss']
-    use_reconstruction = exp['use_reconstruction']
-    interspace = exp['interspace']
-    viewpoint_mode = exp['viewpoint_mode']
-    damping_weights = exp['damping_weights']
-    n_mid_points = exp['n_mid_points']
-
-    if use_reconstruction:
-        render_mode = 2
+
+
+if __name__ == '__main__':
+    print('Number of cast-net data points: ', n_data)
+
+    if atlas_seeding:
+        atlas = WorkspaceAtlas(os.path.join(path_settings.results_dir, 'workspace_atlas'), p_0, r)
+
+        ## 2DoF methods keep l at l_init, 3DoF methods also start from the length of the nearest sample
+        seeds = {2: atlas.query(np.array(combinations), l=l_init)[0], 3: atlas.query(np.array(combinations))[0]}
+        seeds[2][:, 2] = l_init
     else:
-        render_mode = 1
-
-    method_dir = os.path.join(path_settings.results_dir, identifier)
-
-    if not os.path.isdir(method_dir):
-        os.mkdir(method_dir)
-    
-    data_dir_outer = os.path.join(method_dir, data_alias)
-    if not os.path.isdir(data_dir_outer):
-        os.mkdir(data_dir_outer)
-
-    for i in range(n_data):
-        for j in range(n_trials):
-
-            x_target = combinations[i][0]
-            y_target = combinations[i][1]
-
-            data_dir = os.path.join(data_dir_outer, str(x_target).zfill(4) + '_' + str(y_target).zfill(4) + '_' + str(j).zfill(2))
-            images_save_dir = os.path.join(data_dir, 'images')
-            cc_specs_save_dir = os.path.join(data_dir, 'cc_specs')
-            params_report_path = os.path.join(data_dir, 'params.npy')
-            p3d_report_path = os.path.join(data_dir, 'p3d_poses.npy')
-            p2d_report_path = os.path.join(data_dir, 'p2d_poses.npy')
-
-            if not os.path.isdir(data_dir):
-                os.mkdir(data_dir)
-                os.mkdir(images_save_dir)
-                os.mkdir(cc_specs_save_dir)
-
-            ## Skip if data_dir exists, assuming that experiment with the corresponding paramters have already been run
-            else:
-                continue
-
-            ux = ux_init
-            uy = uy_init
-            l = l_init
-
-            sim_exp = SimulationExperiment(dof, loss_2d, tip_loss, use_reconstruction, interspace, viewpoint_mode, damping_weights, noise_percentage, n_iter, render_mode)
-            sim_exp.set_paths(images_save_dir, cc_specs_save_dir, params_report_path, p3d_report_path, p2d_report_path)
-            sim_exp.set_general_parameters(p_0, r, n_mid_points, l)
-            sim_exp.set_2d_pos_parameters(ux, uy, x_target, y_target, l)
-            sim_exp.execute()
+        seeds = {dof: np.tile([ux_init, uy_init, l_init], (n_data, 1)) for dof in (2, 3)}
+
+    jobs = []
+
+    for identifier in identifiers_of_interest:
+        exp = experiments[identifier]
+        method_dir = os.path.join(path_settings.results_dir, identifier)
+
+        if not os.path.isdir(method_dir):
+            os.mkdir(method_dir)
+
+        data_dir_outer = os.path.join(method_dir, data_alias)
+        if not os.path.isdir(data_dir_outer):
+            os.mkdir(data_dir_outer)
+
+        for i in range(n_data):
+            for j in range(n_trials):
+
+                x_target = combinations[i][0]
+                y_target = combinations[i][1]
+                ux_seed, uy_seed, l_seed = seeds[exp['dof']][i]
+
+                data_dir = os.path.join(data_dir_outer, str(x_target).zfill(4) + '_' + str(y_target).zfill(4) + '_' + str(j).zfill(2))
+
+                ## Jobs whose results are already committed with the same settings are skipped by the runner
+                jobs.append(make_job(identifier, exp, i * n_trials + j, data_dir, p_0, r, n_iter, noise_percentage, render_backend,
+                                     ux_seed, uy_seed, l_seed, x_target=x_target, y_target=y_target, trial=j))
+
+    runner = ParallelExperimentRunner(n_workers)
+    runner.run(jobs, batch_simulation=batch_simulation)
+    runner.write_report(os.path.join(path_settings.results_dir, data_alias + '_report.json'))
+
+    print('Skipped ' + str(runner.get_n_cached()) + ' jobs with committed results')
+    print(['Experiment ' + record['exp_name'] + ' failed for data ' + str(record['data_index']) + ': ' + record['error']
+           for record in runner.get_failures()])
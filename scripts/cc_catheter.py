@@ -5,6 +5,11 @@ import cv2
 import transforms
 import bezier_interspace_transforms
 from bezier_set import BezierSet
+from result_cache import save_npy_atomic
+
+
+## Number of halved steps evaluated in one batch by CCCatheter.take_in_view_step
+VIEW_BREACH_LADDER_SIZE = 32
 
 
 class CCCatheter:
@@ -288,59 +293,51 @@ class CCCatheter:
         else:
             self.s_list = np.linspace(0, 1, self.n_mid_points + 2)[1:]
 
-        if target:
-            self.target_cc_pt_list = []
-
-            for i, s, in enumerate(self.s_list):
-
-                if self.mode == 1:
-                    p = self.transform_1dof(s, target=True)
-                elif self.mode == 2:
-                    p = self.transform_2dof(s, target=True)
-                elif self.mode == 3:
-                    p = self.transform_3dof(s, target=True)
-                else:
-                    print('[ERROR] [CCCatheter] Mode invalid')
-                    exit()
-
-                self.target_cc_pt_list.append(p)
+        if self.mode == 1:
+            if target:
+                pts = transforms.cc_transform_1dof_batch(self.p_0, self.phi, self.u_target, self.l, self.r, self.s_list)[0]
+            else:
+                pts = transforms.cc_transform_1dof_batch(self.p_0, self.phi, self.u, self.l, self.r, self.s_list)[0]
+        elif self.mode == 2:
+            if target:
+                pts = transforms.cc_transform_3dof_batch(self.p_0, self.ux_target, self.uy_target, self.l, self.r, self.s_list)[0]
+            else:
+                pts = transforms.cc_transform_3dof_batch(self.p_0, self.ux, self.uy, self.l, self.r, self.s_list)[0]
+        elif self.mode == 3:
+            if target:
+                pts = transforms.cc_transform_3dof_batch(self.p_0, self.ux_target, self.uy_target, self.l_target, self.r, self.s_list)[0]
+            else:
+                pts = transforms.cc_transform_3dof_batch(self.p_0, self.ux, self.uy, self.l, self.r, self.s_list)[0]
+        else:
+            print('[ERROR] [CCCatheter] Mode invalid')
+            exit()
 
-                self.p3d_poses[-1, i, :] = p
+        if target:
+            self.target_cc_pt_list = list(pts)
+            self.p3d_poses[-1, :len(pts), :] = pts
 
-                if self.verbose > 0:
+            if self.verbose > 0:
+                for i, (s, p) in enumerate(zip(self.s_list, pts)):
                     print('Target CC Point ' + str(i + 1) + ': ')
                     print('    s = ', s)
                     print('    p = ', p)
 
         else:
-            self.cc_pt_list = []
-
-            for i, s in enumerate(self.s_list):
-
-                if self.mode == 1:
-                    p = self.transform_1dof(s)
-                elif self.mode == 2:
-                    p = self.transform_2dof(s)
-                elif self.mode == 3:
-                    p = self.transform_3dof(s)
-                else:
-                    print('[ERROR] [CCCatheter] Mode invalid')
-                    exit()
+            self.cc_pt_list = list(pts)
 
-                self.cc_pt_list.append(p)
-
-                if self.verbose > 0:
+            if self.verbose > 0:
+                for i, (s, p) in enumerate(zip(self.s_list, pts)):
                     print('CC Point ' + str(i + 1) + ': ')
                     print('    s = ', s)
                     print('    p = ', p)
 
-                if current_iter < 0:
-                    continue
+            if current_iter < 0:
+                return
 
-                if init:
-                    self.p3d_poses[0, i, :] = p
-                else:
-                    self.p3d_poses[current_iter + 1, i, :] = p
+            if init:
+                self.p3d_poses[0, :len(pts), :] = pts
+            else:
+                self.p3d_poses[current_iter + 1, :len(pts), :] = pts
 
     def convert_bezier_to_cc(self, optimized_bezier_specs, current_iter=0):
         """
@@ -395,24 +392,22 @@ class CCCatheter:
                 )
                 exit()
 
-            self.target_cc_pt_list_2d = []
-
-            for i, p in enumerate(self.target_cc_pt_list):
+            pts_2d = transforms.world_to_image_transform_batch(np.array(self.target_cc_pt_list), self.camera_extrinsics,
+                                                               self.fx, self.fy, self.cx, self.cy)
+            pts_2d[:, 0] = np.round(self.size_x - pts_2d[:, 0])
+            pts_2d[:, 1] = np.round(pts_2d[:, 1])
 
-                p_2d = transforms.world_to_image_transform(p, self.camera_extrinsics, self.fx, self.fy, self.cx,
-                                                           self.cy)
-                p_2d[0] = round(self.size_x - p_2d[0])
-                p_2d[1] = round(p_2d[1])
+            outside = (pts_2d[:, 0] >= self.size_x) | (pts_2d[:, 0] < 0) | (pts_2d[:, 1] >= self.size_y) | (pts_2d[:, 1] < 0)
 
-                if p_2d[0] >= self.size_x or p_2d[0] < 0 or p_2d[1] >= self.size_y or p_2d[1] < 0:
-                    print('[ERROR] [CCCatheter] Target falls outside of image. Target 2D position = ', p_2d)
-                    exit()
-
-                self.target_cc_pt_list_2d.append(p_2d)
+            if np.any(outside):
+                print('[ERROR] [CCCatheter] Target falls outside of image. Target 2D position = ', pts_2d[np.argmax(outside)])
+                exit()
 
-                self.p2d_poses[-1, i, :] = p_2d
+            self.target_cc_pt_list_2d = list(pts_2d)
+            self.p2d_poses[-1, :len(pts_2d), :] = pts_2d
 
-                if self.verbose > 1:
+            if self.verbose > 1:
+                for i, p_2d in enumerate(pts_2d):
                     print('2D Target CC Point ' + str(i + 1) + ': ')
                     print('    p = ', p_2d)
 
@@ -421,29 +416,25 @@ class CCCatheter:
                 print('[ERROR] [CCCatheter] self.cc_pt_list invalid. Run calculate_cc_points() first')
                 exit()
 
-            self.cc_pt_list_2d = []
+            pts_2d = transforms.world_to_image_transform_batch(np.array(self.cc_pt_list), self.camera_extrinsics,
+                                                               self.fx, self.fy, self.cx, self.cy)
+            pts_2d[:, 0] = self.size_x - pts_2d[:, 0]
 
-            for i, p in enumerate(self.cc_pt_list):
-                p_2d = transforms.world_to_image_transform(p, self.camera_extrinsics, self.fx, self.fy, self.cx,
-                                                           self.cy)
-                p_2d[0] = self.size_x - p_2d[0]
+            outside = (pts_2d[:, 0] >= self.size_x) | (pts_2d[:, 0] < 0) | (pts_2d[:, 1] >= self.size_y) | (pts_2d[:, 1] < 0)
+            in_view = not np.any(outside)
 
-                if p_2d[0] >= self.size_x or p_2d[0] < 0 or p_2d[1] >= self.size_y or p_2d[1] < 0:
-                    in_view = False
+            self.cc_pt_list_2d = list(pts_2d)
 
-                self.cc_pt_list_2d.append(p_2d)
-
-                if self.verbose > 1:
+            if self.verbose > 1:
+                for i, p_2d in enumerate(pts_2d):
                     print('2D CC Point ' + str(i + 1) + ': ')
                     print('    p = ', p_2d)
 
-                if current_iter < 0:
-                    continue
-
+            if current_iter >= 0:
                 if init:
-                    self.p2d_poses[0, i, :] = p_2d
+                    self.p2d_poses[0, :len(pts_2d), :] = pts_2d
                 else:
-                    self.p2d_poses[current_iter + 1, i, :] = p_2d
+                    self.p2d_poses[current_iter + 1, :len(pts_2d), :] = pts_2d
 
         return in_view
 
@@ -549,10 +540,13 @@ class CCCatheter:
                 If some parameters are not applicable for current method, they are left as 0
             p3d_report_path (path string to npy file)
             p2d_report_path (path string to npy file)
+
+        Note:
+            Each report is replaced atomically, so an interrupted run never leaves a truncated file
         """
-        np.save(params_report_path, self.params)
-        np.save(p3d_report_path, self.p3d_poses)
-        np.save(p2d_report_path, self.p2d_poses)
+        save_npy_atomic(params_report_path, self.params)
+        save_npy_atomic(p3d_report_path, self.p3d_poses)
+        save_npy_atomic(p2d_report_path, self.p2d_poses)
 
     def get_params(self):
         """
@@ -639,7 +633,8 @@ class CCCatheter:
                        img_save_path,
                        target_specs_path=None,
                        viewpoint_mode=1,
-                       transparent_mode=0):
+                       transparent_mode=0,
+                       render_backend='blender'):
         """
         Render Bezier curves according to the curve specs.
 
@@ -653,6 +648,10 @@ class CCCatheter:
             viewpoint_mode (1 or 2): camera view of rendered image, 1 for endoscopic view, 2 for side view
             transparent_mode (0 or 1): whether to make the background transparent for the rendered image,
                 0 for not transparent, 1 for transparent
+            render_backend ('blender' or 'software'): renderer to use, see BezierSet.render
+
+        Returns:
+            ((size_y, size_x, c) uint8 numpy array or None): rendered image if the backend keeps it in memory
         """
         if not self.bezier_set:
             print('[ERROR] [CCCatheter] self.bezier_set invalid. Run calculate_beziers_control_points() first')
@@ -660,7 +659,7 @@ class CCCatheter:
 
         self.bezier_set.print_specs()
         self.bezier_set.write_specs(curve_specs_path)
-        self.bezier_set.render(img_save_path, target_specs_path, viewpoint_mode, transparent_mode)
+        return self.bezier_set.render(img_save_path, target_specs_path, viewpoint_mode, transparent_mode, backend=render_backend)
 
     def visualize_targets(self, img_save_path):
         """
@@ -688,6 +687,21 @@ class CCCatheter:
 
         cv2.imwrite(img_save_path, img)
 
+    def calculate_interaction_matrix(self):
+        """
+        Calculate the world to image interaction matrix of the CC points the loss is evaluated on
+
+        Returns:
+            ((2, 3) numpy array with tip loss, (2 * n, 3 * n) numpy array otherwise): interaction matrix of the end point
+                with tip loss, block diagonal interaction matrix of all n CC points otherwise
+        """
+        if self.tip_loss:
+            return transforms.world_to_image_interaction_matrix(self.cc_pt_list[-1], self.camera_extrinsics, self.fx, self.fy)
+
+        L = transforms.world_to_image_interaction_matrix_batch(np.array(self.cc_pt_list), self.camera_extrinsics, self.fx, self.fy)
+
+        return transforms.block_diag_interaction_matrix(L)
+
     def calculate_jacobian_1dof_3d(self):
         """
         Calculate the Jacobian for 1DoF control with 3D loss (1DoF is not fully implemented)
@@ -719,46 +733,37 @@ class CCCatheter:
             G_u = transforms.d_u_cc_transform_1dof(self.p_0, self.phi, self.u, self.l, self.r, s=1)
             J[:, 0] = G_u
 
-            L_diag = transforms.world_to_image_interaction_matrix(self.cc_pt_list[-1], self.camera_extrinsics, self.fx,
-                                                                  self.fy)
-
         else:
             J = np.zeros((3 * len(self.cc_pt_list), 1))
-            L_diag = np.zeros((2 * len(self.cc_pt_list), 3 * len(self.cc_pt_list)))
 
-            for i, (s, p) in enumerate(zip(self.s_list, self.cc_pt_list)):
+            for i, s in enumerate(self.s_list):
                 G_u = transforms.d_u_cc_transform_1dof(self.p_0, self.phi, self.u, self.l, self.r, s)
                 J[i * 3:(i + 1) * 3, 0] = G_u
 
-                L = transforms.world_to_image_interaction_matrix(p, self.camera_extrinsics, self.fx, self.fy)
-                L_diag[i * 2:(i + 1) * 2, i * 3:(i + 1) * 3] = L
-
-        return L_diag @ J
+        return self.calculate_interaction_matrix() @ J
 
-    def calculate_jacobian_2dof_3d(self):
+    def calculate_jacobian_3dof_cc_points(self):
         """
-        Calculate the Jacobian for 2DoF control with 3D loss
+        Calculate the positional Jacobian of the CC points with respect to ux, uy, and l
+
+        Returns:
+            ((3 * n, 3) numpy array): stacked Jacobian of the CC points, where n is 1 with tip loss
+                and the number of CC points otherwise
         """
         if self.tip_loss:
-            J = np.zeros((3, 2))
-
-            G_ux = transforms.d_ux_cc_transform_3dof(self.p_0, self.ux, self.uy, self.l, self.r, s=1)
-            G_uy = transforms.d_uy_cc_transform_3dof(self.p_0, self.ux, self.uy, self.l, self.r, s=1)
-
-            J[:, 0] = G_ux
-            J[:, 1] = G_uy
-
+            s_list = [1]
         else:
-            J = np.zeros((3 * len(self.cc_pt_list), 2))
+            s_list = self.s_list
 
-            for i, s in enumerate(self.s_list):
-                G_ux = transforms.d_ux_cc_transform_3dof(self.p_0, self.ux, self.uy, self.l, self.r, s)
-                G_uy = transforms.d_uy_cc_transform_3dof(self.p_0, self.ux, self.uy, self.l, self.r, s)
+        G = transforms.d_cc_transform_3dof_batch(self.p_0, self.ux, self.uy, self.l, self.r, s_list)[0]
 
-                J[i * 3:(i + 1) * 3, 0] = G_ux
-                J[i * 3:(i + 1) * 3, 1] = G_uy
+        return G.reshape(3 * len(s_list), 3)
 
-        return J
+    def calculate_jacobian_2dof_3d(self):
+        """
+        Calculate the Jacobian for 2DoF control with 3D loss
+        """
+        return self.calculate_jacobian_3dof_cc_points()[:, :2]
 
     def calculate_jacobian_2dof_2d(self):
         """
@@ -768,62 +773,15 @@ class CCCatheter:
             print('[ERROR] [CCCatheter] Not initialized with 2D Loss')
             exit()
 
-        if self.tip_loss:
-            J = np.zeros((3, 2))
-
-            G_ux = transforms.d_ux_cc_transform_3dof(self.p_0, self.ux, self.uy, self.l, self.r, s=1)
-            G_uy = transforms.d_uy_cc_transform_3dof(self.p_0, self.ux, self.uy, self.l, self.r, s=1)
+        J = self.calculate_jacobian_3dof_cc_points()[:, :2]
 
-            J[:, 0] = G_ux
-            J[:, 1] = G_uy
-
-            L_diag = transforms.world_to_image_interaction_matrix(self.cc_pt_list[-1], self.camera_extrinsics, self.fx,
-                                                                  self.fy)
-
-        else:
-            J = np.zeros((3 * len(self.cc_pt_list), 2))
-            L_diag = np.zeros((2 * len(self.cc_pt_list), 3 * len(self.cc_pt_list)))
-
-            for i, (s, p) in enumerate(zip(self.s_list, self.cc_pt_list)):
-                G_ux = transforms.d_ux_cc_transform_3dof(self.p_0, self.ux, self.uy, self.l, self.r, s)
-                G_uy = transforms.d_uy_cc_transform_3dof(self.p_0, self.ux, self.uy, self.l, self.r, s)
-
-                J[i * 3:(i + 1) * 3, 0] = G_ux
-                J[i * 3:(i + 1) * 3, 1] = G_uy
-
-                L = transforms.world_to_image_interaction_matrix(p, self.camera_extrinsics, self.fx, self.fy)
-                L_diag[i * 2:(i + 1) * 2, i * 3:(i + 1) * 3] = L
-
-        return L_diag @ J
+        return self.calculate_interaction_matrix() @ J
 
     def calculate_jacobian_3dof_3d(self):
         """
         Calculate the Jacobian for 3DoF control with 3D loss
         """
-        if self.tip_loss:
-            J = np.zeros((3, 3))
-
-            G_ux = transforms.d_ux_cc_transform_3dof(self.p_0, self.ux, self.uy, self.l, self.r, s=1)
-            G_uy = transforms.d_uy_cc_transform_3dof(self.p_0, self.ux, self.uy, self.l, self.r, s=1)
-            G_l = transforms.d_l_cc_transform_3dof(self.p_0, self.ux, self.uy, self.l, self.r, s=1)
-
-            J[:, 0] = G_ux
-            J[:, 1] = G_uy
-            J[:, 2] = G_l
-
-        else:
-            J = np.zeros((3 * len(self.cc_pt_list), 3))
-
-            for i, s in enumerate(self.s_list):
-                G_ux = transforms.d_ux_cc_transform_3dof(self.p_0, self.ux, self.uy, self.l, self.r, s)
-                G_uy = transforms.d_uy_cc_transform_3dof(self.p_0, self.ux, self.uy, self.l, self.r, s)
-                G_l = transforms.d_l_cc_transform_3dof(self.p_0, self.ux, self.uy, self.l, self.r, s)
-
-                J[i * 3:(i + 1) * 3, 0] = G_ux
-                J[i * 3:(i + 1) * 3, 1] = G_uy
-                J[i * 3:(i + 1) * 3, 2] = G_l
-
-        return J
+        return self.calculate_jacobian_3dof_cc_points()
 
     def calculate_jacobian_3dof_2d(self):
         """
@@ -833,37 +791,75 @@ class CCCatheter:
             print('[ERROR] [CCCatheter] Not initialized with 2D Loss')
             exit()
 
-        if self.tip_loss:
-            J = np.zeros((3, 3))
+        J = self.calculate_jacobian_3dof_cc_points()
 
-            G_ux = transforms.d_ux_cc_transform_3dof(self.p_0, self.ux, self.uy, self.l, self.r, s=1)
-            G_uy = transforms.d_uy_cc_transform_3dof(self.p_0, self.ux, self.uy, self.l, self.r, s=1)
-            G_l = transforms.d_l_cc_transform_3dof(self.p_0, self.ux, self.uy, self.l, self.r, s=1)
+        return self.calculate_interaction_matrix() @ J
 
-            J[:, 0] = G_ux
-            J[:, 1] = G_uy
-            J[:, 2] = G_l
+    def take_in_view_step(self, q_old, d, theta_phi=False):
+        """
+        Update the parameters by d, halving the step as many times as needed to keep all CC points in view
 
-            L_diag = transforms.world_to_image_interaction_matrix(self.cc_pt_list[-1], self.camera_extrinsics, self.fx,
-                                                                  self.fy)
+        Args:
+            q_old ((3,) numpy array): (ux, uy, l) before the update, or (theta, phi, l) if theta_phi
+            d ((3,) numpy array): update of q_old
+            theta_phi (bool): whether q_old and d are in (theta, phi, l) parameterization
 
-        else:
-            J = np.zeros((3 * len(self.cc_pt_list), 3))
-            L_diag = np.zeros((2 * len(self.cc_pt_list), 3 * len(self.cc_pt_list)))
+        Returns:
+            q ((3,) numpy array): updated parameters, which are also applied to self.ux, self.uy, and self.l
+            scale (float): factor the step was scaled by, 1 if the full step stays in view
+
+        Note:
+            After the full step, the steps halved 1 to VIEW_BREACH_LADDER_SIZE times are evaluated in one batched
+                kinematics and projection call and the largest step in view is taken, which is the step that
+                halving one at a time stops at. If a step that small is still out of view, the next ladder is evaluated
+        """
+        scales = np.ones(1)
+
+        while True:
+            q = q_old + scales[:, None] * d
+
+            if theta_phi:
+                ux = bezier_interspace_transforms.calculate_ux(q[:, 0], q[:, 1], self.r)
+                uy = bezier_interspace_transforms.calculate_uy(q[:, 0], q[:, 1], self.r)
+            else:
+                ux = q[:, 0]
+                uy = q[:, 1]
+
+            ## The full step alone takes the float path of transforms for a single configuration
+            if len(scales) == 1:
+                pts = transforms.cc_transform_3dof_batch(self.p_0, ux[0], uy[0], q[0, 2], self.r, self.s_list)
+            else:
+                pts = transforms.cc_transform_3dof_batch(self.p_0, ux, uy, q[:, 2], self.r, self.s_list)
+
+            pts_2d = transforms.world_to_image_transform_batch(pts, self.camera_extrinsics, self.fx, self.fy, self.cx, self.cy)
+            pts_2d[..., 0] = self.size_x - pts_2d[..., 0]
+
+            inside = (pts_2d[..., 0] < self.size_x) & (pts_2d[..., 0] >= 0) & (pts_2d[..., 1] < self.size_y) & (pts_2d[..., 1] >= 0)
+            in_view = np.all(inside, axis=-1)
 
-            for i, (s, p) in enumerate(zip(self.s_list, self.cc_pt_list)):
-                G_ux = transforms.d_ux_cc_transform_3dof(self.p_0, self.ux, self.uy, self.l, self.r, s)
-                G_uy = transforms.d_uy_cc_transform_3dof(self.p_0, self.ux, self.uy, self.l, self.r, s)
-                G_l = transforms.d_l_cc_transform_3dof(self.p_0, self.ux, self.uy, self.l, self.r, s)
+            if np.any(in_view):
+                k = np.argmax(in_view)
+                break
 
-                J[i * 3:(i + 1) * 3, 0] = G_ux
-                J[i * 3:(i + 1) * 3, 1] = G_uy
-                J[i * 3:(i + 1) * 3, 2] = G_l
+            ## Halving has reached a zero step, which the halving loop would repeat forever
+            if scales[-1] == 0:
+                print('[WARNING] View breach caught with a zero step, keeping the parameters')
+                k = len(scales) - 1
+                break
 
-                L = transforms.world_to_image_interaction_matrix(p, self.camera_extrinsics, self.fx, self.fy)
-                L_diag[i * 2:(i + 1) * 2, i * 3:(i + 1) * 3] = L
+            start = -int(np.log2(scales[-1])) + 1
+            scales = 2.0 ** -np.arange(start, start + VIEW_BREACH_LADDER_SIZE)
 
-        return L_diag @ J
+        if scales[k] < 1:
+            print('[WARNING] View breach caught, step scaled by ', scales[k])
+
+        self.ux = ux[k]
+        self.uy = uy[k]
+        self.l = q[k, 2]
+        self.cc_pt_list = list(pts[k])
+        self.cc_pt_list_2d = list(pts_2d[k])
+
+        return q[k], scales[k]
 
     def update_1dof_params(self, current_iter, noise_percentage=0):
         """
@@ -876,7 +872,8 @@ class CCCatheter:
                 The variance of that noise would be noise_percentage * feedback
         """
         self.calculate_p_diffs()
-        print('|p_diffs| = ', np.linalg.norm(self.p_diffs))
+        if self.verbose > 0:
+            print('|p_diffs| = ', np.linalg.norm(self.p_diffs))
 
         if self.loss_2d:
             J = self.calculate_jacobian_1dof_2d()
@@ -886,9 +883,10 @@ class CCCatheter:
         J_T = np.transpose(J)
 
         weight_matrix = self.weight_matrix[0, 0]
-        print('weight_matrix = ', weight_matrix)
+        if self.verbose > 0:
+            print('weight_matrix = ', weight_matrix)
 
-        d = np.linalg.pinv(J_T @ J + weight_matrix) @ J_T @ self.p_diffs
+        d = np.linalg.lstsq(J_T @ J + weight_matrix, J_T @ self.p_diffs, rcond=1e-15)[0]
         d_u = d[0, 0]
 
         self.u += d_u
@@ -908,7 +906,8 @@ class CCCatheter:
                 The variance of that noise would be noise_percentage * feedback
         """
         self.calculate_p_diffs()
-        print('|p_diffs| = ', np.linalg.norm(self.p_diffs))
+        if self.verbose > 0:
+            print('|p_diffs| = ', np.linalg.norm(self.p_diffs))
 
         if self.loss_2d:
             J = self.calculate_jacobian_2dof_2d()
@@ -918,9 +917,10 @@ class CCCatheter:
         J_T = np.transpose(J)
 
         weight_matrix = self.weight_matrix[:2, :2]
-        print('weight_matrix = ', weight_matrix)
+        if self.verbose > 0:
+            print('weight_matrix = ', weight_matrix)
 
-        d = np.linalg.pinv(J_T @ J + weight_matrix) @ J_T @ self.p_diffs
+        d = np.linalg.lstsq(J_T @ J + weight_matrix, J_T @ self.p_diffs, rcond=1e-15)[0]
         d_ux = d[0, 0]
         d_uy = d[1, 0]
 
@@ -929,23 +929,10 @@ class CCCatheter:
             d_ux = random.gauss(d_ux, noise_percentage * d_ux)
             d_uy = random.gauss(d_uy, noise_percentage * d_uy)
 
-        ux_old = self.ux
-        uy_old = self.uy
-
-        self.ux += d_ux
-        self.uy += d_uy
-
         ## View breach prevention
-        self.calculate_cc_points(-1)
-        while not self.convert_cc_points_to_2d(-1):
-            print('[WARNING] View breach caught')
-
-            d_ux /= 2
-            d_uy /= 2
-
-            self.ux = ux_old + d_ux
-            self.uy = uy_old + d_uy
-            self.calculate_cc_points(-1)
+        _, scale = self.take_in_view_step(np.array([self.ux, self.uy, self.l]), np.array([d_ux, d_uy, 0]))
+        d_ux *= scale
+        d_uy *= scale
 
         self.params[current_iter + 1, 0] = self.ux
         self.params[current_iter + 1, 1] = self.uy
@@ -967,7 +954,8 @@ class CCCatheter:
                 The variance of that noise would be noise_percentage * feedback
         """
         self.calculate_p_diffs()
-        print('|p_diffs| = ', np.linalg.norm(self.p_diffs))
+        if self.verbose > 0:
+            print('|p_diffs| = ', np.linalg.norm(self.p_diffs))
 
         if self.loss_2d:
             J = self.calculate_jacobian_3dof_2d()
@@ -977,9 +965,10 @@ class CCCatheter:
         J_T = np.transpose(J)
 
         weight_matrix = self.weight_matrix
-        print('weight_matrix = ', weight_matrix)
+        if self.verbose > 0:
+            print('weight_matrix = ', weight_matrix)
 
-        d = np.linalg.pinv(J_T @ J + weight_matrix) @ J_T @ self.p_diffs
+        d = np.linalg.lstsq(J_T @ J + weight_matrix, J_T @ self.p_diffs, rcond=1e-15)[0]
         d_ux = d[0, 0]
         d_uy = d[1, 0]
         d_l = d[2, 0]
@@ -990,27 +979,11 @@ class CCCatheter:
             d_uy = random.gauss(d_uy, noise_percentage * d_uy)
             d_l = random.gauss(d_l, noise_percentage * d_l)
 
-        ux_old = self.ux
-        uy_old = self.uy
-        l_old = self.l
-
-        self.ux += d_ux
-        self.uy += d_uy
-        self.l += d_l
-
         ## View breach prevention
-        self.calculate_cc_points(-1)
-        while not self.convert_cc_points_to_2d(-1):
-            print('[WARNING] View breach caught')
-
-            d_ux /= 2
-            d_uy /= 2
-            d_l /= 2
-
-            self.ux = ux_old + d_ux
-            self.uy = uy_old + d_uy
-            self.l = l_old + d_l
-            self.calculate_cc_points(-1)
+        _, scale = self.take_in_view_step(np.array([self.ux, self.uy, self.l]), np.array([d_ux, d_uy, d_l]))
+        d_ux *= scale
+        d_uy *= scale
+        d_l *= scale
 
         self.params[current_iter + 1, 0] = self.ux
         self.params[current_iter + 1, 1] = self.uy
@@ -1034,10 +1007,12 @@ class CCCatheter:
             noise_percentage: gaussian noise will be applied to the feedback. 
                 The variance of that noise would be noise_percentage * feedback
         """
-        print('Running 2-DOF Interspace (ux, uy) Parameterization')
+        if self.verbose > 0:
+            print('Running 2-DOF Interspace (ux, uy) Parameterization')
 
         self.calculate_p_diffs()
-        print('|p_diffs| = ', np.linalg.norm(self.p_diffs))
+        if self.verbose > 0:
+            print('|p_diffs| = ', np.linalg.norm(self.p_diffs))
 
         J = bezier_interspace_transforms.calculate_jacobian_2dof_ux_uy(self.p_0, self.ux, self.uy, self.l, self.r)
 
@@ -1045,26 +1020,15 @@ class CCCatheter:
             J = J[-3:, :]
 
         if self.loss_2d:
-
-            if self.tip_loss:
-                L_diag = transforms.world_to_image_interaction_matrix(self.cc_pt_list[-1], self.camera_extrinsics,
-                                                                      self.fx, self.fy)
-
-            else:
-                L_diag = np.zeros((2 * len(self.cc_pt_list), 3 * len(self.cc_pt_list)))
-
-                for i, p in enumerate(self.cc_pt_list):
-                    L = transforms.world_to_image_interaction_matrix(p, self.camera_extrinsics, self.fx, self.fy)
-                    L_diag[i * 2:(i + 1) * 2, i * 3:(i + 1) * 3] = L
-
-            J = L_diag @ J
+            J = self.calculate_interaction_matrix() @ J
 
         J_T = np.transpose(J)
 
         weight_matrix = self.weight_matrix[:2, :2]
-        print('weight_matrix = ', weight_matrix)
+        if self.verbose > 0:
+            print('weight_matrix = ', weight_matrix)
 
-        d = np.linalg.pinv(J_T @ J + weight_matrix) @ J_T @ self.p_diffs
+        d = np.linalg.lstsq(J_T @ J + weight_matrix, J_T @ self.p_diffs, rcond=1e-15)[0]
         d_ux = d[0, 0]
         d_uy = d[1, 0]
 
@@ -1073,23 +1037,10 @@ class CCCatheter:
             d_ux = random.gauss(d_ux, noise_percentage * d_ux)
             d_uy = random.gauss(d_uy, noise_percentage * d_uy)
 
-        ux_old = self.ux
-        uy_old = self.uy
-
-        self.ux += d_ux
-        self.uy += d_uy
-
         ## View breach prevention
-        self.calculate_cc_points(-1)
-        while not self.convert_cc_points_to_2d(-1):
-            print('[WARNING] View breach caught')
-
-            d_ux /= 2
-            d_uy /= 2
-
-            self.ux = ux_old + d_ux
-            self.uy = uy_old + d_uy
-            self.calculate_cc_points(-1)
+        _, scale = self.take_in_view_step(np.array([self.ux, self.uy, self.l]), np.array([d_ux, d_uy, 0]))
+        d_ux *= scale
+        d_uy *= scale
 
         self.params[current_iter + 1, 0] = self.ux
         self.params[current_iter + 1, 1] = self.uy
@@ -1110,10 +1061,12 @@ class CCCatheter:
             noise_percentage: gaussian noise will be applied to the feedback. 
                 The variance of that noise would be noise_percentage * feedback
         """
-        print('Running 3-DOF Interspace (ux, uy) Parameterization')
+        if self.verbose > 0:
+            print('Running 3-DOF Interspace (ux, uy) Parameterization')
 
         self.calculate_p_diffs()
-        print('|p_diffs| = ', np.linalg.norm(self.p_diffs))
+        if self.verbose > 0:
+            print('|p_diffs| = ', np.linalg.norm(self.p_diffs))
 
         J = bezier_interspace_transforms.calculate_jacobian_3dof_ux_uy(self.p_0, self.ux, self.uy, self.l, self.r)
 
@@ -1121,26 +1074,15 @@ class CCCatheter:
             J = J[-3:, :]
 
         if self.loss_2d:
-
-            if self.tip_loss:
-                L_diag = transforms.world_to_image_interaction_matrix(self.cc_pt_list[-1], self.camera_extrinsics,
-                                                                      self.fx, self.fy)
-
-            else:
-                L_diag = np.zeros((2 * len(self.cc_pt_list), 3 * len(self.cc_pt_list)))
-
-                for i, p in enumerate(self.cc_pt_list):
-                    L = transforms.world_to_image_interaction_matrix(p, self.camera_extrinsics, self.fx, self.fy)
-                    L_diag[i * 2:(i + 1) * 2, i * 3:(i + 1) * 3] = L
-
-            J = L_diag @ J
+            J = self.calculate_interaction_matrix() @ J
 
         J_T = np.transpose(J)
 
         weight_matrix = self.weight_matrix
-        print('weight_matrix = ', weight_matrix)
+        if self.verbose > 0:
+            print('weight_matrix = ', weight_matrix)
 
-        d = np.linalg.pinv(J_T @ J + weight_matrix) @ J_T @ self.p_diffs
+        d = np.linalg.lstsq(J_T @ J + weight_matrix, J_T @ self.p_diffs, rcond=1e-15)[0]
         d_ux = d[0, 0]
         d_uy = d[1, 0]
         d_l = d[2, 0]
@@ -1151,27 +1093,11 @@ class CCCatheter:
             d_uy = random.gauss(d_uy, noise_percentage * d_uy)
             d_l = random.gauss(d_l, noise_percentage * d_l)
 
-        ux_old = self.ux
-        uy_old = self.uy
-        l_old = self.l
-
-        self.ux += d_ux
-        self.uy += d_uy
-        self.l += d_l
-
         ## View breach prevention
-        self.calculate_cc_points(-1)
-        while not self.convert_cc_points_to_2d(-1):
-            print('[WARNING] View breach caught')
-
-            d_ux /= 2
-            d_uy /= 2
-            d_l /= 2
-
-            self.ux = ux_old + d_ux
-            self.uy = uy_old + d_uy
-            self.l = l_old + d_l
-            self.calculate_cc_points(-1)
+        _, scale = self.take_in_view_step(np.array([self.ux, self.uy, self.l]), np.array([d_ux, d_uy, d_l]))
+        d_ux *= scale
+        d_uy *= scale
+        d_l *= scale
 
         self.params[current_iter + 1, 0] = self.ux
         self.params[current_iter + 1, 1] = self.uy
@@ -1195,10 +1121,12 @@ class CCCatheter:
             noise_percentage: gaussian noise will be applied to the feedback. 
                 The variance of that noise would be noise_percentage * feedback
         """
-        print('Running 2-DOF Interspace (theta, phi) Parameterization')
+        if self.verbose > 0:
+            print('Running 2-DOF Interspace (theta, phi) Parameterization')
 
         self.calculate_p_diffs()
-        print('|p_diffs| = ', np.linalg.norm(self.p_diffs))
+        if self.verbose > 0:
+            print('|p_diffs| = ', np.linalg.norm(self.p_diffs))
 
         theta = np.sqrt(self.ux**2 + self.uy**2) / self.r
         phi = np.arctan2(self.uy, self.ux)
@@ -1222,26 +1150,15 @@ class CCCatheter:
             J = J[-3:, :]
 
         if self.loss_2d:
-
-            if self.tip_loss:
-                L_diag = transforms.world_to_image_interaction_matrix(self.cc_pt_list[-1], self.camera_extrinsics,
-                                                                      self.fx, self.fy)
-
-            else:
-                L_diag = np.zeros((2 * len(self.cc_pt_list), 3 * len(self.cc_pt_list)))
-
-                for i, p in enumerate(self.cc_pt_list):
-                    L = transforms.world_to_image_interaction_matrix(p, self.camera_extrinsics, self.fx, self.fy)
-                    L_diag[i * 2:(i + 1) * 2, i * 3:(i + 1) * 3] = L
-
-            J = L_diag @ J
+            J = self.calculate_interaction_matrix() @ J
 
         J_T = np.transpose(J)
 
         weight_matrix = self.weight_matrix[:2, :2]
-        print('weight_matrix = ', weight_matrix)
+        if self.verbose > 0:
+            print('weight_matrix = ', weight_matrix)
 
-        d = np.linalg.pinv(J_T @ J + weight_matrix) @ J_T @ self.p_diffs
+        d = np.linalg.lstsq(J_T @ J + weight_matrix, J_T @ self.p_diffs, rcond=1e-15)[0]
         d_theta = d[0, 0]
         d_phi = d[1, 0]
 
@@ -1250,29 +1167,11 @@ class CCCatheter:
             d_theta = random.gauss(d_theta, noise_percentage * d_theta)
             d_phi = random.gauss(d_phi, noise_percentage * d_phi)
 
-        theta_old = theta
-        phi_old = phi
-
-        theta += d_theta
-        phi += d_phi
-
-        self.ux = bezier_interspace_transforms.calculate_ux(theta, phi, self.r)
-        self.uy = bezier_interspace_transforms.calculate_uy(theta, phi, self.r)
-
         ## View breach prevention
-        self.calculate_cc_points(-1)
-        while not self.convert_cc_points_to_2d(-1):
-            print('[WARNING] View breach caught')
-
-            d_theta /= 2
-            d_phi /= 2
-
-            theta = theta_old + d_theta
-            phi = phi_old + d_phi
-
-            self.ux = bezier_interspace_transforms.calculate_ux(theta, phi, self.r)
-            self.uy = bezier_interspace_transforms.calculate_uy(theta, phi, self.r)
-            self.calculate_cc_points(-1)
+        q, scale = self.take_in_view_step(np.array([theta, phi, self.l]), np.array([d_theta, d_phi, 0]), theta_phi=True)
+        theta, phi, _ = q
+        d_theta *= scale
+        d_phi *= scale
 
         self.params[current_iter + 1, 0] = self.ux
         self.params[current_iter + 1, 1] = self.uy
@@ -1295,10 +1194,12 @@ class CCCatheter:
             noise_percentage: gaussian noise will be applied to the feedback. 
                 The variance of that noise would be noise_percentage * feedback
         """
-        print('Running 3-DOF Interspace (theta, phi) Parameterization')
+        if self.verbose > 0:
+            print('Running 3-DOF Interspace (theta, phi) Parameterization')
 
         self.calculate_p_diffs()
-        print('|p_diffs| = ', np.linalg.norm(self.p_diffs))
+        if self.verbose > 0:
+            print('|p_diffs| = ', np.linalg.norm(self.p_diffs))
 
         theta = np.sqrt(self.ux**2 + self.uy**2) / self.r
         phi = np.arctan2(self.uy, self.ux)
@@ -1322,26 +1223,15 @@ class CCCatheter:
             J = J[-3:, :]
 
         if self.loss_2d:
-
-            if self.tip_loss:
-                L_diag = transforms.world_to_image_interaction_matrix(self.cc_pt_list[-1], self.camera_extrinsics,
-                                                                      self.fx, self.fy)
-
-            else:
-                L_diag = np.zeros((2 * len(self.cc_pt_list), 3 * len(self.cc_pt_list)))
-
-                for i, p in enumerate(self.cc_pt_list):
-                    L = transforms.world_to_image_interaction_matrix(p, self.camera_extrinsics, self.fx, self.fy)
-                    L_diag[i * 2:(i + 1) * 2, i * 3:(i + 1) * 3] = L
-
-            J = L_diag @ J
+            J = self.calculate_interaction_matrix() @ J
 
         J_T = np.transpose(J)
 
         weight_matrix = self.weight_matrix
-        print('weight_matrix = ', weight_matrix)
+        if self.verbose > 0:
+            print('weight_matrix = ', weight_matrix)
 
-        d = np.linalg.pinv(J_T @ J + weight_matrix) @ J_T @ self.p_diffs
+        d = np.linalg.lstsq(J_T @ J + weight_matrix, J_T @ self.p_diffs, rcond=1e-15)[0]
         d_theta = d[0, 0]
         d_phi = d[1, 0]
         d_l = d[2, 0]
@@ -1352,33 +1242,12 @@ class CCCatheter:
             d_phi = random.gauss(d_phi, noise_percentage * d_phi)
             d_l = random.gauss(d_l, noise_percentage * d_l)
 
-        theta_old = theta
-        phi_old = phi
-        l_old = self.l
-
-        theta += d_theta
-        phi += d_phi
-
-        self.ux = bezier_interspace_transforms.calculate_ux(theta, phi, self.r)
-        self.uy = bezier_interspace_transforms.calculate_uy(theta, phi, self.r)
-        self.l += d_l
-
         ## View breach prevention
-        self.calculate_cc_points(-1)
-        while not self.convert_cc_points_to_2d(-1):
-            print('[WARNING] View breach caught')
-
-            d_theta /= 2
-            d_phi /= 2
-            d_l /= 2
-
-            theta = theta_old + d_theta
-            phi = phi_old + d_phi
-
-            self.ux = bezier_interspace_transforms.calculate_ux(theta, phi, self.r)
-            self.uy = bezier_interspace_transforms.calculate_uy(theta, phi, self.r)
-            self.l = l_old + d_l
-            self.calculate_cc_points(-1)
+        q, scale = self.take_in_view_step(np.array([theta, phi, self.l]), np.array([d_theta, d_phi, d_l]), theta_phi=True)
+        theta, phi, _ = q
+        d_theta *= scale
+        d_phi *= scale
+        d_l *= scale
 
         self.params[current_iter + 1, 0] = self.ux
         self.params[current_iter + 1, 1] = self.uy
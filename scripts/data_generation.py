@@ -3,9 +3,16 @@ import numpy as np
 import transforms
 
 
+## Smallest number of candidates proposed at once by generate_data
+MIN_BLOCK_SIZE = 256
+
+## Largest number of repair rounds of generate_stratified_data
+MAX_STRATIFIED_ROUNDS = 1000
+
+
 class DataGeneration:
 
-    def __init__(self, n_data, p_0, r, l, s_list, save_path):
+    def __init__(self, n_data, p_0, r, l, s_list, save_path, sampling='random'):
         """
         Args:
             n_data (int): number of data points (variations of parameters as test cases) to generate
@@ -15,15 +22,27 @@ class DataGeneration:
             s_list (list of s values): s values of points on the constant curvature curve except for
                 the start point. s values are floats from 0 to 1 inclusive
             save_path (path string to npy file): path to save the generated data
+            sampling ('random', 'stratified', or 'sobol'): how candidates are drawn from the target ranges.
+                'random' draws from the random module seeded with 0 and reproduces the data of earlier versions;
+                'stratified' draws a jittered Latin hypercube of n_data rows whose rows outside of the view are
+                redrawn within their strata, see generate_stratified_data;
+                'sobol' draws a scrambled Sobol sequence (needs scipy)
         """
+        if sampling not in ('random', 'stratified', 'sobol'):
+            print('[ERROR] [DataGeneration] Sampling invalid: ', sampling)
+            exit()
+
         self.n_data = n_data
         self.p_0 = p_0
         self.r = r
         self.l = l
         self.save_path = save_path
         self.s_list = s_list
+        self.sampling = sampling
 
         random.seed(0)
+        self.rng = np.random.default_rng(0)
+        self.sobol_sampler = None
 
     
     def set_target_ranges(self, ux_min, ux_max, uy_min, uy_max, l_min, l_max):
@@ -79,19 +98,32 @@ class DataGeneration:
             (bool): whether the given targets result in the end point of catheter falling outside
                 of camera view
         """
-        for s in self.s_list:
+        return bool(self.check_view_boundary_batch(ux_target, uy_target, l_target)[0])
+
+
+    def check_view_boundary_batch(self, ux_target, uy_target, l_target):
+        """
+        Check check_view_boundary for a batch of candidates, all s values in one pass
 
-            p_3d = transforms.cc_transform_3dof(self.p_0, ux_target, uy_target, l_target, self.r, s)
-            p_2d = transforms.world_to_image_transform(p_3d, self.camera_extrinsics, self.fx, self.fy, self.cx, self.cy)
+        Args:
+            ux_target ((n,) numpy array or float): 1st pair of tendon length (responsible for catheter bending)
+            uy_target ((n,) numpy array or float): 2nd pair of tendon length (responsible for catheter bending)
+            l_target ((n,) numpy array or float): length of bending portion of the catheter (responsible for insertion)
+
+        Returns:
+            ((n,) bool numpy array): output of check_view_boundary for each candidate
+        """
+        p_3d = transforms.cc_transform_3dof_batch(self.p_0, ux_target, uy_target, l_target, self.r, self.s_list)
 
-            p_2d[0] = round(self.size_x - p_2d[0])
-            p_2d[1] = round(p_2d[1])
+        p_2d = transforms.world_to_image_transform_batch(p_3d, self.camera_extrinsics, self.fx, self.fy, self.cx, self.cy)
 
-            #if p_2d[0] >= self.size_x or p_2d[0] < 0 or p_2d[1] >= self.size_y or p_2d[1] < 0:  
-            if p_2d[0] >= self.size_x - 5 or p_2d[0] < 5 or p_2d[1] >= self.size_y - 5 or p_2d[1] < 5:                
-                return False
+        p_x = np.round(self.size_x - p_2d[..., 0])
+        p_y = np.round(p_2d[..., 1])
 
-        return True
+        #in_view = (p_x < self.size_x) & (p_x >= 0) & (p_y < self.size_y) & (p_y >= 0)
+        in_view = (p_x < self.size_x - 5) & (p_x >= 5) & (p_y < self.size_y - 5) & (p_y >= 5)
+
+        return np.all(in_view, axis=-1)
 
 
     def generate_random_float(self, range_min, range_max):
@@ -101,31 +133,128 @@ class DataGeneration:
         return random.random() * (range_max - range_min) + range_min
 
 
+    def generate_unit_candidates(self, n):
+        """
+        Draw candidates in the unit cube according to self.sampling, 'random' or 'sobol'
+
+        Args:
+            n (int): number of candidates
+
+        Returns:
+            ((n, 3) numpy array): candidates, one row per candidate in the order they are proposed
+        """
+        if self.sampling == 'random':
+            ## Same order of draws as one (ux, uy, l) triple at a time
+            return np.array([random.random() for _ in range(3 * n)]).reshape(n, 3)
+
+        if self.sobol_sampler is None:
+            from scipy.stats import qmc
+            self.sobol_sampler = qmc.Sobol(3, scramble=True, seed=0)
+
+        ## Sobol points are balanced in blocks of powers of 2
+        return self.sobol_sampler.random(2 ** int(np.ceil(np.log2(n))))
+
+
+    def is_valid_batch(self, candidates):
+        """
+        Args:
+            candidates ((n, 3) numpy array): (ux, uy, l) targets
+
+        Returns:
+            ((n,) bool numpy array): whether the catheter stays in view with each target, both with its l and with the initial l
+        """
+        ux_target, uy_target, l_target = candidates.T
+
+        ## Boundary with the generated l_target and the initial l must both be checked to accomodate both 2-DOF and 3-DOF experiments
+        return self.check_view_boundary_batch(ux_target, uy_target, l_target) & self.check_view_boundary_batch(ux_target, uy_target, self.l)
+
+
+    def generate_stratified_data(self, range_min, range_max):
+        """
+        Draw a jittered Latin hypercube of n_data rows that all fall in view
+
+        Args:
+            range_min ((3,) numpy array): minimum of (ux, uy, l)
+            range_max ((3,) numpy array): maximum of (ux, uy, l)
+
+        Returns:
+            ((n_data, 3) numpy array): targets, exactly one per each of the n_data strata of every parameter
+            (int): number of candidates tested
+
+        Note:
+            Each round redraws the rows outside of the view within their strata, then swaps one stratum of each of
+                them with a random row, which keeps the design a Latin hypercube
+        """
+        n = self.n_data
+        strata = np.argsort(self.rng.random((3, n)), axis=1).T
+        candidates = (strata + self.rng.random((n, 3))) / n * (range_max - range_min) + range_min
+        valid = self.is_valid_batch(candidates)
+        n_iter = n
+
+        for _ in range(MAX_STRATIFIED_ROUNDS):
+            invalid_indices = np.nonzero(~valid)[0]
+            print('n_iter = ', n_iter, ' n_valid_data = ', n - len(invalid_indices))
+
+            if len(invalid_indices) == 0:
+                return candidates, n_iter
+
+            swap_dims = self.rng.integers(3, size=len(invalid_indices))
+            swap_indices = self.rng.integers(n, size=len(invalid_indices))
+
+            for i, j, d in zip(invalid_indices, swap_indices, swap_dims):
+                strata[[i, j], d] = strata[[j, i], d]
+
+            redrawn = np.union1d(invalid_indices, swap_indices)
+            candidates[redrawn] = (strata[redrawn] + self.rng.random((len(redrawn), 3))) / n * (range_max - range_min) + range_min
+            valid[redrawn] = self.is_valid_batch(candidates[redrawn])
+            n_iter += len(redrawn)
+
+        print('[ERROR] [DataGeneration] No stratified design in view found in ', MAX_STRATIFIED_ROUNDS, ' rounds')
+        exit()
+
+
     def generate_data(self):
         """
         Generate a certain number of data within the specified parameter ranges and
-            save the data in a given path 
+            save the data in a given path
+
+        Note:
+            Candidates are proposed in blocks and tested against the view boundary in one vectorized pass;
+                accepted candidates are kept in the order they are proposed until n_data are collected.
+                With 'stratified' sampling the whole design is drawn at once by generate_stratified_data
         """
         self.generated_data = np.zeros((self.n_data, 3))
 
+        range_min = np.array([self.ux_min, self.uy_min, self.l_min])
+        range_max = np.array([self.ux_max, self.uy_max, self.l_max])
+
         n_iter = 0
         n_valid_data = 0
 
+        if self.sampling == 'stratified':
+            self.generated_data, n_iter = self.generate_stratified_data(range_min, range_max)
+            n_valid_data = self.n_data
+
         while n_valid_data < self.n_data:
 
-            print('n_iter = ', n_iter, ' n_valid_data = ', n_valid_data)
+            ## Propose about twice the missing data, based on the acceptance rate so far
+            acceptance_rate = max(n_valid_data / n_iter, 0.01) if n_iter else 1.0
+            n_candidates = max(int(2 * (self.n_data - n_valid_data) / acceptance_rate), MIN_BLOCK_SIZE)
 
-            ux_target = self.generate_random_float(self.ux_min, self.ux_max)
-            uy_target = self.generate_random_float(self.uy_min, self.uy_max)
-            l_target = self.generate_random_float(self.l_min, self.l_max)
+            candidates = self.generate_unit_candidates(n_candidates) * (range_max - range_min) + range_min
+            valid = self.is_valid_batch(candidates)
+            valid_indices = np.nonzero(valid)[0][:self.n_data - n_valid_data]
 
-            ## Boundary with the generated l_target and the initial l must both be checked to accomodate both 2-DOF and 3-DOF experiments
-            if self.check_view_boundary(ux_target, uy_target, l_target) and self.check_view_boundary(ux_target, uy_target, self.l):
-                self.generated_data[n_valid_data, :] = np.array([ux_target, uy_target, l_target])
-                n_valid_data += 1
+            self.generated_data[n_valid_data:n_valid_data + len(valid_indices), :] = candidates[valid_indices]
+            n_valid_data += len(valid_indices)
+
+            if n_valid_data < self.n_data:
+                n_iter += candidates.shape[0]
+            else:
+                n_iter += valid_indices[-1] + 1
+
+            print('n_iter = ', n_iter, ' n_valid_data = ', n_valid_data)
 
-            n_iter += 1
-        
         print('Generated ', n_valid_data, ' data in ', n_iter, ' iterations:')
         print(self.generated_data)
 
@@ -38,7 +38,12 @@ from tqdm.notebook import tqdm
 
 class DiffOptimizeModel(nn.Module):
 
-    def __init__(self, para_init, p_start, image_ref, cylinder_primitive_path, gpu_or_cpu):
+    def __init__(self, para_init, p_start, image_ref, gpu_or_cpu, cylinder_primitive_path=None):
+        """
+        Args:
+            cylinder_primitive_path (path string to obj file): no longer read, the cylinder primitive is built
+                procedurally for the tube sampling of build_bezier
+        """
         super().__init__()
 
         self.build_bezier = ConstructionBezier()
@@ -47,7 +52,8 @@ class DiffOptimizeModel(nn.Module):
         self.torch3d_render_catheter = DiffRenderCatheter(self.build_bezier.cam_RT_H, self.build_bezier.cam_K,
                                                           gpu_or_cpu)
         self.torch3d_render_catheter.to(gpu_or_cpu)
-        self.torch3d_render_catheter.loadCylinderPrimitive(cylinder_primitive_path)
+        self.torch3d_render_catheter.setCylinderPrimitive(self.build_bezier.bezier_num_samples,
+                                                          self.build_bezier.bezier_surface_resolution)
 
         self.mask_loss = MaskLoss(device=gpu_or_cpu)
         self.mask_loss.to(gpu_or_cpu)
@@ -22,6 +22,57 @@ import torch.nn as nn
 
 import pdb
 
+## Weights of (p_start, p_c1, p_c2, p_end) along the cubic Bezier curve, keyed by (number of samples, device)
+BEZIER_BASIS_CACHE = {}
+
+## Cosine and sine of the angles around the tube surface, keyed by (surface resolution, device)
+SURFACE_RING_CACHE = {}
+
+
+def getBezierBasis(num_samples, device):
+    """
+    Args:
+        num_samples (int): number of samples along the curve, from s = 0 to s = 1
+        device (torch.device): device of the tables
+
+    Returns:
+        (dict of (num_samples, 4) tensor): weights of the control points (p_start, p_c1, p_c2, p_end) for the
+            position 'pos', the derivative 'der', the derivative divided by 3 'der_third', and the second
+            derivative 'snd_der' (as written in the original per-sample loops)
+    """
+    key = (num_samples, str(device))
+
+    if key not in BEZIER_BASIS_CACHE:
+        s = torch.linspace(0, 1, num_samples).to(device).unsqueeze(1)
+
+        BEZIER_BASIS_CACHE[key] = {
+            'pos': torch.cat(((1 - s)**3, 3 * s * (1 - s)**2, 3 * (1 - s) * s**2, s**3), dim=1),
+            'der': torch.cat((-3 * (1 - s)**2, 3 * (1 - s)**2 - 6 * (1 - s) * s, 6 * (1 - s) * s - 3 * s**2, 3 * s**2), dim=1),
+            'der_third': torch.cat((-(1 - s)**2, (1 - s)**2 - 2 * s * (1 - s), -s**2 + 2 * (1 - s) * s, s**2), dim=1),
+            'snd_der': torch.cat((6 * (1 - s), -12 * (1 - s) + 6 * s, 6 * (1 - s) - 12 * s, 6 * s), dim=1),
+        }
+
+    return BEZIER_BASIS_CACHE[key]
+
+
+def getSurfaceRing(resolution, device):
+    """
+    Args:
+        resolution (int): number of vertices around the tube, angles from 0 to 2 pi
+        device (torch.device): device of the tables
+
+    Returns:
+        cos_theta ((resolution,) tensor): cosine of the angles
+        sin_theta ((resolution,) tensor): sine of the angles
+    """
+    key = (resolution, str(device))
+
+    if key not in SURFACE_RING_CACHE:
+        theta_list = torch.linspace(0.0, 2 * np.pi, resolution).to(device)
+        SURFACE_RING_CACHE[key] = (torch.cos(theta_list), torch.sin(theta_list))
+
+    return SURFACE_RING_CACHE[key]
+
 
 class ConstructionBezier(nn.Module):
 
@@ -85,19 +136,13 @@ class ConstructionBezier(nn.Module):
         p_c1 = 4 / 3 * p_mid - 1 / 3 * p_end
         # self.control_pts = torch.vstack((p_start, c2, p_end, c1))
 
-        sample_list = torch.linspace(0, 1, self.bezier_num_samples)
+        # Get positions and normals from samples along bezier curve, as weighted sums of the control points
+        control_pts = torch.stack((p_start, p_c1, p_c2, p_end))
+        basis = getBezierBasis(self.bezier_num_samples, control_pts.device)
 
-        # Get positions and normals from samples along bezier curve
-        self.bezier_pos = torch.zeros(self.bezier_num_samples, 3)
-        self.bezier_der = torch.zeros(self.bezier_num_samples, 3)
-        self.bezier_snd_der = torch.zeros(self.bezier_num_samples, 3)
-        for i, s in enumerate(sample_list):
-            self.bezier_pos[i, :] = (1 - s)**3 * p_start + 3 * s * (1 - s)**2 * \
-                p_c1 + 3 * (1 - s) * s**2 * p_c2 + s**3 * p_end
-            self.bezier_der[i, :] = -(1 - s)**2 * p_start + ((1 - s)**2 - 2 * s *
-                                                             (1 - s)) * p_c1 + (-s**2 + 2 *
-                                                                                (1 - s) * s) * p_c2 + s**2 * p_end
-            self.bezier_snd_der[i, :] = 6 * (1 - s) * (p_c2 - 2 * p_c1 + p_start) + 6 * s * (p_end - 2 * p_c2 + p_c1)
+        self.bezier_pos = torch.matmul(basis['pos'].to(control_pts.dtype), control_pts).float()
+        self.bezier_der = torch.matmul(basis['der_third'].to(control_pts.dtype), control_pts).float()
+        self.bezier_snd_der = torch.matmul(basis['snd_der'].to(control_pts.dtype), control_pts).float()
 
         # Convert positions and normals to camera frame
         pos_bezier_H = torch.cat((self.bezier_pos, torch.ones(self.bezier_num_samples, 1)), dim=1)
@@ -107,11 +152,6 @@ class ConstructionBezier(nn.Module):
         self.bezier_pos_cam = bezier_pos_cam_H[:, :-1]
 
 
-        der_bezier_H = torch.cat((self.bezier_der, torch.zeros((self.bezier_num_samples, 1))), dim=1)
-        bezier_der_cam_H = torch.transpose(torch.matmul(self.cam_RT_H, torch.transpose(der_bezier_H[1:, :], 0, 1)), 0,
-                                           1)
-        self.bezier_der_cam = bezier_der_cam_H[:, :-1]
-
         der_bezier_H = torch.cat((self.bezier_der, torch.zeros((self.bezier_num_samples, 1))), dim=1)
         bezier_der_cam_H = torch.transpose(torch.matmul(self.cam_RT_H, torch.transpose(der_bezier_H[1:, :], 0, 1)), 0,
                                            1)
@@ -169,19 +209,14 @@ class ConstructionBezier(nn.Module):
 
     def getBezierSurface(self, bezier_pos):
 
-        self.bezier_surface = torch.zeros(self.bezier_num_samples, self.bezier_surface_resolution, 3)
-
-        theta_list = torch.linspace(0.0, 2 * np.pi, self.bezier_surface_resolution)
-
-        # pdb.set_trace()
+        cos_theta, sin_theta = getSurfaceRing(self.bezier_surface_resolution, bezier_pos.device)
 
-        for i in range(self.bezier_num_samples):
-            surface_vec = self.bezier_radius * (
-                -torch.mul(self.bezier_normal[i, :], torch.unsqueeze(torch.cos(theta_list), dim=1)) +
-                torch.mul(self.bezier_binormal[i, :], torch.unsqueeze(torch.sin(theta_list), dim=1)))
+        # (num_samples, resolution, 3) : ring of each sample in its normal-binormal plane
+        surface_vec = self.bezier_radius * (-torch.mul(self.bezier_normal.unsqueeze(1), cos_theta.view(1, -1, 1)) +
+                                            torch.mul(self.bezier_binormal.unsqueeze(1), sin_theta.view(1, -1, 1)))
 
-            # self.bezier_surface[i, :, :] = self.bezier_pos[i, :] + surface_vec
-            self.bezier_surface[i, :, :] = bezier_pos[i, :] + surface_vec
+        # self.bezier_surface = self.bezier_pos.unsqueeze(1) + surface_vec
+        self.bezier_surface = (bezier_pos.unsqueeze(1) + surface_vec).float()
 
         ### Combine the surface with "top center" + "bottom center" points
         surface_vertices = torch.reshape(self.bezier_surface, (-1, 3))
@@ -0,0 +1,241 @@
+import sys
+
+sys.path.append('..')
+
+import os
+import time
+import multiprocessing
+import numpy as np
+
+import torch
+
+import cv2
+
+from build_diff_model import DiffOptimizeModel
+from diff_octupus_real_data_F_quadratic_only_endeffector import DoDiffOptimization
+
+## Data loaded once by the driver and handed to every worker, see initWorker
+shared_data = {}
+
+
+def initWorker(data, n_threads):
+    """
+    Receive the data shared by all frames and limit the threads of the worker so that the workers do not
+        oversubscribe the cores
+    """
+    torch.set_num_threads(n_threads)
+    shared_data.update(data)
+
+
+def getErrorByArcLength(ref_pts, render_pts):
+    """
+    Mean distance between the rendered points and the reference points at the same normalized arc length,
+        as computed by error_octupus_real_data_F_quadratic_only_endeffector.py
+
+    Args:
+        ref_pts ((n, d) numpy array): reference skeleton (2D) or centerline (3D)
+        render_pts ((m, d) numpy array): reconstructed skeleton or centerline
+
+    Returns:
+        (float): mean error, nan if the rendered curve has more points than the reference
+    """
+    if render_pts.shape[0] > ref_pts.shape[0]:
+        return np.nan
+
+    dis_sum_render = np.hstack((np.array([0]), np.cumsum(np.linalg.norm(np.diff(render_pts, axis=0), axis=1))))
+    dis_sum_render = dis_sum_render / dis_sum_render[-1]
+
+    dis_sum_ref = np.hstack((np.array([0]), np.cumsum(np.linalg.norm(np.diff(ref_pts, axis=0), axis=1))))
+    dis_sum_ref = dis_sum_ref / dis_sum_ref[-1]
+
+    index = np.argmin(np.abs(dis_sum_render[:, None] - dis_sum_ref[None, :]), axis=1)
+
+    return np.mean(np.linalg.norm(ref_pts[index, :] - render_pts, axis=1))
+
+
+def drawFrameInit(init_random, init_random_std, frame_id):
+    """
+    Offset of the initial parameters of one frame from its 4 key points
+
+    Args:
+        init_random (tensor): offset shared by all frames
+        init_random_std (float or None): standard deviation of a perturbation of init_random drawn for this frame,
+            None to start every frame from the shared offset
+        frame_id (int): frame id, seeds the draw so that it does not depend on which worker runs the frame
+
+    Returns:
+        (tensor): offset of the initial parameters, the radius scale (last entry) is never perturbed
+    """
+    if init_random_std is None:
+        return init_random
+
+    generator = torch.Generator().manual_seed(frame_id)
+    perturbation = init_random_std * torch.randn(init_random.shape, generator=generator)
+    perturbation[-1] = 0
+
+    return init_random + perturbation
+
+
+def reconstructFrame(job):
+    """
+    Reconstruct one frame of the dataset
+
+    Args:
+        job (tuple): (index of the frame in the frame list, frame id)
+
+    Returns:
+        (dict): frame_id, error_2d, error_3d, n_itr, time, and para (final parameters)
+    """
+    selected_frame_id, frame_id = job
+    start_time = time.time()
+
+    sim_case = shared_data['sim_case']
+    gpu_or_cpu = shared_data['gpu_or_cpu']
+
+    frame_naming = sim_case + 'left_recif_binary_' + str(frame_id)
+    img_save_path = frame_naming + '.jpg'
+    img_raw_path = sim_case + 'left_recif_raw_' + str(frame_id) + '.jpg'
+
+    ### loading ground truth data
+    gt_centline_3d = np.load(sim_case + 'centerlines_denosie/centerline_denosie_' + str(frame_id) + '.npy')
+
+    pt0 = gt_centline_3d[0, :].copy()
+    pt2 = gt_centline_3d[-1, :].copy()
+    pt2[0] = pt0[0]
+    pt2[2] = pt0[2]
+    pt1 = (pt0 + pt2) / 2
+
+    radius_scale = np.array([20])
+
+    para_gt = torch.cat((torch.from_numpy(pt1), torch.from_numpy(pt2), torch.from_numpy(radius_scale)))
+    para_start = torch.from_numpy(pt0).to(gpu_or_cpu)
+
+    para_init = torch.cat((torch.from_numpy(pt1), torch.from_numpy(pt2), torch.from_numpy(radius_scale))).to(gpu_or_cpu)
+    para_init = para_init + drawFrameInit(shared_data['init_random'], shared_data['init_random_std'], frame_id).to(gpu_or_cpu)
+    para_init.requires_grad = True
+
+    img_ref_rgb = cv2.imread(img_save_path)
+    img_raw_rgb = cv2.imread(img_raw_path)
+    img_ref_gray = cv2.cvtColor(img_ref_rgb, cv2.COLOR_RGB2GRAY)
+    ret, img_ref_thre = cv2.threshold(img_ref_gray.copy(), 245, 255, cv2.THRESH_BINARY_INV)
+
+    img_ref_thre_inv = cv2.bitwise_not(img_ref_thre)
+    img_ref_binary = np.where(img_ref_thre_inv == 255, 1, img_ref_thre_inv)
+
+    diff_model = DiffOptimizeModel(para_init=para_init,
+                                   para_start=para_start,
+                                   radius_gt_3d=torch.from_numpy(shared_data['radius_gt']).to(gpu_or_cpu),
+                                   image_ref=img_ref_binary,
+                                   image_ref_rgb=img_ref_rgb,
+                                   gt_centline_3d=gt_centline_3d,
+                                   cam_K=shared_data['cam_K_mat'],
+                                   cam_RT_H=shared_data['cam_RT_H_mat'],
+                                   selected_frame_id=selected_frame_id,
+                                   gpu_or_cpu=gpu_or_cpu).to(gpu_or_cpu)
+
+    do_diff = DoDiffOptimization(para_init=diff_model.para_init,
+                                 para_gt=para_gt,
+                                 diff_model=diff_model,
+                                 total_itr_steps=shared_data['total_itr_steps'],
+                                 img_raw_rgb=img_raw_rgb,
+                                 data_frame_id=frame_id,
+                                 if_print_log=0,
+                                 resolution_schedule=shared_data['resolution_schedule'])
+
+    do_diff.doOptimization()
+
+    return {
+        'frame_id': frame_id,
+        'error_2d': getErrorByArcLength(diff_model.ref_skeleton, diff_model.bezier_proj_img_npy),
+        'error_3d': getErrorByArcLength(gt_centline_3d, diff_model.bezier_pos_npy),
+        'n_itr': do_diff.id_iteration,
+        'time': time.time() - start_time,
+        'para': do_diff.para_init.cpu().detach().numpy(),
+    }
+
+
+if __name__ == '__main__':
+
+    sim_case = '/media/fei/DATA_Fei/Datasets/Octupus_Arm/octupus_data_F/binary_crop/'
+    frame_id_list = (93, 94, 95, 97, 98, 104, 105, 108, 109, 110, 111, 112, \
+                    113, 114, 115, 116, 117, 118, 119, 120, \
+                    121, 122, 123, 124, 125, 135, 136, 137, \
+                    138, 139, 140, 147)
+
+    result_table_path = '/home/fei/icra2023_diff_catheter/scripts/diff_render_octupus/torch3d_rendered_imgs/real_dataset_render/error_table.csv'
+
+    total_itr_steps = 200
+    n_workers = os.cpu_count()
+    n_workers_gpu = 1  ## workers sharing the GPU, each one holding its own CUDA context, model, and renderer
+
+    ## Coarse-to-fine levels, same setting as the single-frame script, see DoDiffOptimization
+    resolution_schedule = None
+
+    ## Set the cuda device
+    if torch.cuda.is_available():
+        gpu_or_cpu = torch.device("cuda:0")
+        torch.cuda.set_device(gpu_or_cpu)
+        n_workers = min(n_workers, n_workers_gpu)
+    else:
+        gpu_or_cpu = torch.device("cpu")
+
+    ## frame 93 - 94 : mask + 4 key, see diff_octupus_real_data_F_quadratic_only_endeffector.py
+    ## With init_random_std None every frame starts from this same offset, as in the single-frame script;
+    ## otherwise each frame draws its own perturbation of it, see drawFrameInit
+    init_random = torch.tensor([-2.0, 8.0, -5.0, 5.0, -6.0, -35.0, 0.0], dtype=torch.float)
+    init_random_std = None
+
+    ## Everything that does not depend on the frame is loaded once here instead of once per frame
+    data = {
+        'sim_case': sim_case,
+        'gpu_or_cpu': gpu_or_cpu,
+        'total_itr_steps': total_itr_steps,
+        'resolution_schedule': resolution_schedule,
+        'init_random': init_random,
+        'init_random_std': init_random_std,
+        'radius_gt': np.load(sim_case + 'radius_data.npy'),
+        'cam_RT_H_mat': np.load(sim_case + 'left_cam_RT_H_crop.npy'),
+        'cam_K_mat': np.load(sim_case + 'left_cam_K_crop.npy'),
+    }
+
+    jobs = list(enumerate(frame_id_list))
+    n_workers = max(1, min(n_workers, len(jobs)))
+    n_threads = max(1, (os.cpu_count() or 1) // n_workers)
+
+    start_time = time.time()
+    results = []
+
+    if n_workers == 1:
+        initWorker(data, n_threads)
+        results = [reconstructFrame(job) for job in jobs]
+    else:
+        ## CUDA cannot be used in forked processes
+        if gpu_or_cpu.type == 'cuda':
+            context = multiprocessing.get_context('spawn')
+        else:
+            context = multiprocessing.get_context()
+
+        with context.Pool(n_workers, initializer=initWorker, initargs=(data, n_threads)) as pool:
+            for result in pool.imap_unordered(reconstructFrame, jobs):
+                results.append(result)
+                print('[' + str(len(results)) + '/' + str(len(jobs)) + '] frame ' + str(result['frame_id']) + ' in ' + str(round(result['time'], 1)) + 's')
+                sys.stdout.flush()
+
+    results.sort(key=lambda result: result['frame_id'])
+
+    ## frame_id, error_2d, error_3d, n_itr, time
+    error_table = np.array([[result['frame_id'], result['error_2d'], result['error_3d'], result['n_itr'], result['time']] for result in results])
+    np.savetxt(result_table_path, error_table, delimiter=',', fmt='%f', header='frame_id,error_2d,error_3d,n_itr,time')
+
+    for result in results:
+        if np.isnan(result['error_2d']) or np.isnan(result['error_3d']):
+            print("this frame has error : ", result['frame_id'])
+
+    print("==============================================")
+    print('2d average error is : ', np.nanmean(error_table[:, 1]))
+    print('std_error_2d     is : ', np.nanstd(error_table[:, 1]))
+    print('3d average error is : ', np.nanmean(error_table[:, 2]))
+    print('std_error_3d     is : ', np.nanstd(error_table[:, 2]))
+    print("==============================================")
+    print('Reconstructed', len(results), 'frames with', n_workers, 'workers in', round(time.time() - start_time, 1), 's')
+    print('Error table written to ' + result_table_path)
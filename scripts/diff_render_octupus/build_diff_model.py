@@ -24,6 +24,7 @@ from construction_bezier import ConstructionBezier
 from blender_catheter import BlenderRenderCatheter
 from diff_render_catheter import DiffRenderCatheter
 from loss_define import ContourLoss, MaskLoss, CenterlineLoss, KeypointsInImageLoss, KeypointsIn3DLoss
+from reference_preprocessing import get_reference_data
 
 import pytorch3d
 import pytorch3d.io as torch3d_io
@@ -40,7 +41,12 @@ import skfmm
 
 class DiffOptimizeModel(nn.Module):
 
-    def __init__(self, para_init, para_start, radius_gt_3d, image_ref, image_ref_rgb, gt_centline_3d, cylinder_primitive_path, cam_K, cam_RT_H, selected_frame_id, gpu_or_cpu):
+    def __init__(self, para_init, para_start, radius_gt_3d, image_ref, image_ref_rgb, gt_centline_3d, cam_K, cam_RT_H, selected_frame_id, gpu_or_cpu, cylinder_primitive_path=None):
+        """
+        Args:
+            cylinder_primitive_path (path string to obj file): no longer read, the cylinder primitive is built
+                procedurally for the tube sampling of build_bezier (see setTubeResolution)
+        """
         super().__init__()
 
         self.gpu_or_cpu = gpu_or_cpu
@@ -50,7 +56,7 @@ class DiffOptimizeModel(nn.Module):
 
         self.torch3d_render_catheter = DiffRenderCatheter(self.build_bezier.cam_RT_H, self.build_bezier.cam_K, gpu_or_cpu)
         self.torch3d_render_catheter.to(gpu_or_cpu)
-        self.torch3d_render_catheter.loadCylinderPrimitive(cylinder_primitive_path)
+        self.torch3d_render_catheter.setCylinderPrimitive(self.build_bezier.bezier_num_samples, self.build_bezier.bezier_surface_resolution)
 
         self.mask_loss = MaskLoss(device=gpu_or_cpu)
         self.mask_loss.to(gpu_or_cpu)
@@ -116,10 +122,15 @@ class DiffOptimizeModel(nn.Module):
         # pdb.set_trace()
 
         # img_ref_dist_map = skfmm.distance(image_ref)
-        img_ref_dist_map = skfmm.distance(np.logical_not(image_ref).astype(int))
+        img_ref_dist_map = get_reference_data(image_ref, ['dist_map'])['dist_map']
         self.img_ref_dist_map = torch.from_numpy(img_ref_dist_map).to(gpu_or_cpu)
         self.image_ref = torch.from_numpy(image_ref.astype(np.float32)).to(gpu_or_cpu)
         self.image_ref_rgb = image_ref_rgb
+
+        ## reference mask and distance map at the size the silhouettes are rendered at, see setRenderScale
+        self.image_ref_render = self.image_ref
+        self.img_ref_dist_map_render = self.img_ref_dist_map
+        self.render_area_ratio = 1.0
         # self.register_buffer('image_ref', image_ref)
 
         self.pt_intesection_endpoints_ref = None
@@ -127,6 +138,46 @@ class DiffOptimizeModel(nn.Module):
 
         self.selected_frame_id = selected_frame_id
 
+    def setTubeResolution(self, num_samples, resolution):
+        """
+        Change the tessellation of the rendered tube at runtime
+
+        Args:
+            num_samples (int): number of samples along the bezier curve
+            resolution (int): number of vertices around the tube at each sample
+        """
+        self.build_bezier.bezier_num_samples = num_samples
+        self.build_bezier.bezier_surface_resolution = resolution
+        self.torch3d_render_catheter.setCylinderPrimitive(num_samples, resolution)
+
+    def setRenderScale(self, render_scale):
+        """
+        Render and compare the silhouettes at a fraction of the full image size, e.g. coarse-to-fine
+
+        Args:
+            render_scale (float): 1.0 for the full image
+
+        Note:
+            The mask loss is normalized to full image pixels, and the centerline losses always compare full
+                image pixel coordinates, so the loss keeps its scale across render scales
+        """
+        self.torch3d_render_catheter.setRenderScale(render_scale)
+        render_img_size = self.torch3d_render_catheter.render_img_size
+
+        if render_img_size == tuple(self.image_ref.shape):
+            self.image_ref_render = self.image_ref
+            self.img_ref_dist_map_render = self.img_ref_dist_map
+        else:
+            ## area average then keep the pixels covered at least by half, so the downscaled mask stays binary
+            image_ref = self.image_ref.cpu().numpy()
+            image_ref_render = (cv2.resize(image_ref, (render_img_size[1], render_img_size[0]), interpolation=cv2.INTER_AREA) >= 0.5).astype(np.float32)
+            img_ref_dist_map_render = get_reference_data(image_ref_render, ['dist_map'])['dist_map']
+
+            self.image_ref_render = torch.from_numpy(image_ref_render).to(self.gpu_or_cpu)
+            self.img_ref_dist_map_render = torch.from_numpy(img_ref_dist_map_render).to(self.gpu_or_cpu)
+
+        self.render_area_ratio = (render_img_size[0] * render_img_size[1]) / (self.image_ref.shape[0] * self.image_ref.shape[1])
+
     def forward(self, save_img_path=None):
 
         ###========================================================
@@ -181,11 +232,17 @@ class DiffOptimizeModel(nn.Module):
 
         ##### -----------------------------
         ####  Contour Loss
-        loss_contour, img_render_contour, img_render_diffable = self.contour_loss(img_render_mask.unsqueeze(0), self.image_ref.unsqueeze(0), self.img_ref_dist_map.unsqueeze(0))
+        loss_contour, img_render_contour, img_render_diffable = self.contour_loss(img_render_mask.unsqueeze(0), self.image_ref_render.unsqueeze(0), self.img_ref_dist_map_render.unsqueeze(0))
         ##### -----------------------------
-        ####  Mask Loss : using a differentiable binarized image
-        loss_mask = self.mask_loss(img_render_mask, self.image_ref)
-        img_diff = torch.abs(img_render_mask - self.image_ref)
+        ####  Mask Loss : using a differentiable binarized image, summed over full image pixels
+        loss_mask = self.mask_loss(img_render_mask, self.image_ref_render) / self.render_area_ratio
+        img_diff = torch.abs(img_render_mask - self.image_ref_render)
+
+        ## rendered images kept for drawing and saving are brought back to the size of the reference image
+        if self.render_area_ratio != 1.0:
+            img_render_mask, img_render_contour, img_render_diffable = [
+                F.interpolate(img.detach()[None, None], size=tuple(self.image_ref.shape), mode='bilinear', align_corners=False)[0, 0] for img in (img_render_mask, img_render_contour, img_render_diffable)
+            ]
 
         ##### -----------------------------
         #### Centerline Loss
@@ -24,6 +24,7 @@ from construction_bezier import ConstructionBezier
 from blender_catheter import BlenderRenderCatheter
 from diff_render_catheter import DiffRenderCatheter
 from loss_define import ContourLoss, MaskLoss, CenterlineLoss, KeypointsInImageLoss, KeypointsIn3DLoss
+from reference_preprocessing import get_reference_data
 
 import pytorch3d
 import pytorch3d.io as torch3d_io
@@ -116,7 +117,7 @@ class DiffOptimizeModel(nn.Module):
         # pdb.set_trace()
 
         # img_ref_dist_map = skfmm.distance(image_ref)
-        img_ref_dist_map = skfmm.distance(np.logical_not(image_ref).astype(int))
+        img_ref_dist_map = get_reference_data(image_ref, ['dist_map'])['dist_map']
         self.img_ref_dist_map = torch.from_numpy(img_ref_dist_map).to(gpu_or_cpu)
         self.image_ref = torch.from_numpy(image_ref.astype(np.float32)).to(gpu_or_cpu)
         self.image_ref_rgb = image_ref_rgb
@@ -21,6 +21,12 @@ import pdb
 
 import numpy as np
 
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from reference_preprocessing import get_reference_data
+
 
 class ContourLoss(nn.Module):
 
@@ -204,48 +210,12 @@ class CenterlineLoss(nn.Module):
         return loss_centerline, opt_skeleton_ordered, centerline_selected_id_list, ref_skeleton_selected_id_list
 
     def get_raw_centerline(self, img_ref):
-        ## https://stackoverflow.com/questions/37742358/sorting-points-to-form-a-continuous-line
-
-        img_ref = img_ref.cpu().detach().numpy().copy()
-
-        # img_height = img_ref.shape[0]
-        # img_width = img_ref.shape[1]
-
-        skeleton = skimage_morphology.skeletonize(img_ref)
-        img_raw_skeleton = np.argwhere(skeleton == 1)
-
-        # creating a nearest neighbour graph to connect each of the nodes to its 2 nearest neighbors
-        # neigh = NearestNeighbors(n_neighbors=2, radius=0.4)
-
-        clf = NearestNeighbors(n_neighbors=2).fit(img_raw_skeleton)
-        G = clf.kneighbors_graph()
-
-        # then use networkx to construct a graph from this sparse matrix
-        T = nx.from_scipy_sparse_matrix(G)
-
-        # find shortest path from source
-        # minimizes the distances between the connections (optimization problem):
-        min_dist = np.inf
-        min_idx = 0
-        opt_skeleton_ordered = None
-
-        for i in range(img_raw_skeleton.shape[0]):
-            path = list(nx.dfs_preorder_nodes(T, i))
-            ordered = img_raw_skeleton[path]  # ordered nodes
-
-            # find cost of that order by the sum of euclidean distances between points (i) and (i+1)
-            cost = (((ordered[:-1] - ordered[1:])**2).sum(1)).sum()
-            if cost < min_dist:
-                min_dist = cost
-                min_idx = i
-                opt_skeleton_ordered = ordered
+        ## skeleton pixels ordered from the top of the image, as (x, y) to fit bezier_proj_img
+        ## (see reference_preprocessing.compute_skeleton_ordered; the ordering is computed once per reference image and cached)
 
-        ### this can gurantee the starting point of the skeleton is always from top-->bottom
-        if opt_skeleton_ordered[0, 0] > 50:
-            opt_skeleton_ordered = np.flip(opt_skeleton_ordered, 0)
+        img_ref = img_ref.cpu().detach().numpy()
 
-        ### this will flip x/y coordinates in order to fit bezier_proj_img
-        opt_skeleton_ordered = np.stack((opt_skeleton_ordered[:, 1], opt_skeleton_ordered[:, 0]), axis=1)
+        opt_skeleton_ordered = get_reference_data(img_ref, ['skeleton_ordered'])['skeleton_ordered']
 
         return opt_skeleton_ordered
 
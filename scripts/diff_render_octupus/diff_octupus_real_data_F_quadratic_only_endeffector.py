@@ -4,6 +4,7 @@ from turtle import pd
 sys.path.append('..')
 
 import os
+import time
 import numpy as np
 
 # import transforms
@@ -42,7 +43,22 @@ from pathlib import Path
 
 class DoDiffOptimization(nn.Module):
 
-    def __init__(self, para_init, para_gt, diff_model, total_itr_steps, img_raw_rgb, data_frame_id, if_print_log=1):
+    def __init__(self, para_init, para_gt, diff_model, total_itr_steps, img_raw_rgb, data_frame_id, if_print_log=1, converge_tol=0.0, converge_patience=5, min_itr_steps=10, resolution_schedule=None, level_tol=1e-2):
+        """
+        Args:
+            converge_tol (float): stop early once the relative change of the loss stays below converge_tol for
+                converge_patience consecutive iterations, 0 to always run total_itr_steps iterations
+            converge_patience (int): number of consecutive iterations below converge_tol
+            min_itr_steps (int): number of iterations before early stopping is considered
+            resolution_schedule (list of tuple): coarse levels (render_scale, surface_resolution, max_itr_steps)
+                optimized before the full render size and tube mesh of diff_model, None to always use the full ones
+            level_tol (float): move on to the next level once the relative change of the loss stays below level_tol
+                for converge_patience consecutive iterations, or after max_itr_steps iterations of the level
+
+        Note:
+            The learning rate schedule restarts when the full resolution level is entered, so that level starts from
+                the same learning rate as a run without coarse levels
+        """
         super(DoDiffOptimization, self).__init__()
 
         self.para_init = para_init
@@ -50,6 +66,15 @@ class DoDiffOptimization(nn.Module):
         self.diff_model = diff_model
         self.total_itr_steps = total_itr_steps
 
+        self.converge_tol = converge_tol
+        self.converge_patience = converge_patience
+        self.min_itr_steps = min_itr_steps
+
+        ## the last level is always the full render size and tube mesh of diff_model
+        full_level = (1.0, self.diff_model.build_bezier.bezier_surface_resolution, None)
+        self.resolution_schedule = list(resolution_schedule or []) + [full_level]
+        self.level_tol = level_tol
+
         self.optimizer = torch.optim.Adam([self.para_init], lr=0.2)
         # self.lr_scheduler = torch.optim.lr_scheduler.ExponentialLR(self.optimizer, gamma=0.99)
         self.lr_scheduler = torch.optim.lr_scheduler.StepLR(self.optimizer, step_size=30, gamma=0.6)
@@ -275,35 +300,80 @@ class DoDiffOptimization(nn.Module):
 
             return self.loss
 
+        def setLevel(id_level):
+            render_scale, surface_resolution, _ = self.resolution_schedule[id_level]
+            self.diff_model.setRenderScale(render_scale)
+            self.diff_model.setTubeResolution(self.diff_model.build_bezier.bezier_num_samples, surface_resolution)
+
+            if self.if_print_log:
+                print("Resolution level", id_level, ": render scale", render_scale, ", surface resolution", surface_resolution)
+
         self.optimizer.zero_grad()
         loss_history = []
         learn_rate_history = []
-        # last_loss = 99999.0  # current loss value
+        last_loss = None  # loss of the previous iteration
         # last_learn_rate = 0.0  # current loss value
 
         converge = False  # converge or not
+        n_small_change = 0  # consecutive iterations with a small relative change of the loss
         self.id_iteration = 0  # number of updates
 
-        # while not converge and self.id_iteration < self.total_itr_steps:
-        while self.id_iteration < self.total_itr_steps:
+        final_level = len(self.resolution_schedule) - 1
+        id_level = 0 if self.total_itr_steps > 1 else final_level  # current level of resolution_schedule
+        n_level_itr = 0  # number of updates at the current level
+        setLevel(id_level)
+
+        while not converge and self.id_iteration < self.total_itr_steps:
+
+            ## the last iteration always runs at full resolution
+            assert self.id_iteration < self.total_itr_steps - 1 or id_level == final_level
 
             self.optimizer.step(closure)
             self.lr_scheduler.step()
 
             learn_rate = self.optimizer.param_groups[0]["lr"]
 
-            # if (abs(self.loss - last_loss) < 1e-6):
-            #     converge = True
-
             self.id_iteration += 1
 
+            is_final_level = id_level == final_level
+            tol = self.converge_tol if is_final_level else self.level_tol
+            n_level_itr += 1
+
+            curr_loss = float(self.loss.detach())
+            if last_loss is not None and abs(curr_loss - last_loss) <= tol * max(abs(last_loss), 1e-12):
+                n_small_change += 1
+            else:
+                n_small_change = 0
+            last_loss = curr_loss
+
+            if is_final_level:
+                if self.converge_tol > 0 and self.id_iteration >= self.min_itr_steps and n_small_change >= self.converge_patience:
+                    converge = True
+            elif n_small_change >= self.converge_patience or n_level_itr >= self.resolution_schedule[id_level][2] or self.id_iteration >= self.total_itr_steps - 1:
+                ## the loss plateaued at this level (or its budget is spent), refine the render size and the tube mesh;
+                ## before the last iteration, skip straight to full resolution
+                if self.id_iteration >= self.total_itr_steps - 1:
+                    id_level = final_level
+                else:
+                    id_level += 1
+                n_level_itr = 0
+                n_small_change = 0
+                last_loss = None
+                setLevel(id_level)
+
+                ## restart the learning rate schedule, which the coarse levels have already decayed
+                if id_level == final_level:
+                    for param_group in self.optimizer.param_groups:
+                        param_group['lr'] = param_group['initial_lr']
+                    self.lr_scheduler = torch.optim.lr_scheduler.StepLR(self.optimizer, step_size=30, gamma=0.6)
+
             if self.if_print_log:
                 print("Curr grad : ", self.para_init.grad)
                 print("Curr para : ", self.para_init)
                 print("Curr loss : ", self.loss)
                 print("---------------- FINISH ", self.id_iteration, " ^_^ ITER ---------------- \n")
 
-            if self.id_iteration >= self.total_itr_steps:
+            if self.id_iteration >= self.total_itr_steps or converge:
                 save_final_step_img_path = self.save_data_path + '/final_frame_' + str(self.data_frame_id) + '.png'
                 save_render_final_image_path = self.save_data_path + '/render_final_frame_' + str(self.data_frame_id) + '.png'
                 self.savingFinalStepFigures(save_final_step_img_path, save_render_final_image_path)
@@ -347,6 +417,7 @@ class DoDiffOptimization(nn.Module):
             #     self.id_iteration) + '.obj'  # save the figure to file
             # self.diff_model.saveUpdatedMesh(save_mesh_path)
 
+        print("Iterations --->", self.id_iteration, "(converged)" if converge else "")
         print("Final --->", self.para_init.cpu().detach())
         print("GT    --->", self.para_gt)
         print("Error --->", torch.abs(self.para_init.cpu().detach() - self.para_gt))
@@ -378,24 +449,73 @@ class DoDiffOptimization(nn.Module):
         # return self.saved_opt_history, self.para
 
 
+def predictTrackingInit(converged_para_list, converged_frame_id_list, next_frame_id, constant_velocity=True):
+    """
+    Initial parameters of the next frame of a sequence from the converged parameters of the previous frames
+
+    Args:
+        converged_para_list (list of tensor): converged parameters of the previous frames, in frame order
+        converged_frame_id_list (list of int): frame id of each entry of converged_para_list
+        next_frame_id (int): frame id of the frame to initialize
+        constant_velocity (bool): whether to extrapolate the change per frame id between the last two frames
+            over the gap to the next frame, otherwise the last converged parameters are reused as they are
+
+    Returns:
+        (tensor): initial parameters of the next frame
+    """
+    para_prev = converged_para_list[-1]
+
+    if constant_velocity and len(converged_para_list) >= 2:
+        ## The sequence skips frame ids (e.g. 98 -> 104), so the velocity is per frame id rather than per entry
+        velocity = (para_prev - converged_para_list[-2]) / (converged_frame_id_list[-1] - converged_frame_id_list[-2])
+        para_pred = para_prev + velocity * (next_frame_id - converged_frame_id_list[-1])
+
+        ## the radius scale does not move with the arm
+        para_pred[-1] = para_prev[-1]
+        return para_pred
+
+    return para_prev.clone()
+
+
 if __name__ == '__main__':
 
-    for i in range(0, 2):
+    sim_case = '/media/fei/DATA_Fei/Datasets/Octupus_Arm/octupus_data_F/binary_crop/'
+    frame_id_list = (93, 94, 95, 97, 98, 104, 105, 108, 109, 110, 111, 112, \
+                    113, 114, 115, 116, 117, 118, 119, 120, \
+                    121, 122, 123, 124, 125, 135, 136, 137, \
+                    138, 139, 140, 147)
+    ## 0-93  / 1-94  / 2-95  / 3-97  / 4-98/
+    ## 5-104 / 6-105 / 7-108 / 8-109 / 9-110/
+    ## 10-111 / 11-112 / 12-113 / 13-114 / 14-115
+    ## 15-116 / 16-117 / 17-118 / 18-119 / 19-120
+    ## 20-121 / 21-122 / 22-123 / 23-124 / 24-125
+    ## 25-135 / 26-136 / 27-137 / 28-138 / 29-139
+    ## 30-140 / 31-147
+
+    ## Tracking mode (opt-in) walks the whole frame list and initializes each frame from the converged parameters of
+    ## the previous frames (see predictTrackingInit), so init_random below is only used for the first frame
+    tracking_mode = False
+    tracking_constant_velocity = True
+    tracking_converge_tol = 1e-3
+
+    ## Coarse-to-fine : (render scale, surface resolution, max iterations) levels optimized before the full render
+    ## size and tube mesh, each level ends once its loss plateaus, see DoDiffOptimization. Off until validated on
+    ## real frames, e.g. [(0.25, 10, 40), (0.5, 20, 40)]
+    resolution_schedule = None
+
+    if tracking_mode:
+        selected_frame_id_list = range(0, len(frame_id_list))
+    else:
+        selected_frame_id_list = range(0, 2)
+
+    converged_para_list = []
+    converged_frame_id_list = []
+    frame_time_list = []
+
+    for i in selected_frame_id_list:
 
         selected_frame_id = i
-
-        sim_case = '/media/fei/DATA_Fei/Datasets/Octupus_Arm/octupus_data_F/binary_crop/'
-        frame_id_list = (93, 94, 95, 97, 98, 104, 105, 108, 109, 110, 111, 112, \
-                        113, 114, 115, 116, 117, 118, 119, 120, \
-                        121, 122, 123, 124, 125, 135, 136, 137, \
-                        138, 139, 140, 147)
-        ## 0-93  / 1-94  / 2-95  / 3-97  / 4-98/
-        ## 5-104 / 6-105 / 7-108 / 8-109 / 9-110/
-        ## 10-111 / 11-112 / 12-113 / 13-114 / 14-115
-        ## 15-116 / 16-117 / 17-118 / 18-119 / 19-120
-        ## 20-121 / 21-122 / 22-123 / 23-124 / 24-125
-        ## 25-135 / 26-136 / 27-137 / 28-138 / 29-139
-        ## 30-140 / 31-147
+        frame_start_time = time.time()
 
         frame_id = frame_id_list[selected_frame_id]
         frame_naming = sim_case + 'left_recif_binary_' + str(frame_id)
@@ -406,8 +526,6 @@ if __name__ == '__main__':
         viewpoint_mode = 1
         transparent_mode = 0
 
-        cylinder_primitive_path = '/home/fei/icra2023_diff_catheter/scripts/diff_render_octupus/shape_primitive/cylinder_primitve_101_40.obj'
-
         ###========================================================
         ### Optimization Rendering
         ###========================================================
@@ -525,7 +643,11 @@ if __name__ == '__main__':
         # init_random = torch.tensor([5.0, 2.0, 0.0, 2.0, 0.0, 0.0, 0.0], dtype=torch.float).to(gpu_or_cpu)  ## good
 
         # para_init = para_init
-        para_init = para_init + init_random
+        if tracking_mode and len(converged_para_list) > 0:
+            para_init = predictTrackingInit(converged_para_list, converged_frame_id_list, frame_id,
+                                            tracking_constant_velocity).to(gpu_or_cpu)
+        else:
+            para_init = para_init + init_random
 
         para_init.requires_grad = True
 
@@ -592,7 +714,6 @@ if __name__ == '__main__':
                                        image_ref=img_ref_binary,
                                        image_ref_rgb=img_ref_rgb,
                                        gt_centline_3d=gt_centline_3d_if_flip,
-                                       cylinder_primitive_path=cylinder_primitive_path,
                                        cam_K=cam_K_mat,
                                        cam_RT_H=cam_RT_H_mat,
                                        selected_frame_id=selected_frame_id,
@@ -604,10 +725,19 @@ if __name__ == '__main__':
                                      total_itr_steps=total_itr_steps,
                                      img_raw_rgb=img_raw_rgb,
                                      data_frame_id=frame_id,
-                                     if_print_log=1)
+                                     if_print_log=1,
+                                     converge_tol=tracking_converge_tol if tracking_mode else 0.0,
+                                     resolution_schedule=resolution_schedule)
 
         do_diff.doOptimization()
 
+        converged_para_list.append(do_diff.para_init.detach().clone())
+        converged_frame_id_list.append(frame_id)
+        frame_time_list.append(time.time() - frame_start_time)
+        print("Frame", frame_id, ":", do_diff.id_iteration, "iterations in", round(frame_time_list[-1], 1), "s")
+
+    print("Reconstructed", len(frame_time_list), "frames in", round(sum(frame_time_list), 1), "s")
+
     ###========================================================
     ### Render catheter using Blender
     ###========================================================
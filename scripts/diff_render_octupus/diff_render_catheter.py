@@ -15,6 +15,72 @@ import torch.nn as nn
 import pdb
 
 
+## Vertices and faces of the cylinder primitive OBJ files, keyed by path
+CYLINDER_PRIMITIVE_CACHE = {}
+
+
+def loadCylinderPrimitiveObj(path):
+    """
+    Args:
+        path (path string to obj file): cylinder primitive mesh
+
+    Returns:
+        verts ((N, 3) tensor): vertices of the mesh, on the CPU
+        faces ((F, 3) tensor): vertex indices of the faces, on the CPU
+
+    Note:
+        Each file is parsed once per process; the returned tensors are shared and must not be modified
+    """
+    if path not in CYLINDER_PRIMITIVE_CACHE:
+        verts, faces_idx, _ = torch3d_io.load_obj(path)
+        CYLINDER_PRIMITIVE_CACHE[path] = (verts, faces_idx.verts_idx)
+
+    return CYLINDER_PRIMITIVE_CACHE[path]
+
+
+## Vertex indices of the faces of the procedural cylinder primitives, keyed by (number of rings, vertices per ring)
+CYLINDER_PRIMITIVE_FACES_CACHE = {}
+
+
+def getCylinderPrimitiveFaces(num_samples, resolution):
+    """
+    Faces of a tube with two cap centers followed by num_samples rings of resolution vertices, in the vertex
+        order of ConstructionBezier.updated_surface_vertices and the triangle order of the open3d cylinders
+        saved in shape_primitive/ (e.g. cylinder_primitve_101_40.obj is num_samples=101, resolution=40)
+
+    Args:
+        num_samples (int): number of rings along the tube (bezier_num_samples)
+        resolution (int): number of vertices per ring (bezier_surface_resolution)
+
+    Returns:
+        ((2 * resolution * num_samples, 3) tensor): vertex indices of the faces, on the CPU
+
+    Note:
+        Built once per (num_samples, resolution) per process; the returned tensor is shared and must not be modified
+    """
+    key = (num_samples, resolution)
+
+    if key not in CYLINDER_PRIMITIVE_FACES_CACHE:
+        j = torch.arange(resolution)
+        j1 = (j + 1) % resolution
+
+        ## caps : top center is vertex 0 with the first ring, bottom center is vertex 1 with the last ring
+        top = torch.stack((torch.zeros_like(j), 2 + j, 2 + j1), dim=1)
+        bot_ring = 2 + resolution * (num_samples - 1)
+        bot = torch.stack((torch.ones_like(j), bot_ring + j1, bot_ring + j), dim=1)
+        caps = torch.stack((top, bot), dim=1).reshape(-1, 3)
+
+        ## sides : two triangles between ring i and ring i + 1 for each vertex of the ring
+        ring_1 = 2 + resolution * torch.arange(num_samples - 1).unsqueeze(1)
+        ring_2 = ring_1 + resolution
+        side = torch.stack((torch.stack((ring_2 + j, ring_1 + j1, ring_1 + j), dim=-1),
+                            torch.stack((ring_2 + j, ring_2 + j1, ring_1 + j1), dim=-1)), dim=2).reshape(-1, 3)
+
+        CYLINDER_PRIMITIVE_FACES_CACHE[key] = torch.cat((caps, side), dim=0)
+
+    return CYLINDER_PRIMITIVE_FACES_CACHE[key]
+
+
 class DiffRenderCatheter(nn.Module):
 
     def __init__(self, camera_extrinsics, camera_intrinsics, gpu_or_cpu):
@@ -32,13 +98,14 @@ class DiffRenderCatheter(nn.Module):
         self.IMG_WIDTH = 310
         self.IMG_HEIGHT = 350
 
+        ## fraction of the full image size the silhouettes are rendered at, see setRenderScale
+        self.render_scale = 1.0
+
         self.setRenderingCamera(camera_extrinsics, camera_intrinsics)
 
     def loadCylinderPrimitive(self, path):
         # Load the obj and ignore the textures and materials.
-        self.verts, self.faces_idx, _ = torch3d_io.load_obj(path)
-
-        self.faces = self.faces_idx.verts_idx
+        self.verts, self.faces = loadCylinderPrimitiveObj(path)
 
         # Initialize each vertex to be white in color.textures
         verts_rgb = torch.zeros_like(self.verts.float()).unsqueeze(0)  # (1, N, 3)
@@ -47,6 +114,27 @@ class DiffRenderCatheter(nn.Module):
         # Create a Meshes object for the teapot. Here we have only one mesh in the batch.
         self.cylinder_primitive_mesh = torch3d_structures.Meshes(verts=[self.verts.to(self.gpu_or_cpu)], faces=[self.faces.to(self.gpu_or_cpu)], textures=self.textures)
 
+    def setCylinderPrimitive(self, num_samples, resolution):
+        """
+        Build the cylinder primitive mesh procedurally instead of loading it from an OBJ file
+
+        Args:
+            num_samples (int): number of rings along the tube (bezier_num_samples)
+            resolution (int): number of vertices per ring (bezier_surface_resolution)
+
+        Note:
+            Can be called again at any time to change the tessellation of the tube, e.g. coarse-to-fine; the
+                vertices are placeholders since updateCylinderPrimitive replaces all of them
+        """
+        self.faces = getCylinderPrimitiveFaces(num_samples, resolution)
+        self.verts = torch.zeros((2 + num_samples * resolution, 3))
+
+        # Initialize each vertex to be white in color.textures
+        verts_rgb = torch.zeros_like(self.verts.float()).unsqueeze(0)  # (1, N, 3)
+        self.textures = torch3d_render.TexturesVertex(verts_features=verts_rgb.to(self.gpu_or_cpu))
+
+        self.cylinder_primitive_mesh = torch3d_structures.Meshes(verts=[self.verts.to(self.gpu_or_cpu)], faces=[self.faces.to(self.gpu_or_cpu)], textures=self.textures)
+
     def updateCylinderPrimitive(self, updated_verts):
 
         cylinder_updated_verts = updated_verts.to(self.gpu_or_cpu)
@@ -63,8 +151,23 @@ class DiffRenderCatheter(nn.Module):
 
         rot = (self.cam_RT_H[0:3, 0:3]).unsqueeze(0)
         tvec = (self.cam_RT_H[0:3, 3]).unsqueeze(0)
-        camK = self.cam_K.unsqueeze(0)
-        image_size = torch.as_tensor([[self.IMG_WIDTH, self.IMG_HEIGHT]], device=self.gpu_or_cpu)
+
+        ## the intrinsics are given for the full image, scale them to the render size (pixel centers stay aligned)
+        self.render_img_size = (max(1, int(round(self.IMG_WIDTH * self.render_scale))), max(1, int(round(self.IMG_HEIGHT * self.render_scale))))
+        render_cam_K = self.cam_K
+
+        if self.render_img_size != (self.IMG_WIDTH, self.IMG_HEIGHT):
+            scale_rows = self.render_img_size[0] / self.IMG_WIDTH
+            scale_cols = self.render_img_size[1] / self.IMG_HEIGHT
+
+            render_cam_K = self.cam_K.clone()
+            render_cam_K[0, :] = self.cam_K[0, :] * scale_cols
+            render_cam_K[1, :] = self.cam_K[1, :] * scale_rows
+            render_cam_K[0, 2] = (self.cam_K[0, 2] + 0.5) * scale_cols - 0.5
+            render_cam_K[1, 2] = (self.cam_K[1, 2] + 0.5) * scale_rows - 0.5
+
+        camK = render_cam_K.unsqueeze(0)
+        image_size = torch.as_tensor([self.render_img_size], device=self.gpu_or_cpu)
 
         self.render_cameras = torch3d_utils.cameras_from_opencv_projection(R=rot, tvec=tvec, camera_matrix=camK, image_size=image_size)
 
@@ -74,7 +177,12 @@ class DiffRenderCatheter(nn.Module):
         # principle = torch.tensor((cam_K[0, 2],cam_K[1, 2]), dtype=torch.float32).unsqueeze(0)
         # cameras = PerspectiveCameras(device=device, R=rot, T=trans, focal_length=focal, principal_point=principle, image_size=((480, 640),))
 
-    def renderDeformedMesh(self, save_img_path=None):
+        self.setRenderer()
+
+    def setRenderer(self):
+        """
+        Build the silhouette renderer for the current camera, once instead of on every render call
+        """
 
         # Define the settings for rasterization and shading. Here we set the output image to be of size
         # WIDTH x HEIGHT. As we are rendering images for visualization purposes only we will set faces_per_pixel=1
@@ -82,7 +190,7 @@ class DiffRenderCatheter(nn.Module):
         # the faster coarse-to-fine rasterization method is used. Refer to rasterize_meshes.py for
         # explanations of these parameters. Refer to docs/notes/renderer.md for an explanation of
         # the difference between naive and coarse-to-fine rasterization.
-        raster_settings = torch3d_render.RasterizationSettings(image_size=(self.IMG_WIDTH, self.IMG_HEIGHT), blur_radius=0.0, faces_per_pixel=1, perspective_correct=False)
+        raster_settings = torch3d_render.RasterizationSettings(image_size=self.render_img_size, blur_radius=0.0, faces_per_pixel=1, perspective_correct=False)
 
         # Place a point light in front of the object. As mentioned above, the front of the cow is facing the
         # -z direction.
@@ -99,6 +207,21 @@ class DiffRenderCatheter(nn.Module):
         self.renderer_catheter = torch3d_render.MeshRenderer(rasterizer=torch3d_render.MeshRasterizer(cameras=self.render_cameras, raster_settings=raster_settings, eps=1e-4),
                                                              shader=torch3d_render.SoftSilhouetteShader(blend_params=torch3d_blending.BlendParams(sigma=1e-2, gamma=1e-2)))
 
+    def setRenderScale(self, render_scale):
+        """
+        Render the silhouettes at a fraction of the full IMG_WIDTH x IMG_HEIGHT image, e.g. coarse-to-fine
+
+        Args:
+            render_scale (float): 1.0 for the full image, 0.5 for half of the rows and half of the columns
+        """
+        if render_scale == self.render_scale:
+            return
+
+        self.render_scale = render_scale
+        self.setRenderingCamera(self.cam_RT_H, self.cam_K)
+
+    def renderDeformedMesh(self, save_img_path=None):
+
         self.render_catheter_img = self.renderer_catheter(self.updated_cylinder_primitive_mesh)
         # self.render_catheter_img = self.renderer_catheter(self.cylinder_primitive_mesh)
 
@@ -113,5 +236,27 @@ class DiffRenderCatheter(nn.Module):
 
         # pdb.set_trace()
 
+    def renderDeformedMeshBatch(self, updated_verts_batch):
+        """
+        Render several deformations of the cylinder primitive in one rasterizer call, e.g. several frames or
+            several candidate parameters
+
+        Args:
+            updated_verts_batch ((B, N, 3) tensor): vertices of B deformed cylinder primitives
+
+        Note:
+            Sets render_catheter_img_batch, a (B, IMG_WIDTH, IMG_HEIGHT, 4) tensor whose last channel is the
+                silhouette, with image b equal to what renderDeformedMesh renders for vertices b
+        """
+        n_batch = updated_verts_batch.shape[0]
+        cylinder_primitive_faces = self.cylinder_primitive_mesh.faces_list()[0]
+
+        updated_meshes = torch3d_structures.Meshes(verts=updated_verts_batch.to(self.gpu_or_cpu).float(),
+                                                   faces=cylinder_primitive_faces.unsqueeze(0).expand(n_batch, -1, -1))
+
+        self.render_catheter_img_batch = self.renderer_catheter(updated_meshes)
+
+        return self.render_catheter_img_batch
+
     def forward(self):
         raise NotImplementedError
@@ -0,0 +1,175 @@
+'''
+Chamfer-style distances evaluated by looking up precomputed distance fields instead of building the pairwise
+N x M distance matrix between the rendered and the reference points.
+'''
+
+import numpy as np
+import scipy.ndimage
+
+import torch
+import torch.nn as nn
+
+from reference_preprocessing import compute_points_dist_field
+
+
+def sampleField(field, points):
+    """
+    Bilinear interpolation of a field at subpixel positions
+
+    Args:
+        field ((C, H, W) tensor): field sampled on the pixel grid
+        points ((N, 2) tensor): (x, y) of the positions, inside [0, W - 1] x [0, H - 1]
+
+    Returns:
+        ((C, N) tensor): interpolated values
+    """
+    height, width = field.shape[1:]
+
+    x0 = torch.floor(points[:, 0]).long().clamp(0, width - 2)
+    y0 = torch.floor(points[:, 1]).long().clamp(0, height - 2)
+    wx = points[:, 0] - x0
+    wy = points[:, 1] - y0
+
+    return (field[:, y0, x0] * (1 - wx) * (1 - wy) + field[:, y0, x0 + 1] * wx * (1 - wy) + field[:, y0 + 1, x0] * (1 - wx) * wy +
+            field[:, y0 + 1, x0 + 1] * wx * wy)
+
+
+class DistanceFieldLookup(torch.autograd.Function):
+    """
+    Distance read from a distance field, with the gradient read from the precomputed gradient field instead of
+        the piecewise constant slopes of the bilinear interpolation
+    """
+
+    @staticmethod
+    def forward(ctx, points, dist_field):
+        values = sampleField(dist_field, points.detach())
+        ctx.save_for_backward(values[1:])
+
+        return values[0]
+
+    @staticmethod
+    def backward(ctx, grad_output):
+        grad_field, = ctx.saved_tensors
+
+        return grad_output.unsqueeze(1) * grad_field.t(), None
+
+
+def lookupDistanceField(points, dist_field):
+    """
+    Distance of each point to the point set a distance field was computed from
+
+    Args:
+        points ((N, 2) tensor): (x, y) of the points, in pixels
+        dist_field ((3, H, W) tensor): distance field and its x and y derivatives, see
+            reference_preprocessing.compute_points_dist_field
+
+    Returns:
+        ((N,) tensor): distances. Points outside the field get the distance at the closest pixel of the field
+            plus their distance to that pixel, which keeps pulling them back into the image
+    """
+    height, width = dist_field.shape[1:]
+    upper = torch.tensor([width - 1, height - 1], dtype=points.dtype, device=points.device)
+
+    clamped_points = torch.min(torch.max(points, torch.zeros_like(upper)), upper)
+    dist_inside = DistanceFieldLookup.apply(clamped_points, dist_field.to(points.dtype))
+
+    offset_sq = torch.sum((points - clamped_points)**2, dim=1)
+    dist_outside = torch.where(offset_sq > 0, torch.sqrt(torch.clamp(offset_sq, min=1e-12)), torch.zeros_like(offset_sq))
+
+    return dist_inside + dist_outside
+
+
+def getNearestPointDistance(ref_points, points, shape):
+    """
+    Distance of each reference point to the nearest point, through a distance transform of the rasterized points
+        with nearest-pixel indices, so the cost is O(H * W + N + M) instead of O(N * M)
+
+    Args:
+        ref_points ((M, 2) tensor): (x, y) of the reference points
+        points ((N, 2) tensor): (x, y) of the points, e.g. rendered points
+        shape (tuple): (H, W) of the raster
+
+    Returns:
+        ((M,) tensor): distances, differentiable with respect to points
+
+    Note:
+        The nearest point is found at pixel precision (rounded positions), the returned distance is exact to that
+            point. Falls back to the pairwise distances if no point falls inside the raster
+    """
+    height, width = shape
+
+    with torch.no_grad():
+        pixels = torch.round(points).long().cpu().numpy()
+        inside = (pixels[:, 0] >= 0) & (pixels[:, 0] < width) & (pixels[:, 1] >= 0) & (pixels[:, 1] < height)
+
+        if not np.any(inside):
+            return torch.min(torch.cdist(ref_points.to(points.dtype), points), dim=1)[0]
+
+        ## index of the point occupying each pixel, -1 for empty pixels
+        point_index = np.full((height, width), -1, dtype=np.int64)
+        point_index[pixels[inside, 1], pixels[inside, 0]] = np.nonzero(inside)[0]
+
+        _, (nearest_y, nearest_x) = scipy.ndimage.distance_transform_edt(point_index < 0, return_indices=True)
+
+        ref_pixels = torch.round(ref_points).long().cpu().numpy()
+        ref_x = np.clip(ref_pixels[:, 0], 0, width - 1)
+        ref_y = np.clip(ref_pixels[:, 1], 0, height - 1)
+        nearest_index = point_index[nearest_y[ref_y, ref_x], nearest_x[ref_y, ref_x]]
+
+    nearest_points = points[torch.from_numpy(nearest_index).to(points.device)]
+
+    return torch.norm(ref_points.to(points.dtype) - nearest_points, dim=1)
+
+
+class DistanceFieldChamferLoss(nn.Module):
+    """
+    Chamfer loss between points and a reference point set whose distance field is computed once
+
+    Args:
+        device (torch.device): device of the distance field
+    """
+
+    def __init__(self, device):
+        super(DistanceFieldChamferLoss, self).__init__()
+        self.device = device
+
+        self.ref_key = None
+        self.ref_dist_field = None
+
+    def setReference(self, ref_points, shape, dist_field=None):
+        """
+        Args:
+            ref_points ((M, 2) tensor): (x, y) of the reference points
+            shape (tuple): (H, W) of the image the points lie in
+            dist_field ((3, H, W) numpy array or tensor): precomputed distance field of ref_points, e.g. from
+                reference_preprocessing.get_reference_data, None to compute it here
+
+        Note:
+            Does nothing if the same reference is already set, so it can be called on every forward pass
+        """
+        ref_points_npy = ref_points.detach().cpu().numpy()
+        ref_key = (ref_points_npy.shape, ref_points_npy.tobytes(), tuple(shape))
+
+        if ref_key == self.ref_key:
+            return
+
+        if dist_field is None:
+            dist_field = compute_points_dist_field(ref_points_npy, shape)
+
+        self.ref_key = ref_key
+        self.ref_points = torch.as_tensor(ref_points_npy, dtype=torch.float).to(self.device)
+        self.ref_dist_field = torch.as_tensor(dist_field, dtype=torch.float).to(self.device)
+
+    def forward(self, points):
+        """
+        Args:
+            points ((N, 2) tensor): (x, y) of the points
+
+        Returns:
+            (tensor): sum of the distances from each point to the reference set, plus the sum of the distances from
+                each reference point to the points
+        """
+        min_distances_1 = lookupDistanceField(points, self.ref_dist_field)
+        min_distances_2 = getNearestPointDistance(self.ref_points, points, self.ref_dist_field.shape[1:])
+
+        return torch.sum(min_distances_1) + torch.sum(min_distances_2)
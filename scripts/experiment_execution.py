@@ -3,9 +3,11 @@ import numpy as np
 
 import camera_settings
 import path_settings
-from simulation_experiment import SimulationExperiment
 from data_generation import DataGeneration
 from experiment_setup import experiments
+from experiment_runner import ParallelExperimentRunner, make_job
+from result_store import ResultStore
+from identifier_conversions import identifier_to_index
 
 
 
@@ -18,91 +20,62 @@ noise_percentage = 0.25
 ux_init = 0.00001
 uy_init = 0.00001
 l_init = 0.2
+render_backend = 'blender'   ## 'blender' or 'software' (no Blender needed)
+n_workers = os.cpu_count()   ## number of worker processes, 1 to run serially in this process
+batch_simulation = True      ## run methods without reconstruction as lockstep batches of all data points
+target_sampling = 'random'   ## 'random', 'stratified', or 'sobol', see DataGeneration
 
 
-### Target parameter data generation
-data_alias = 'D' + str(0).zfill(2)
-data_save_path = os.path.join(path_settings.target_parameters_dir, data_alias + '.npy')
-s_list = [0.5, 1]
+if __name__ == '__main__':
 
-data_gen = DataGeneration(n_data, p_0, r, l_init, s_list, data_save_path)
-data_gen.set_target_ranges(-0.005, 0.005, -0.005, 0.005, 0.1, 0.5)
-data_gen.set_camera_params(camera_settings.a, camera_settings.b, camera_settings.center_x, camera_settings.center_y, camera_settings.image_size_x, camera_settings.image_size_y, camera_settings.extrinsics)
-data_gen.generate_data()
-target_parameters = np.load(data_save_path)
+    ### Target parameter data generation
+    data_alias = 'D' + str(0).zfill(2)
+    data_save_path = os.path.join(path_settings.target_parameters_dir, data_alias + '.npy')
+    s_list = [0.5, 1]
 
+    data_gen = DataGeneration(n_data, p_0, r, l_init, s_list, data_save_path, sampling=target_sampling)
+    data_gen.set_target_ranges(-0.005, 0.005, -0.005, 0.005, 0.1, 0.5)
+    data_gen.set_camera_params(camera_settings.a, camera_settings.b, camera_settings.center_x, camera_settings.center_y, camera_settings.image_size_x, camera_settings.image_size_y, camera_settings.extrinsics)
+    data_gen.generate_data()
+    target_parameters = np.load(data_save_path)
 
-### Test setup for all methods using general dataset
 
-error_reports = []
+    ### Test setup for all methods using general dataset
+    jobs = []
 
-for exp_name in experiments:
+    for exp_name in experiments:
+        exp = experiments[exp_name]
+        method_dir = os.path.join(path_settings.results_dir, exp_name)
 
-    print('~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~')
-    print('Running experiment ', exp_name)
-    print('~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~')
+        if not os.path.isdir(method_dir):
+            os.mkdir(method_dir)
 
-    exp = experiments[exp_name]
-
-    dof = exp['dof']
-    loss_2d = exp['loss_2d']
-    tip_loss = exp['tip_loss']
-    use_reconstruction = exp['use_reconstruction']
-    interspace = exp['interspace']
-    viewpoint_mode = exp['viewpoint_mode']
-    damping_weights = exp['damping_weights']
-    n_mid_points = exp['n_mid_points']
-    
-    if use_reconstruction:
-        render_mode = 2
-    else:
-        render_mode = 1
-
-    method_dir = os.path.join(path_settings.results_dir, exp_name)
-
-    if not os.path.isdir(method_dir):
-        os.mkdir(method_dir)
-
-    for i in range(n_data):
-        print('Executing experiment ' + exp_name + ' for data ' + str(i) + ': ', target_parameters[i, :])
+        for i in range(n_data):
+            data_dir = os.path.join(method_dir, data_alias + '_' + str(i).zfill(4))
 
-        try:
+            ux_target = target_parameters[i, 0]
+            uy_target = target_parameters[i, 1]
+            l_target = target_parameters[i, 2]
 
-            data_dir = os.path.join(method_dir, data_alias + '_' + str(i).zfill(4))
+            jobs.append(make_job(exp_name, exp, i, data_dir, p_0, r, n_iter, noise_percentage, render_backend,
+                                 ux_init, uy_init, l_init, ux_target, uy_target, l_target))
 
-            images_save_dir = os.path.join(data_dir, 'images')
-            cc_specs_save_dir = os.path.join(data_dir, 'cc_specs')
-            params_report_path = os.path.join(data_dir, 'params.npy')
-            p3d_report_path = os.path.join(data_dir, 'p3d_poses.npy')
-            p2d_report_path = os.path.join(data_dir, 'p2d_poses.npy')
+    print('Running ' + str(len(jobs)) + ' jobs of ' + str(len(experiments)) + ' experiments on ' + str(n_workers) + ' workers')
 
-            if not os.path.isdir(data_dir):
-                os.mkdir(data_dir)
-                os.mkdir(images_save_dir)
-                os.mkdir(cc_specs_save_dir)
+    ## Reports of all jobs are also collected into one store, which result_interpreter_general.py reads
+    store = ResultStore(os.path.join(path_settings.results_dir, data_alias + '_store'), len(identifier_to_index), n_data, n_iter,
+                        max(experiments[exp_name]['n_mid_points'] for exp_name in experiments), mode='a')
 
-            ux = ux_init
-            uy = uy_init
-            l = l_init
+    def store_result(record):
+        if record['status'] != 'failed':
+            store.write_from_dir(identifier_to_index[record['exp_name']], record['data_index'], record['data_dir'])
 
-            ux_target = target_parameters[i, 0]
-            uy_target = target_parameters[i, 1]
-            l_target = target_parameters[i, 2]
+    runner = ParallelExperimentRunner(n_workers)
+    runner.run(jobs, on_result=store_result, batch_simulation=batch_simulation)
+    store.flush()
+    runner.write_report(os.path.join(path_settings.results_dir, data_alias + '_report.json'))
 
-            sim_exp = SimulationExperiment(dof, loss_2d, tip_loss, use_reconstruction, interspace, viewpoint_mode, damping_weights, noise_percentage, n_iter, render_mode)
-            sim_exp.set_paths(images_save_dir, cc_specs_save_dir, params_report_path, p3d_report_path, p2d_report_path)
-            sim_exp.set_general_parameters(p_0, r, n_mid_points, l)
-
-            if dof == 2:
-                sim_exp.set_2dof_parameters(ux, uy, ux_target, uy_target)
-            elif dof == 3:
-                sim_exp.set_3dof_parameters(ux, uy, ux_target, uy_target, l_target)
-            else:
-                print('[ERROR] DOF not defined')
-
-            sim_exp.execute()
-        
-        except:
-            error_reports.append('Experiment ' + exp_name + ' failed for data ' + str(i))
-        
-print(error_reports)
+    error_reports = ['Experiment ' + record['exp_name'] + ' failed for data ' + str(record['data_index']) + ': ' + record['error']
+                     for record in runner.get_failures()]
+    print('Skipped ' + str(runner.get_n_cached()) + ' jobs with committed results')
+    print(error_reports)
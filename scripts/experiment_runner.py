@@ -0,0 +1,477 @@
+import os
+import sys
+import time
+import json
+import traceback
+import contextlib
+import multiprocessing
+
+import torch
+import numpy as np
+
+import result_cache
+from simulation_experiment import SimulationExperiment
+from batched_simulation import BatchedSimulationExperiment, render_final_image
+from bezier_set import wait_for_image_writes
+
+
+## Job entries that differ between the data points of one lockstep batch
+BATCH_EXCLUDED = result_cache.KEY_EXCLUDED + ('ux', 'uy', 'l', 'ux_target', 'uy_target', 'l_target', 'x_target', 'y_target', 'trial')
+
+
+
+def make_job(exp_name, exp, data_index, data_dir, p_0, r, n_iter, noise_percentage, render_backend, ux, uy, l,
+             ux_target=None, uy_target=None, l_target=None, x_target=None, y_target=None, trial=0):
+    """
+    Bundle everything one SimulationExperiment run needs into a picklable job
+
+    Args:
+        exp_name (string): identifier of the method, key of experiment_setup.experiments
+        exp (dict): method settings, value of experiment_setup.experiments
+        data_index (int): index of the data point within the experiment
+        data_dir (path string to directory): directory to save results of this job
+        p_0 ((3,) numpy array): start point of catheter
+        r (float): cross section radius of catheter
+        n_iter (int): number of total iteration of optimization
+        noise_percentage (float): noise applied to the feedback
+        render_backend ('blender' or 'software'): renderer to use
+        ux, uy, l (float): initial parameters
+        ux_target, uy_target, l_target (float): target parameters, used if x_target and y_target are None
+        x_target, y_target (int): 2D pixel target of the end effector, used instead of the target parameters
+        trial (int): index of repeated runs with identical settings, which differ by their feedback noise
+
+    Returns:
+        (dict): job to be executed by run_job
+    """
+    if exp['use_reconstruction']:
+        render_mode = 2
+    else:
+        render_mode = 1
+
+    return {
+        'exp_name': exp_name, 'data_index': data_index, 'data_dir': data_dir,
+        'dof': exp['dof'], 'loss_2d': exp['loss_2d'], 'tip_loss': exp['tip_loss'],
+        'use_reconstruction': exp['use_reconstruction'], 'interspace': exp['interspace'],
+        'viewpoint_mode': exp['viewpoint_mode'], 'damping_weights': exp['damping_weights'],
+        'n_mid_points': exp['n_mid_points'], 'noise_percentage': noise_percentage, 'n_iter': n_iter,
+        'render_mode': render_mode, 'render_backend': render_backend, 'p_0': p_0, 'r': r,
+        'ux': ux, 'uy': uy, 'l': l, 'ux_target': ux_target, 'uy_target': uy_target, 'l_target': l_target,
+        'x_target': x_target, 'y_target': y_target, 'trial': trial,
+    }
+
+
+def run_job(job):
+    """
+    Run one SimulationExperiment with its own result directories
+
+    Args:
+        job (dict): output of make_job
+
+    Returns:
+        (dict): record of the job with keys exp_name, data_index, data_dir, key, status ('ok', 'cached', or 'failed'),
+            time, and, for failed jobs, error and traceback
+
+    Note:
+        Everything the simulation prints goes to log.txt inside the data directory of the job.
+        A job whose data directory already holds a committed result with the same key (see result_cache)
+            is skipped with status 'cached'
+    """
+    key = result_cache.job_key(job)
+    record = {'exp_name': job['exp_name'], 'data_index': job['data_index'], 'data_dir': job['data_dir'], 'key': key, 'status': 'ok'}
+    start_time = time.time()
+
+    try:
+        data_dir = job['data_dir']
+
+        if result_cache.is_committed(data_dir, key):
+            record['status'] = 'cached'
+            record['time'] = time.time() - start_time
+            return record
+
+        result_cache.invalidate(data_dir)
+
+        images_save_dir = os.path.join(data_dir, 'images')
+        cc_specs_save_dir = os.path.join(data_dir, 'cc_specs')
+        params_report_path = os.path.join(data_dir, 'params.npy')
+        p3d_report_path = os.path.join(data_dir, 'p3d_poses.npy')
+        p2d_report_path = os.path.join(data_dir, 'p2d_poses.npy')
+
+        os.makedirs(images_save_dir, exist_ok=True)
+        os.makedirs(cc_specs_save_dir, exist_ok=True)
+
+        with open(os.path.join(data_dir, 'log.txt'), 'w') as log_file, contextlib.redirect_stdout(log_file):
+            sim_exp = SimulationExperiment(job['dof'], job['loss_2d'], job['tip_loss'], job['use_reconstruction'], job['interspace'],
+                                           job['viewpoint_mode'], job['damping_weights'], job['noise_percentage'], job['n_iter'],
+                                           job['render_mode'], job['render_backend'])
+            sim_exp.set_paths(images_save_dir, cc_specs_save_dir, params_report_path, p3d_report_path, p2d_report_path)
+            sim_exp.set_general_parameters(job['p_0'], job['r'], job['n_mid_points'], job['l'])
+
+            if job['x_target'] is not None:
+                sim_exp.set_2d_pos_parameters(job['ux'], job['uy'], job['x_target'], job['y_target'], job['l'])
+            elif job['dof'] == 2:
+                sim_exp.set_2dof_parameters(job['ux'], job['uy'], job['ux_target'], job['uy_target'])
+            elif job['dof'] == 3:
+                sim_exp.set_3dof_parameters(job['ux'], job['uy'], job['ux_target'], job['uy_target'], job['l_target'])
+            else:
+                raise ValueError('DOF not defined: ' + str(job['dof']))
+
+            sim_exp.execute()
+
+        result_cache.commit(data_dir, key)
+
+    ## SimulationExperiment reports invalid settings with exit()
+    except (Exception, SystemExit) as e:
+        record['status'] = 'failed'
+        record['error'] = repr(e)
+        record['traceback'] = traceback.format_exc()
+
+    record['time'] = time.time() - start_time
+
+    return record
+
+
+def is_batchable(job):
+    """
+    Args:
+        job (dict): output of make_job
+
+    Returns:
+        (bool): whether the job can run in a lockstep batch, see BatchedSimulationExperiment
+    """
+    return not job['use_reconstruction'] and job['render_mode'] in (0, 1) and job['dof'] in (2, 3)
+
+
+def batch_key(job):
+    """
+    Args:
+        job (dict): output of make_job
+
+    Returns:
+        (string): hex digest of the settings shared by all data points of a lockstep batch
+    """
+    settings = {k: v for k, v in job.items() if k not in BATCH_EXCLUDED}
+    settings['use_2d_pos_target'] = job['x_target'] is not None
+
+    return result_cache.job_key(settings)
+
+
+def run_lockstep_batches(jobs):
+    """
+    Run the inverse Jacobian control of jobs with the same settings but different data points as one
+        BatchedSimulationExperiment per group, leaving out the final renders
+
+    Args:
+        jobs (list of dict): outputs of make_job, all batchable (see is_batchable)
+
+    Returns:
+        (list of dict): records of the finished jobs, same as run_job returns
+        (list of dict): render tasks of the jobs still waiting for their final render, see run_final_render
+
+    Note:
+        Reports are written per job like run_job does, so cached and batched results mix freely.
+            Everything a batch prints goes to batch_log_<key>.txt in the parent directory of its data directories.
+            The feedback noise of a batch is seeded with its settings, so a batch reruns with the same noise
+    """
+    groups = {}
+
+    for job in jobs:
+        groups.setdefault(batch_key(job), []).append(job)
+
+    records = []
+    render_tasks = []
+
+    for group_key, group in groups.items():
+        start_time = time.time()
+        pending = []
+
+        for job in group:
+            key = result_cache.job_key(job)
+            record = {'exp_name': job['exp_name'], 'data_index': job['data_index'], 'data_dir': job['data_dir'], 'key': key, 'status': 'ok'}
+
+            if result_cache.is_committed(job['data_dir'], key):
+                record['status'] = 'cached'
+                record['time'] = 0.0
+                records.append(record)
+            else:
+                pending.append((job, record))
+
+        if not pending:
+            continue
+
+        pending_jobs = [job for job, _ in pending]
+        job = pending_jobs[0]
+        images_save_dirs = [os.path.join(j['data_dir'], 'images') for j in pending_jobs]
+        cc_specs_save_dirs = [os.path.join(j['data_dir'], 'cc_specs') for j in pending_jobs]
+
+        try:
+            for k, pending_job in enumerate(pending_jobs):
+                result_cache.invalidate(pending_job['data_dir'])
+                os.makedirs(images_save_dirs[k], exist_ok=True)
+                os.makedirs(cc_specs_save_dirs[k], exist_ok=True)
+
+            ## Everything the batch prints goes to one log next to the data directories of its jobs
+            log_path = os.path.join(os.path.dirname(job['data_dir']), 'batch_log_' + group_key[:8] + '.txt')
+
+            with open(log_path, 'w') as log_file, contextlib.redirect_stdout(log_file):
+                sim_exp = BatchedSimulationExperiment(job['dof'], job['loss_2d'], job['tip_loss'], job['interspace'], job['viewpoint_mode'],
+                                                      job['damping_weights'], job['noise_percentage'], job['n_iter'], job['render_mode'],
+                                                      job['render_backend'], seed=int(group_key[:8], 16))
+                sim_exp.set_general_parameters(job['p_0'], job['r'], job['n_mid_points'], np.array([j['l'] for j in pending_jobs]))
+
+                def stack(name):
+                    return np.array([j[name] for j in pending_jobs], dtype=np.float64)
+
+                if job['x_target'] is not None:
+                    sim_exp.set_2d_pos_parameters(stack('ux'), stack('uy'), stack('x_target'), stack('y_target'), stack('l'))
+                elif job['dof'] == 2:
+                    sim_exp.set_2dof_parameters(stack('ux'), stack('uy'), stack('ux_target'), stack('uy_target'))
+                else:
+                    sim_exp.set_3dof_parameters(stack('ux'), stack('uy'), stack('ux_target'), stack('uy_target'), stack('l_target'))
+
+                sim_exp.execute()
+
+        ## BatchedSimulationExperiment reports invalid settings with exit(), which fails the whole batch
+        except (Exception, SystemExit) as e:
+            for _, record in pending:
+                record['status'] = 'failed'
+                record['error'] = repr(e)
+                record['traceback'] = traceback.format_exc()
+                record['time'] = (time.time() - start_time) / len(pending)
+                records.append(record)
+
+            continue
+
+        ## The batch time is shared evenly among its jobs
+        batch_time = (time.time() - start_time) / len(pending)
+
+        for k, (pending_job, record) in enumerate(pending):
+            record['time'] = batch_time
+
+            if not sim_exp.target_in_view[k]:
+                record['status'] = 'failed'
+                record['error'] = 'Target falls outside of image'
+                record['traceback'] = ''
+                records.append(record)
+                continue
+
+            ## From here on a failure only concerns its own data point
+            try:
+                data_dir = pending_job['data_dir']
+                sim_exp.write_report(k, os.path.join(data_dir, 'params.npy'), os.path.join(data_dir, 'p3d_poses.npy'),
+                                     os.path.join(data_dir, 'p2d_poses.npy'))
+                render_job = sim_exp.get_final_render_job(k, images_save_dirs[k], cc_specs_save_dirs[k])
+
+            except Exception as e:
+                record['status'] = 'failed'
+                record['error'] = repr(e)
+                record['traceback'] = traceback.format_exc()
+                records.append(record)
+                continue
+
+            if render_job is None:
+                result_cache.commit(data_dir, record['key'])
+                records.append(record)
+            else:
+                render_tasks.append({'record': record, 'render_job': render_job})
+
+    return records, render_tasks
+
+
+def run_final_render(render_task):
+    """
+    Render the final image of one job of a lockstep batch and commit its result
+
+    Args:
+        render_task (dict): output of run_lockstep_batches, with keys record and render_job
+
+    Returns:
+        (dict): record of the job, same as run_job returns, with the render time added
+
+    Note:
+        Everything the rendering prints goes to log.txt inside the data directory of the job
+    """
+    record = dict(render_task['record'])
+    start_time = time.time()
+
+    try:
+        with open(os.path.join(record['data_dir'], 'log.txt'), 'w') as log_file, contextlib.redirect_stdout(log_file):
+            render_final_image(render_task['render_job'])
+            wait_for_image_writes()
+
+        result_cache.commit(record['data_dir'], record['key'])
+
+    ## Renderers report failures with exit()
+    except (Exception, SystemExit) as e:
+        record['status'] = 'failed'
+        record['error'] = repr(e)
+        record['traceback'] = traceback.format_exc()
+
+    record['time'] += time.time() - start_time
+
+    return record
+
+
+def run_pool_task(task):
+    """
+    Args:
+        task (dict): output of make_job, or render task of run_lockstep_batches
+
+    Returns:
+        (dict): record of the job, see run_job and run_final_render
+    """
+    if 'render_job' in task:
+        return run_final_render(task)
+
+    return run_job(task)
+
+
+def run_batched_jobs(jobs):
+    """
+    Run batchable jobs with run_lockstep_batches and their final renders in this process
+
+    Args:
+        jobs (list of dict): outputs of make_job, all batchable (see is_batchable)
+
+    Returns:
+        (list of dict): records of the jobs, same as run_job returns
+    """
+    records, render_tasks = run_lockstep_batches(jobs)
+
+    return records + [run_final_render(render_task) for render_task in render_tasks]
+
+
+def init_worker(n_threads):
+    """
+    Limit the threads of each worker process so that n_workers processes do not oversubscribe the cores
+    """
+    torch.set_num_threads(n_threads)
+
+
+def format_duration(seconds):
+    """
+    Args:
+        seconds (float): duration
+
+    Returns:
+        (string): duration as h:mm:ss
+    """
+    seconds = int(round(seconds))
+    return str(seconds // 3600) + ':' + str(seconds // 60 % 60).zfill(2) + ':' + str(seconds % 60).zfill(2)
+
+
+class ParallelExperimentRunner:
+
+    def __init__(self, n_workers=None):
+        """
+        Run SimulationExperiment jobs over a pool of worker processes
+
+        Args:
+            n_workers (int or None): number of worker processes, None for one per core. With 1 worker
+                the jobs run in this process
+        """
+        if n_workers is None:
+            n_workers = os.cpu_count() or 1
+
+        self.n_workers = max(1, int(n_workers))
+        self.records = []
+
+    def print_progress(self, record, n_done, n_jobs, start_time):
+        """
+        Print the outcome of a finished job together with the overall progress and estimated time left
+        """
+        elapsed = time.time() - start_time
+
+        ## Cached jobs take no time, so estimate the time left from the computed jobs only
+        n_computed = sum(1 for r in self.records if r['status'] != 'cached')
+        if n_computed:
+            eta = elapsed / n_computed * (n_jobs - n_done)
+        else:
+            eta = 0.0
+
+        print('[' + str(n_done) + '/' + str(n_jobs) + '] ' + record['exp_name'] + ' data ' + str(record['data_index']) +
+              ' ' + record['status'] + ' in ' + str(round(record['time'], 1)) + 's | elapsed ' + format_duration(elapsed) +
+              ' | ETA ' + format_duration(eta))
+
+        if record['status'] == 'failed':
+            print('    ' + record['error'])
+
+        sys.stdout.flush()
+
+    def run(self, jobs, on_result=None, batch_simulation=False):
+        """
+        Execute the jobs, in any order
+
+        Args:
+            jobs (list of dict): outputs of make_job
+            on_result (callable or None): called in this process with the record of each finished job,
+                e.g. to collect results into a ResultStore as they come in
+            batch_simulation (bool): whether to run the control of the batchable jobs (see is_batchable) in this
+                process as lockstep batches with run_lockstep_batches. Their final renders then go to the pool
+                together with the remaining jobs
+
+        Returns:
+            (list of dict): records returned by run_job, in order of completion
+        """
+        self.records = []
+        start_time = time.time()
+        n_jobs = len(jobs)
+
+        if batch_simulation:
+            batched_jobs = [job for job in jobs if is_batchable(job)]
+            jobs = [job for job in jobs if not is_batchable(job)]
+
+            batched_records, render_tasks = run_lockstep_batches(batched_jobs)
+            jobs = render_tasks + jobs
+
+            for record in batched_records:
+                self.records.append(record)
+                self.print_progress(record, len(self.records), n_jobs, start_time)
+
+                if on_result is not None:
+                    on_result(record)
+
+        if self.n_workers == 1 or len(jobs) <= 1:
+            for job in jobs:
+                self.records.append(run_pool_task(job))
+                self.print_progress(self.records[-1], len(self.records), n_jobs, start_time)
+
+                if on_result is not None:
+                    on_result(self.records[-1])
+
+        else:
+            n_threads = max(1, (os.cpu_count() or 1) // self.n_workers)
+
+            with multiprocessing.Pool(self.n_workers, initializer=init_worker, initargs=(n_threads,), maxtasksperchild=50) as pool:
+                for record in pool.imap_unordered(run_pool_task, jobs):
+                    self.records.append(record)
+                    self.print_progress(record, len(self.records), n_jobs, start_time)
+
+                    if on_result is not None:
+                        on_result(record)
+
+        return self.records
+
+    def get_failures(self):
+        """
+        Returns:
+            (list of dict): records of the failed jobs of the last run
+        """
+        return [record for record in self.records if record['status'] == 'failed']
+
+    def get_n_cached(self):
+        """
+        Returns:
+            (int): number of jobs of the last run skipped because their results were already committed
+        """
+        return sum(1 for record in self.records if record['status'] == 'cached')
+
+    def write_report(self, report_path):
+        """
+        Write the records of the last run as JSON
+
+        Args:
+            report_path (path string to json file): path to write the report
+        """
+        with open(report_path, 'w') as f:
+            json.dump({'n_jobs': len(self.records), 'n_failed': len(self.get_failures()), 'n_cached': self.get_n_cached(),
+                       'records': self.records}, f, indent=4)
@@ -22,11 +22,20 @@ import torch
 import shutil
 import os
 import pdb
+import time
 import argparse
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from reference_preprocessing import get_reference_data
+
+
+## Bernstein basis of getBezierCurve, keyed by number of samples
+BERNSTEIN_BASIS_CACHE = {}
 
 
 class reconstructCurve():
-    def __init__(self, img_path, curve_length_gt, P0_gt, para_gt, para_init, loss_weight, total_itr, verbose=0):
+    def __init__(self, img_path, curve_length_gt, P0_gt, para_gt, para_init, loss_weight, total_itr, verbose=0, solver='adam'):
 
         # self.img_id = 1
         # self.save_dir = './steps_imgs_left_1_STCF'
@@ -44,6 +53,11 @@ class reconstructCurve():
         self.total_itr = total_itr
         self.verbose = verbose
 
+        # 'adam' : gradient steps of lr 1e-3, 'lbfgs' : LBFGS with line search,
+        # 'lm' : Levenberg-Marquardt on the residuals of getResiduals
+        self.solver = solver
+        self.solver_report = None
+
         self.OFF_SET = torch.tensor([0.00, 0.00, 0.00])
 
         # self.img_raw_skeleton = np.genfromtxt(
@@ -74,11 +88,18 @@ class reconstructCurve():
 
         self.Fourier_order_N = 1
 
-        raw_img_rgb = cv2.imread(img_path)
+        ## img_path may also be an already rendered image (BGR or BGRA numpy array), which skips the PNG round trip
+        if isinstance(img_path, np.ndarray):
+            raw_img_rgb = np.ascontiguousarray(img_path[:, :, :3])
+        else:
+            raw_img_rgb = cv2.imread(img_path)
         # self.cam_distCoeffs = torch.tensor([-4.0444238705587998e-01, 5.8161897902897197e-01, -4.9797819387316098e-03, 2.3217574337593299e-03, -2.1547479006608700e-01])
         # raw_img_rgb_undst = cv2.undistort(raw_img_rgb, self.cam_K.detach().numpy(), self.cam_distCoeffs.detach().numpy())
-        self.raw_img_rgb = cv2.resize(raw_img_rgb,
-                                      (int(raw_img_rgb.shape[1] / downscale), int(raw_img_rgb.shape[0] / downscale)))
+        if downscale == 1.0:
+            self.raw_img_rgb = raw_img_rgb
+        else:
+            self.raw_img_rgb = cv2.resize(raw_img_rgb,
+                                          (int(raw_img_rgb.shape[1] / downscale), int(raw_img_rgb.shape[0] / downscale)))
         self.raw_img = cv2.cvtColor(raw_img_rgb, cv2.COLOR_RGB2GRAY)
 
         # self.blur_raw_img = cv2.GaussianBlur(self.raw_img, (gaussian_blur_kern_size, gaussian_blur_kern_size), 0)
@@ -104,63 +125,61 @@ class reconstructCurve():
         self.pos_bezier_3D_gt = self.getAnyBezierCurve(self.para_gt, self.P0_gt)
         self.pos_bezier_3D_init = self.getAnyBezierCurve(para_init, self.P0_gt)
 
+    def getBernsteinBasis(self, num_samples):
+        """
+        Cubic Bernstein basis of the curve and of its (unscaled) derivative, computed once per sample count
+
+        Returns:
+            basis_pos ((num_samples, 4) tensor): weights of control points [P1, P1p, P2, P2p] for the positions
+            basis_der ((num_samples, 4) tensor): weights of control points [P1, P1p, P2, P2p] for the derivatives
+        """
+        if num_samples not in BERNSTEIN_BASIS_CACHE:
+            s = torch.linspace(0, 1, num_samples).reshape(-1, 1)
+
+            basis_pos = torch.cat(((1 - s)**3, 3 * s * (1 - s)**2, s**3, 3 * (1 - s) * s**2), dim=1)
+            basis_der = torch.cat((-(1 - s)**2, (1 - s)**2 - 2 * s * (1 - s), s**2, -s**2 + 2 * (1 - s) * s), dim=1)
+
+            BERNSTEIN_BASIS_CACHE[num_samples] = (basis_pos, basis_der)
+
+        return BERNSTEIN_BASIS_CACHE[num_samples]
+
     def getBezierCurve(self, control_pts):
 
         self.num_samples = 200
-        P1 = control_pts[0, :]
-        P1p = control_pts[1, :]
-        P2 = control_pts[2, :]
-        P2p = control_pts[3, :]
-
-        sample_list = torch.linspace(0, 1, self.num_samples)
+        basis_pos, basis_der = self.getBernsteinBasis(self.num_samples)
 
         # Get positions and normals from samples along bezier curve
-        pos_bezier = torch.zeros(self.num_samples, 3)
-        der_bezier = torch.zeros(self.num_samples, 3)
-        for i, s in enumerate(sample_list):
-            pos_bezier[i, :] = (1 - s)**3 * P1 + 3 * s * (1 - s)**2 * \
-                P1p + 3 * (1 - s) * s**2 * P2p + s**3 * P2
-            der_bezier[i, :] = -(1 - s)**2 * P1 + ((1 - s)**2 - 2 * s * (1 - s)) * P1p + (-s**2 + 2 *
-                                                                                          (1 - s) * s) * P2p + s**2 * P2
+        # control_pts rows are [P1, P1p, P2, P2p]
+        pos_bezier = torch.matmul(basis_pos.to(control_pts.dtype), control_pts).float()
+        der_bezier = torch.matmul(basis_der.to(control_pts.dtype), control_pts).float()
 
         # Convert positions and normals to camera frame
         self.pos_bezier_3D = pos_bezier
-        pos_bezier_H = torch.cat((pos_bezier, torch.ones(self.num_samples, 1)), dim=1)
 
-        pos_bezier_cam_H = torch.transpose(torch.matmul(self.cam_RT_H, torch.transpose(pos_bezier_H, 0, 1)), 0, 1)
-        self.pos_bezier_cam = pos_bezier_cam_H[1:, :-1]
+        cam_R = self.cam_RT_H[:-1, :-1]
+        cam_t = self.cam_RT_H[:-1, -1]
+        self.pos_bezier_cam = torch.matmul(pos_bezier[1:, :], cam_R.T) + cam_t
 
         # print(pos_bezier)
         # pos_bezier.register_hook(print)
-        # P1.register_hook(print)
-        # P1p.register_hook(print)
-        # P2.register_hook(print)
-        # P2p.register_hook(print)
 
-        der_bezier_H = torch.cat((der_bezier, torch.zeros((self.num_samples, 1))), dim=1)
-        der_bezier_cam_H = torch.transpose(torch.matmul(self.cam_RT_H, torch.transpose(der_bezier_H[1:, :], 0, 1)), 0,
-                                           1)
-        self.der_bezier_cam = der_bezier_cam_H[:, :-1]
+        self.der_bezier_cam = torch.matmul(der_bezier[1:, :], cam_R.T)
 
         # pdb.set_trace()
 
     def getAnyBezierCurve(self, para, P0):
 
         num_samples = 200
-        sample_list = torch.linspace(0, 1, num_samples)
+        basis_pos, _ = self.getBernsteinBasis(num_samples)
 
         P1 = torch.tensor([0.02, 0.002, 0.0])
-        PC = torch.tensor([para[0], para[1], para[2]])
-        P2 = torch.tensor([para[3], para[4], para[5]])
+        PC = torch.as_tensor(para[0:3]).detach().float()
+        P2 = torch.as_tensor(para[3:6]).detach().float()
         P1p = 2 / 3 * PC + 1 / 3 * P1
         P2p = 2 / 3 * PC + 1 / 3 * P2
 
-        # Get positions and normals from samples along bezier curve
-        pos_bezier = torch.zeros(num_samples, 3)
-        der_bezier = torch.zeros(num_samples, 3)
-        for i, s in enumerate(sample_list):
-            pos_bezier[i, :] = (1 - s)**3 * P1 + 3 * s * (1 - s)**2 * \
-                P1p + 3 * (1 - s) * s**2 * P2p + s**3 * P2
+        # Get positions from samples along bezier curve
+        pos_bezier = torch.matmul(basis_pos, torch.stack((P1, P1p, P2, P2p)))
 
         return pos_bezier
 
@@ -702,40 +721,8 @@ class reconstructCurve():
         # print(self.raw_img)
 
         # perform skeletonization, need to extend the boundary of the image
-        extend_dim = int(60)
-        img_thresh_extend = np.zeros((self.res_height, self.res_width + extend_dim))
-        img_thresh_extend[0:self.res_height, 0:self.res_width] = img_thresh.copy() / 255
-
-        left_boundarylineA_id = np.squeeze(np.argwhere(img_thresh_extend[:, self.res_width - 1]))
-        left_boundarylineB_id = np.squeeze(np.argwhere(img_thresh_extend[:, self.res_width - 10]))
-
-        extend_vec_pt1_center = np.array([self.res_width, (left_boundarylineA_id[0] + left_boundarylineA_id[-1]) / 2])
-        extend_vec_pt2_center = np.array(
-            [self.res_width - 5, (left_boundarylineB_id[0] + left_boundarylineB_id[-1]) / 2])
-        exten_vec = extend_vec_pt2_center - extend_vec_pt1_center
-
-        if exten_vec[1] == 0:
-            exten_vec[1] += 0.00000001
-
-        k_extend = exten_vec[0] / exten_vec[1]
-        b_extend_up = self.res_width - k_extend * left_boundarylineA_id[0]
-        b_extend_dw = self.res_width - k_extend * left_boundarylineA_id[-1]
-
-        # then it could be able to get the intersection point with boundary
-        extend_ROI = np.array([
-            np.array([self.res_width, left_boundarylineA_id[0]]),
-            np.array([self.res_width, left_boundarylineA_id[-1]]),
-            np.array([self.res_width + extend_dim,
-                      int(((self.res_width + extend_dim) - b_extend_dw) / k_extend)]),
-            np.array([self.res_width + extend_dim,
-                      int(((self.res_width + extend_dim) - b_extend_up) / k_extend)])
-        ])
-
-        img_thresh_extend = cv2.fillPoly(img_thresh_extend, [extend_ROI], 1)
-
-        skeleton = skeletonize(img_thresh_extend)
-
-        self.img_raw_skeleton = np.argwhere(skeleton[:, 0:self.res_width] == 1)
+        # (see reference_preprocessing.extend_mask_boundary; the skeleton is cached per image)
+        self.img_raw_skeleton = get_reference_data(img_thresh, ['skeleton'], extend_boundary=True)['skeleton']
 
         # # display results
         # fig, axes = plt.subplots(nrows=1, ncols=2, figsize=(8, 4), sharex=True, sharey=True)
@@ -1467,13 +1454,12 @@ class reconstructCurve():
         # -------------------------------------------------------------------------------
 
         # -------------------------------------------------------------------------------
-        skeleton_by_corresp = []
-        for i in range(skeleton.shape[0]):
-            err = torch.linalg.norm(skeleton[i] - centerline_shift, ord=None, axis=1)
-            index = torch.argmin(err)
-            temp = centerline_shift[index, ]
-            skeleton_by_corresp.append(temp)
-        skeleton_by_corresp = torch.stack(skeleton_by_corresp)
+        # nearest centerline sample of every skeleton pixel, all at once; the correspondence itself
+        # carries no gradient, which only flows through the gathered centerline samples
+        with torch.no_grad():
+            err = torch.cdist(skeleton, centerline_shift, compute_mode='donot_use_mm_for_euclid_dist')
+            index = torch.argmin(err, dim=1)
+        skeleton_by_corresp = centerline_shift[index, ]
 
         self.CENTERLINE_SHAPE = centerline.shape[0]
         # err_skeleton_by_corresp = torch.linalg.norm(skeleton - skeleton_by_corresp, ord=None, axis=1) / self.res_width
@@ -2631,6 +2617,16 @@ class reconstructCurve():
         return obj_J
 
     def getOptimize(self, ref_point_contour, P0_gt):
+        if self.solver == 'lbfgs':
+            return self.getOptimizeLBFGS(P0_gt)
+        elif self.solver == 'lm':
+            return self.getOptimizeLM(P0_gt)
+        elif self.solver != 'adam':
+            print('[ERROR] [reconstructCurve] solver invalid: ', self.solver)
+            exit()
+
+        start_time = time.time()
+
         def closure():
             self.optimizer.zero_grad()
             self.loss = self.getCostFun(ref_point_contour, P0_gt)
@@ -2701,6 +2697,8 @@ class reconstructCurve():
 
         # self.plotProjCenterline()
 
+        self.setSolverReport('adam', self.GD_Iteration, self.GD_Iteration, time.time() - start_time, self.loss)
+
         print("Final --->", self.para)
         print("GT    --->", self.para_gt)
         print("Error --->", torch.abs(self.para - self.para_gt))
@@ -2712,6 +2710,349 @@ class reconstructCurve():
 
         return self.saved_opt_history, self.para
 
+    def setSolverReport(self, solver, iterations, func_evals, wall_time, loss):
+        """
+        Record and print the convergence diagnostics of the last optimization in self.solver_report
+        """
+        self.solver_report = {
+            'solver': solver,
+            'iterations': int(iterations),
+            'func_evals': int(func_evals),
+            'time': wall_time,
+            'loss': float(torch.as_tensor(loss).detach())
+        }
+
+        print('[reconstructCurve] ' + solver + ' : ' + str(int(iterations)) + ' iterations, ' + str(int(func_evals)) +
+              ' evaluations, ' + str(round(wall_time, 3)) + ' s, final loss ' + str(self.solver_report['loss']))
+
+    def getOptimizeLBFGS(self, P0_gt):
+        """
+        Minimize the getCostFun objective with LBFGS and a strong Wolfe line search, for at most total_itr iterations
+
+        Returns:
+            saved_opt_history ((itr + 1, 7) numpy array): each row : [loss of iter, para]
+            para ((6,) tensor): optimized parameters
+        """
+        start_time = time.time()
+        self.optimizer = torch.optim.LBFGS([self.para], lr=1, max_iter=self.total_itr, tolerance_change=1e-6,
+                                           history_size=10, line_search_fn='strong_wolfe')
+
+        def closure():
+            self.optimizer.zero_grad()
+            self.loss = self.getCostFun(None, P0_gt)
+            self.loss.backward()
+
+            saved_value = np.hstack((self.loss.detach().numpy(), self.para.detach().numpy()))
+            self.saved_opt_history = np.vstack((self.saved_opt_history, saved_value))
+
+            return self.loss
+
+        self.optimizer.step(closure)
+
+        with torch.no_grad():
+            self.loss = self.getCostFun(None, P0_gt)
+
+        state = self.optimizer.state[self.optimizer.param_groups[0]['params'][0]]
+        self.GD_Iteration = state['n_iter']
+        self.setSolverReport('lbfgs', state['n_iter'], state['func_evals'], time.time() - start_time, self.loss)
+
+        return self.saved_opt_history, self.para
+
+    def getOptimizeLM(self, P0_gt, damping=1e-3, max_step=0.01):
+        """
+        Minimize the least squares counterpart of the getCostFun objective with Levenberg-Marquardt on the residuals
+            of getResiduals, for at most total_itr iterations
+
+        Args:
+            P0_gt ((3,) tensor): start point of the curve
+            damping (float): initial damping, relative to the diagonal of the Gauss-Newton matrix
+            max_step (float): largest change of the parameters in one iteration, in meters. The
+                correspondences are only valid near the current curve, so long steps are shortened
+
+        Returns:
+            saved_opt_history ((itr + 1, 7) numpy array): each row : [loss of iter, para], the loss being the
+                squared norm of the residuals
+            para ((6,) tensor): optimized parameters
+
+        Note:
+            self.loss and the solver report hold the getCostFun objective at the result, comparable with the other
+                solvers
+        """
+        start_time = time.time()
+
+        def residual_fun(para):
+            return self.getResiduals(para, P0_gt)
+
+        para = self.para.detach().clone().float()
+        residuals = residual_fun(para).detach()
+        loss = torch.sum(residuals**2)
+        n_evals = 1
+
+        self.GD_Iteration = 0
+
+        while self.GD_Iteration < self.total_itr:
+            # the residuals at para are those of the last accepted step
+            J = torch.autograd.functional.jacobian(residual_fun, para, vectorize=True).double()
+            n_evals += 1
+
+            H = J.T @ J
+            g = J.T @ residuals.double()
+
+            # increase the damping until the step lowers the loss
+            while True:
+                step = torch.linalg.solve(H + damping * torch.diag(torch.diag(H)), -g)
+                step = step * min(1.0, max_step / max(torch.linalg.norm(step).item(), 1e-18))
+                para_new = para + step.float()
+                residuals_new = residual_fun(para_new).detach()
+                loss_new = torch.sum(residuals_new**2)
+                n_evals += 1
+
+                if loss_new < loss or damping > 1e10:
+                    break
+                damping *= 10
+
+            self.GD_Iteration += 1
+
+            if loss_new >= loss:
+                break
+
+            converge = (loss - loss_new) < 1e-6 * loss
+            para, residuals, loss = para_new, residuals_new, loss_new
+            damping = max(damping / 10, 1e-12)
+
+            saved_value = np.hstack((loss.numpy(), para.numpy()))
+            self.saved_opt_history = np.vstack((self.saved_opt_history, saved_value))
+
+            if self.verbose:
+                print("Curr para : ", para, " loss : ", loss.item(), " damping : ", damping)
+
+            if converge:
+                break
+
+        self.para = para.clone().requires_grad_(True)
+
+        with torch.no_grad():
+            self.loss = self.getCostFun(None, P0_gt)
+
+        self.setSolverReport('lm', self.GD_Iteration, n_evals, time.time() - start_time, self.loss)
+
+        return self.saved_opt_history, self.para
+
+    def getSkeletonTensor(self):
+        """
+        Raw image skeleton as used by getCenterlineSegmentsObj, ordered from the tip
+        """
+        skeleton = torch.as_tensor(self.img_raw_skeleton).float()
+
+        if skeleton[0, 1] >= 620:
+            skeleton = torch.flip(skeleton, dims=[0])
+
+        return torch.flip(skeleton, dims=[1])
+
+    def getObjectiveTermsBatch(self, para_batch, P0_gt, signed=False):
+        """
+        Unweighted terms of the getCostFun objective for several parameter vectors at once
+
+        Args:
+            para_batch ((N, 6) tensor): candidate parameters [C, P2]
+            P0_gt ((3,) tensor): start point of the curve
+            signed (bool): whether to return the signed error components instead of the distances
+
+        Returns:
+            err_centerline ((N, n_skeleton) tensor): distance of each skeleton pixel to its nearest centerline
+                sample, divided by the number of centerline samples
+            err_tip ((N,) tensor): distance between the tips of skeleton and centerline
+            err_curve_length ((N,) tensor): relative error of the curve length
+
+        Note:
+            With signed, err_centerline has shape (N, n_skeleton, 2) and holds the offsets of the skeleton pixels
+                from their nearest centerline samples divided by the square root of the number of centerline
+                samples, err_tip has shape (N, 2) and holds the offset of the skeleton tip, and err_curve_length
+                is signed. Each squared component then equals its getCostFun term at an error of one pixel
+        """
+        n = para_batch.shape[0]
+
+        P1 = (P0_gt + self.OFF_SET).expand(n, 3)
+        C = para_batch[:, 0:3] + self.OFF_SET
+        P2 = para_batch[:, 3:6] + self.OFF_SET
+        P1p = 2 / 3 * C + 1 / 3 * P1
+        P2p = 2 / 3 * C + 1 / 3 * P2
+        control_pts = torch.stack((P1, P1p, P2, P2p), dim=1)
+
+        # curve and its projection, (N, num_samples - 1, 3) and (N, num_samples - 1, 2)
+        basis_pos, _ = self.getBernsteinBasis(200)
+        pos_bezier = torch.matmul(basis_pos.to(control_pts.dtype), control_pts).float()
+        pos_bezier_cam = torch.matmul(pos_bezier[:, 1:, :], self.cam_RT_H[:-1, :-1].T) + self.cam_RT_H[:-1, -1]
+        proj_bezier_img = torch.matmul(pos_bezier_cam[:, :, :-1] / pos_bezier_cam[:, :, -1:], self.cam_K[:-1, :-1].T) + self.cam_K[:-1, -1]
+
+        # centerline objective, as in getCenterlineSegmentsObj
+        centerline = torch.flip(proj_bezier_img, dims=[1])
+        skeleton = self.getSkeletonTensor()
+
+        with torch.no_grad():
+            err = torch.cdist(skeleton.expand(n, -1, -1), centerline, compute_mode='donot_use_mm_for_euclid_dist')
+            index = torch.argmin(err, dim=2)
+        skeleton_by_corresp = torch.gather(centerline, 1, index.unsqueeze(-1).expand(-1, -1, 2))
+
+        # curve length objective, as in getCurveLengthObj
+        len_sum = torch.sum(torch.linalg.norm(torch.diff(pos_bezier_cam, axis=1), ord=None, axis=2), dim=1)
+
+        if signed:
+            return ((skeleton - skeleton_by_corresp) / math.sqrt(centerline.shape[1]), skeleton[0, :] - centerline[:, 0, :],
+                    (len_sum - self.curve_length_gt) * (1.0 / self.curve_length_gt))
+
+        err_centerline = torch.linalg.norm(skeleton - skeleton_by_corresp, ord=None, axis=2) / centerline.shape[1]
+        err_tip = torch.linalg.norm(skeleton[0, :] - centerline[:, 0, :], ord=None, axis=1)
+        err_curve_length = torch.abs(len_sum - self.curve_length_gt) * (1.0 / self.curve_length_gt)
+
+        return err_centerline, err_tip, err_curve_length
+
+    def getCostFunBatch(self, para_batch, P0_gt):
+        """
+        Objective of getCostFun for several parameter vectors at once
+
+        Args:
+            para_batch ((N, 6) tensor): candidate parameters [C, P2]
+            P0_gt ((3,) tensor): start point of the curve
+
+        Returns:
+            ((N,) tensor): objective of each candidate
+        """
+        err_centerline, err_tip, err_curve_length = self.getObjectiveTermsBatch(para_batch, P0_gt)
+
+        return torch.sum(err_centerline, dim=1) * self.loss_weight[0] + err_tip * self.loss_weight[1] + err_curve_length * self.loss_weight[2]
+
+    def getResiduals(self, para, P0_gt):
+        """
+        Residual vector of the least squares counterpart of the getCostFun objective: the signed error components of
+            getObjectiveTermsBatch scaled by the square roots of the loss weights
+
+        Args:
+            para ((6,) tensor): parameters [C, P2]
+            P0_gt ((3,) tensor): start point of the curve
+
+        Returns:
+            ((2 * n_skeleton + 3,) tensor): weighted error components
+
+        Note:
+            getCostFun sums distances while the squared norm of the residuals sums squared distances, so both agree
+                on the minimum of an exact fit but weigh outliers differently
+        """
+        err_centerline, err_tip, err_curve_length = self.getObjectiveTermsBatch(para.reshape(1, -1), P0_gt, signed=True)
+        weight_sqrt = torch.sqrt(torch.as_tensor(self.loss_weight, dtype=torch.float))
+
+        return torch.cat((err_centerline[0].reshape(-1) * weight_sqrt[0], err_tip[0] * weight_sqrt[1], err_curve_length * weight_sqrt[2]))
+
+    def getMultiStartInits(self, n_starts, init_std=0.005, seed=None):
+        """
+        Candidates for getOptimizeMultiStart: the current para and random perturbations of it
+
+        Args:
+            n_starts (int): number of candidates
+            init_std (float): standard deviation of the perturbations, in meters
+            seed (int or None): seed of the perturbations
+
+        Returns:
+            ((n_starts, 6) tensor): candidate parameters, the first one being the current para
+        """
+        generator = torch.Generator()
+        if seed is not None:
+            generator.manual_seed(seed)
+
+        para_init = self.para.detach().float().reshape(1, -1)
+        noise = torch.randn((n_starts - 1, para_init.shape[1]), generator=generator) * init_std
+
+        return torch.cat((para_init, para_init + noise), dim=0)
+
+    def keepAdamRows(self, optimizer, para, keep):
+        """
+        Drop candidates from a batched Adam optimization, keeping the moments of the remaining ones
+
+        Returns:
+            new_para ((len(keep), 6) tensor): remaining candidates
+            new_optimizer (torch.optim.Adam): optimizer of the remaining candidates
+        """
+        new_para = para.detach()[keep].clone().requires_grad_(True)
+        new_optimizer = torch.optim.Adam([new_para], lr=optimizer.param_groups[0]['lr'])
+
+        state = optimizer.state[para]
+        if state:
+            new_optimizer.state[new_para] = {
+                'step': state['step'],
+                'exp_avg': state['exp_avg'][keep].clone(),
+                'exp_avg_sq': state['exp_avg_sq'][keep].clone()
+            }
+
+        return new_para, new_optimizer
+
+    def getOptimizeMultiStart(self, para_inits, P0_gt, prune_every=0, keep_ratio=0.5):
+        """
+        Run the Adam optimization of getOptimize from several starts at once and keep the best result
+
+        Args:
+            para_inits ((N, 6) tensor): candidate initial parameters, e.g. from getMultiStartInits
+            P0_gt ((3,) tensor): start point of the curve
+            prune_every (int): every prune_every iterations, only the keep_ratio best candidates
+                keep optimizing; 0 to never prune
+            keep_ratio (float): fraction of candidates kept at each pruning
+
+        Returns:
+            saved_opt_history ((itr + 1, 7) numpy array): each row : [loss of iter, para] of the best candidate
+            para ((6,) tensor): best parameters, also set as self.para
+
+        Note:
+            Each candidate stops on its own with the stopping rule of getOptimize. Since Adam works
+                element-wise, the candidates follow the same steps as separate getOptimize runs.
+        """
+        n_starts = para_inits.shape[0]
+        para = para_inits.detach().clone().float().requires_grad_(True)
+        optimizer = torch.optim.Adam([para], lr=1e-3)
+
+        ids = torch.arange(n_starts)  # candidate index of each row of para
+        last_loss = torch.full((n_starts, ), 99.0)
+        final_loss = torch.full((n_starts, ), float('inf'))
+        final_para = para.detach().clone()
+        history = [[] for _ in range(n_starts)]
+
+        self.GD_Iteration = 0
+
+        while ids.shape[0] > 0 and self.GD_Iteration < self.total_itr:
+            optimizer.zero_grad()
+            loss = self.getCostFunBatch(para, P0_gt)
+            torch.sum(loss).backward()
+            optimizer.step()
+
+            loss = loss.detach()
+            self.GD_Iteration += 1
+
+            for row, i in enumerate(ids.tolist()):
+                history[i].append(np.hstack((loss[row].numpy(), para[row].detach().numpy())))
+
+            final_loss[ids] = loss
+            final_para[ids] = para.detach()
+
+            keep = torch.abs(loss - last_loss[ids]) >= 1e-6
+            last_loss[ids] = loss
+
+            if prune_every > 0 and self.GD_Iteration % prune_every == 0:
+                n_keep = max(1, int(math.ceil(ids.shape[0] * keep_ratio)))
+                keep &= loss <= torch.sort(loss)[0][n_keep - 1]
+
+            if self.verbose:
+                print("Candidates : ", ids.shape[0], " best loss : ", torch.min(final_loss).item())
+
+            if not torch.all(keep):
+                ids = ids[keep]
+                para, optimizer = self.keepAdamRows(optimizer, para, torch.nonzero(keep).flatten())
+
+        best = int(torch.argmin(final_loss))
+        self.multi_start_losses = final_loss
+        self.loss = final_loss[best]
+        self.para = final_para[best].clone().requires_grad_(True)
+        self.saved_opt_history = np.vstack([np.zeros((1, self.para.shape[0] + 1))] + history[best])
+
+        return self.saved_opt_history, self.para
+
     def plotOptimizeResult(self, ref_point_contour):
         P1 = torch.tensor([0., 0., 0.])
         P1p = torch.tensor([-1.0, 0.0, 0.0])
@@ -0,0 +1,285 @@
+import os
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+import cv2
+import skimage.morphology as skimage_morphology
+
+
+
+## Directory of the on-disk cache, None to cache in memory only
+cache_dir = None
+
+## Number of reference images kept in the in-memory cache
+memory_cache_size = 64
+
+_memory_cache = OrderedDict()
+
+
+def get_mask_hash(mask):
+    """
+    Args:
+        mask ((H, W) bool numpy array): binary reference image
+
+    Returns:
+        (string): hex digest identifying the mask
+    """
+    h = hashlib.sha1(str(mask.shape).encode())
+    h.update(np.packbits(mask).tobytes())
+
+    return h.hexdigest()
+
+
+def extend_mask_boundary(mask, extend_dim=60):
+    """
+    Pad the mask on the right and continue the catheter into the padding along the direction it leaves the image,
+        so that skeletonization reaches the image boundary instead of stopping short of it
+
+    Args:
+        mask ((H, W) bool numpy array): binary reference image, with the catheter leaving through the right edge
+        extend_dim (int): number of padded columns
+
+    Returns:
+        ((H, W + extend_dim) float numpy array): padded mask with values 0 and 1
+    """
+    img_height = mask.shape[0]
+    img_width = mask.shape[1]
+
+    img_thresh_extend = np.zeros((img_height, img_width + extend_dim))
+    img_thresh_extend[0:img_height, 0:img_width] = mask
+
+    # get the left boundary of the image
+    left_boundarylineA_id = np.squeeze(np.argwhere(img_thresh_extend[:, img_width - 1]))
+    left_boundarylineB_id = np.squeeze(np.argwhere(img_thresh_extend[:, img_width - 10]))
+
+    # get the center of the left boundary
+    extend_vec_pt1_center = np.array([img_width, (left_boundarylineA_id[0] + left_boundarylineA_id[-1]) / 2])
+    extend_vec_pt2_center = np.array([img_width - 5, (left_boundarylineB_id[0] + left_boundarylineB_id[-1]) / 2])
+    exten_vec = extend_vec_pt2_center - extend_vec_pt1_center
+
+    # avoid dividing by zero
+    if exten_vec[1] == 0:
+        exten_vec[1] += 0.00000001
+
+    # get the slope and intercept of the line
+    k_extend = exten_vec[0] / exten_vec[1]
+    b_extend_up = img_width - k_extend * left_boundarylineA_id[0]
+    b_extend_dw = img_width - k_extend * left_boundarylineA_id[-1]
+
+    # extend the ROI to the right
+    extend_ROI = np.array([
+        np.array([img_width, left_boundarylineA_id[0]]),
+        np.array([img_width, left_boundarylineA_id[-1]]),
+        np.array([img_width + extend_dim, int(((img_width + extend_dim) - b_extend_dw) / k_extend)]),
+        np.array([img_width + extend_dim, int(((img_width + extend_dim) - b_extend_up) / k_extend)])
+    ])
+
+    return cv2.fillPoly(img_thresh_extend, [extend_ROI], 1)
+
+
+def compute_skeleton(mask, extend_boundary, data):
+    """
+    Returns:
+        ((n, 2) int numpy array): (row, column) of every skeleton pixel, in raster order
+    """
+    img_width = mask.shape[1]
+
+    if extend_boundary:
+        skeleton = skimage_morphology.skeletonize(extend_mask_boundary(mask))
+    else:
+        skeleton = skimage_morphology.skeletonize(mask)
+
+    return np.argwhere(skeleton[:, 0:img_width] == 1)
+
+
+def compute_skeleton_ordered(mask, extend_boundary, data):
+    """
+    Order the skeleton pixels into a path by trying a depth-first traversal of their nearest neighbour graph
+        from every pixel and keeping the shortest one
+
+    Returns:
+        ((n, 2) int numpy array): (x, y) of the skeleton pixels along the path, starting from the top of the image
+
+    Note:
+        https://stackoverflow.com/questions/37742358/sorting-points-to-form-a-continuous-line
+    """
+    from sklearn.neighbors import NearestNeighbors
+    import networkx as nx
+
+    img_raw_skeleton = data['skeleton']
+
+    # creating a nearest neighbour graph to connect each of the nodes to its 2 nearest neighbors
+    clf = NearestNeighbors(n_neighbors=2).fit(img_raw_skeleton)
+    G = clf.kneighbors_graph()
+
+    # then use networkx to construct a graph from this sparse matrix
+    if hasattr(nx, 'from_scipy_sparse_matrix'):
+        T = nx.from_scipy_sparse_matrix(G)
+    else:
+        T = nx.from_scipy_sparse_array(G)
+
+    # find the order with the smallest sum of squared distances between consecutive points
+    min_dist = np.inf
+    opt_skeleton_ordered = None
+
+    for i in range(img_raw_skeleton.shape[0]):
+        path = list(nx.dfs_preorder_nodes(T, i))
+        ordered = img_raw_skeleton[path]
+
+        cost = (((ordered[:-1] - ordered[1:])**2).sum(1)).sum()
+        if cost < min_dist:
+            min_dist = cost
+            opt_skeleton_ordered = ordered
+
+    ### this can gurantee the starting point of the skeleton is always from top-->bottom
+    if opt_skeleton_ordered[0, 0] > 50:
+        opt_skeleton_ordered = np.flip(opt_skeleton_ordered, 0)
+
+    ### this will flip x/y coordinates in order to fit bezier_proj_img
+    return np.stack((opt_skeleton_ordered[:, 1], opt_skeleton_ordered[:, 0]), axis=1)
+
+
+def compute_contour(mask, extend_boundary, data):
+    """
+    Returns:
+        ((n, 2) int numpy array): (x, y) of the vertices of the largest external contour
+    """
+    contours, _ = cv2.findContours(mask.astype(np.uint8), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    largest_contour = max(contours, key=cv2.contourArea)
+
+    return largest_contour.squeeze()
+
+
+def compute_dist_map(mask, extend_boundary, data):
+    """
+    Returns:
+        ((H, W) float numpy array): distance of every pixel outside the mask to the mask
+    """
+    import skfmm
+
+    return np.asarray(skfmm.distance(np.logical_not(mask).astype(int)))
+
+
+def compute_points_dist_field(points, shape):
+    """
+    Distance transform of a set of pixels with its gradient, for O(1) nearest-point distance lookups
+        (see distance_field_chamfer.lookupDistanceField)
+
+    Args:
+        points ((n, 2) numpy array): (x, y) of the points, rounded to pixels
+        shape (tuple): (H, W) of the field, grown if needed so that every point with nonnegative coordinates
+            lies inside it
+
+    Returns:
+        ((3, H, W) float32 numpy array): distance of every pixel to the nearest point, and the derivatives of
+            that distance along x and along y
+    """
+    points = np.round(np.asarray(points).reshape(-1, 2)).astype(int)
+    points = points[np.all(points >= 0, axis=1)]
+
+    height = max(int(shape[0]), int(points[:, 1].max()) + 1 if len(points) else 0, 2)
+    width = max(int(shape[1]), int(points[:, 0].max()) + 1 if len(points) else 0, 2)
+
+    ## distanceTransform measures the distance to the nearest zero pixel
+    not_points = np.ones((height, width), dtype=np.uint8)
+    not_points[points[:, 1], points[:, 0]] = 0
+
+    dist = cv2.distanceTransform(not_points, cv2.DIST_L2, cv2.DIST_MASK_PRECISE)
+    grad_y, grad_x = np.gradient(dist)
+
+    return np.stack((dist, grad_x, grad_y)).astype(np.float32)
+
+
+def compute_contour_dist_field(mask, extend_boundary, data):
+    """
+    Returns:
+        ((3, H, W) float32 numpy array): distance field of the contour vertices, see compute_points_dist_field
+    """
+    return compute_points_dist_field(data['contour'], mask.shape)
+
+
+## Components that can be requested from get_reference_data, in dependency order
+COMPONENTS = OrderedDict([
+    ('skeleton', compute_skeleton),
+    ('skeleton_ordered', compute_skeleton_ordered),
+    ('contour', compute_contour),
+    ('dist_map', compute_dist_map),
+    ('contour_dist_field', compute_contour_dist_field),
+])
+
+## Components that other components are computed from
+DEPENDENCIES = {'skeleton_ordered': ['skeleton'], 'contour_dist_field': ['contour']}
+
+
+def get_cache_path(key):
+    return os.path.join(cache_dir, key[0] + '_ext' + str(int(key[1])) + '.npz')
+
+
+def load_from_disk(key):
+    if cache_dir is None:
+        return {}
+
+    try:
+        with np.load(get_cache_path(key)) as f:
+            return {name: f[name] for name in f.files}
+    except (OSError, ValueError):
+        return {}
+
+
+def save_to_disk(key, data):
+    if cache_dir is None:
+        return
+
+    os.makedirs(cache_dir, exist_ok=True)
+
+    path = get_cache_path(key)
+    tmp_path = path + '.tmp'
+
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **{name: data[name] for name in COMPONENTS if name in data})
+
+    os.replace(tmp_path, path)
+
+
+def get_reference_data(mask, names, extend_boundary=False):
+    """
+    Preprocess a binary reference image, computing each component at most once per image
+
+    Args:
+        mask ((H, W) numpy array): reference image, nonzero pixels belong to the catheter
+        names (list of string): components to return, keys of COMPONENTS
+        extend_boundary (bool): whether to extend the catheter into a padding on the right of the image
+            before skeletonization (see extend_mask_boundary)
+
+    Returns:
+        (dict): the requested components, keyed by name. The arrays are shared with the cache and
+            must not be modified
+
+    Note:
+        Results are cached in memory and, if cache_dir is set, on disk, keyed by a hash of the mask
+    """
+    mask = np.asarray(mask) != 0
+    key = (get_mask_hash(mask), bool(extend_boundary))
+
+    if key in _memory_cache:
+        data = _memory_cache[key]
+        _memory_cache.move_to_end(key)
+    else:
+        data = load_from_disk(key)
+        _memory_cache[key] = data
+
+        while len(_memory_cache) > memory_cache_size:
+            _memory_cache.popitem(last=False)
+
+    missing = [name for name in COMPONENTS if name in names or
+               any(name in DEPENDENCIES.get(n, []) for n in names)]
+    missing = [name for name in missing if name not in data]
+
+    for name in missing:
+        data[name] = COMPONENTS[name](mask, extend_boundary, data)
+
+    if missing:
+        save_to_disk(key, data)
+
+    return {name: data[name] for name in names}
@@ -0,0 +1,124 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+
+
+## Bump to invalidate all cached results after a change of the simulation itself
+RESULT_VERSION = 1
+
+## Name of the file marking a committed result inside a data directory
+MANIFEST_NAME = 'result.json'
+
+## Files written by CCCatheter.write_reports
+REPORT_NAMES = ['params.npy', 'p3d_poses.npy', 'p2d_poses.npy']
+
+## Job entries that only say where results go, not what they are
+KEY_EXCLUDED = ('exp_name', 'data_index', 'data_dir')
+
+
+def to_builtin(x):
+    """
+    Convert numpy values to plain Python values for JSON
+    """
+    if isinstance(x, (np.ndarray, np.generic)):
+        return x.tolist()
+
+    raise TypeError('Cannot hash value of type ' + type(x).__name__)
+
+
+def job_key(job):
+    """
+    Hash the settings that determine the result of a job
+
+    Args:
+        job (dict): output of experiment_runner.make_job, which holds the experiment config,
+            the target parameters, and the universal parameters
+
+    Returns:
+        (string): hex digest identifying the result
+    """
+    config = {k: v for k, v in job.items() if k not in KEY_EXCLUDED}
+    config['result_version'] = RESULT_VERSION
+    text = json.dumps(config, sort_keys=True, default=to_builtin)
+
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def save_npy_atomic(path, arr):
+    """
+    Save a numpy array so that path holds either the previous file or the complete new file,
+        never a partially written one
+
+    Args:
+        path (path string to npy file): path to save the array
+        arr (numpy array): array to save
+    """
+    tmp_path = path + '.tmp'
+
+    with open(tmp_path, 'wb') as f:
+        np.save(f, arr)
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(tmp_path, path)
+
+
+def is_committed(data_dir, key):
+    """
+    Args:
+        data_dir (path string to directory): result directory of a job
+        key (string): output of job_key
+
+    Returns:
+        (bool): whether data_dir holds the complete result of the job with this key
+    """
+    manifest_path = os.path.join(data_dir, MANIFEST_NAME)
+
+    try:
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return False
+
+    if manifest.get('key') != key:
+        return False
+
+    return all(os.path.isfile(os.path.join(data_dir, name)) for name in REPORT_NAMES)
+
+
+def invalidate(data_dir):
+    """
+    Remove the commit marker of data_dir before its reports are rewritten
+
+    Args:
+        data_dir (path string to directory): result directory of a job
+    """
+    manifest_path = os.path.join(data_dir, MANIFEST_NAME)
+
+    if os.path.isfile(manifest_path):
+        os.remove(manifest_path)
+
+
+def commit(data_dir, key):
+    """
+    Mark the reports in data_dir as the complete result of the job with this key
+
+    Args:
+        data_dir (path string to directory): result directory of a job
+        key (string): output of job_key
+
+    Note:
+        The reports must already be written with save_npy_atomic; the manifest is written last, so a
+            crash at any point leaves the job uncommitted and it is run again
+    """
+    manifest_path = os.path.join(data_dir, MANIFEST_NAME)
+    tmp_path = manifest_path + '.tmp'
+
+    with open(tmp_path, 'w') as f:
+        json.dump({'key': key, 'files': REPORT_NAMES}, f)
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(tmp_path, manifest_path)
@@ -5,6 +5,7 @@ import matplotlib.pyplot as plt
 import path_settings
 import experiment_setup
 import identifier_conversions
+from result_store import ResultStore
 
 
 
@@ -15,36 +16,32 @@ n_cases = 48  ## 16 x UN + 16 x IA0XX + 16 x IA1XX
 loss_thresh_p3d = 5   ## Unit: mm
 loss_thresh_p2d = 15  ## Unit: pixels
 
-MASTER_params = np.zeros((n_iter + 2, 5, n_cases, n_data))
-MASTER_p3d_poses = np.zeros((n_iter + 2, n_mid_points + 1, 3, n_cases, n_data))
-MASTER_p2d_poses = np.zeros((n_iter + 2, n_mid_points + 1, 2, n_cases, n_data))
-
 data_alias = 'D' + str(0).zfill(2)
+store_dir = os.path.join(path_settings.results_dir, data_alias + '_store')
 
 
-for exp_name in experiment_setup.experiments:
-
-    i = identifier_conversions.identifier_to_index[exp_name]
-
-    method_dir = os.path.join(path_settings.results_dir, exp_name)
+## Results written before the consolidated store existed are collected into it once
+if not os.path.isfile(os.path.join(store_dir, 'filled.npy')):
+    store = ResultStore(store_dir, n_cases, n_data, n_iter, n_mid_points, mode='a')
 
-    for j in range(n_data):
+    for exp_name in experiment_setup.experiments:
+        i = identifier_conversions.identifier_to_index[exp_name]
+        method_dir = os.path.join(path_settings.results_dir, exp_name)
 
-        data_dir = os.path.join(method_dir, data_alias + '_' + str(j).zfill(4))
-        params_report_path = os.path.join(data_dir, 'params.npy')
-        p3d_report_path = os.path.join(data_dir, 'p3d_poses.npy')
-        p2d_report_path = os.path.join(data_dir, 'p2d_poses.npy')
+        for j in range(n_data):
+            store.write_from_dir(i, j, os.path.join(method_dir, data_alias + '_' + str(j).zfill(4)))
 
-        params_report = np.load(params_report_path)
-        p3d_report = np.load(p3d_report_path)
-        p2d_report = np.load(p2d_report_path)
+    store.flush()
 
-        MASTER_params[:, :, i, j] = params_report
-        MASTER_p3d_poses[:, :, :, i, j] = p3d_report
-        MASTER_p2d_poses[:, :, :, i, j] = p2d_report
+store = ResultStore(store_dir, n_cases, n_data, n_iter, n_mid_points, mode='r')
 
+if not np.all(store.filled):
+    print('[WARNING] Results missing for ' + str(np.sum(~store.filled)) + ' jobs')
 
-MASTER_p3d_poses *= 1000  ## Convert meter to mm
+## Memory-mapped views with the data axes last; nothing is read until used
+MASTER_params = np.moveaxis(store.params, (0, 1), (-2, -1))
+MASTER_p3d_poses = np.moveaxis(store.p3d_poses, (0, 1), (-2, -1)) * 1000  ## Convert meter to mm
+MASTER_p2d_poses = np.moveaxis(store.p2d_poses, (0, 1), (-2, -1))
 
 print(MASTER_params.shape)
 print(MASTER_p3d_poses.shape)
@@ -83,29 +80,19 @@ table_1_iter_loss_thresh_p2d = np.ones(48) * -1
 print(MASTER_p3d_pose_norm_losses_tip.shape)
 
 
-for i in range(n_cases):  ## loop through methods
-
-    converge_iter_3d = []
-    converge_iter_2d = []
-
-    for j in range(n_data):  ## loop through data
+## First iteration at which each (method, data) pair gets lower than the loss threshold, if any
+converged_3d = MASTER_p3d_pose_norm_losses_tip[:n_iter] < loss_thresh_p3d
+converged_2d = MASTER_p2d_pose_norm_losses_tip[:n_iter] < loss_thresh_p2d
+converge_iter_3d = np.argmax(converged_3d, axis=0)
+converge_iter_2d = np.argmax(converged_2d, axis=0)
+has_converged_3d = np.any(converged_3d, axis=0)
+has_converged_2d = np.any(converged_2d, axis=0)
 
-        for k in range(n_iter):  ## loop through iterations
-            if MASTER_p3d_pose_norm_losses_tip[k, i, j] < loss_thresh_p3d:
-                converge_iter_3d.append(k)
-                break
-
-        for k in range(n_iter):  ## loop through iterations
-            if MASTER_p2d_pose_norm_losses_tip[k, i, j] < loss_thresh_p2d:
-                converge_iter_2d.append(k)
-                break
-
-    ## For each method, find the iteration to converge averaged on data
-    if len(converge_iter_3d) > 0:
-        table_1_iter_loss_thresh_p3d[i] = np.mean(np.array(converge_iter_3d))
-    
-    if len(converge_iter_2d) > 0:
-        table_1_iter_loss_thresh_p2d[i] = np.mean(np.array(converge_iter_2d))
+## For each method, find the iteration to converge averaged on data
+n_converged_3d = np.sum(has_converged_3d, axis=1)
+n_converged_2d = np.sum(has_converged_2d, axis=1)
+table_1_iter_loss_thresh_p3d[n_converged_3d > 0] = (np.sum(converge_iter_3d * has_converged_3d, axis=1) / np.maximum(n_converged_3d, 1))[n_converged_3d > 0]
+table_1_iter_loss_thresh_p2d[n_converged_2d > 0] = (np.sum(converge_iter_2d * has_converged_2d, axis=1) / np.maximum(n_converged_2d, 1))[n_converged_2d > 0]
      
 
 #for i in range(MASTER_p3d_pose_norm_losses_tip_data_avg.shape[1]):  ## loop through methods
@@ -125,18 +112,8 @@ for i in range(n_cases):  ## loop through methods
 MASTER_p3d_pose_norm_losses_tip_final = MASTER_p3d_pose_norm_losses_tip[-1, :, :]
 MASTER_p2d_pose_norm_losses_tip_final = MASTER_p2d_pose_norm_losses_tip[-1, :, :]
 
-table_1_convergence_percentage_p3d = np.zeros(48)
-table_1_convergence_percentage_p2d = np.zeros(48)
-
-for i in range(MASTER_p3d_pose_norm_losses_tip_final.shape[0]):
-    for j in range(MASTER_p3d_pose_norm_losses_tip_final.shape[1]):
-        if MASTER_p3d_pose_norm_losses_tip_final[i, j] < loss_thresh_p3d:
-            table_1_convergence_percentage_p3d[i] += 1
-
-for i in range(MASTER_p2d_pose_norm_losses_tip_final.shape[0]):
-    for j in range(MASTER_p2d_pose_norm_losses_tip_final.shape[1]):
-        if MASTER_p2d_pose_norm_losses_tip_final[i, j] < loss_thresh_p2d:
-            table_1_convergence_percentage_p2d[i] += 1
+table_1_convergence_percentage_p3d = np.sum(MASTER_p3d_pose_norm_losses_tip_final < loss_thresh_p3d, axis=1).astype(np.float64)
+table_1_convergence_percentage_p2d = np.sum(MASTER_p2d_pose_norm_losses_tip_final < loss_thresh_p2d, axis=1).astype(np.float64)
 
 table_1_convergence_percentage_p3d /= n_data
 table_1_convergence_percentage_p2d /= n_data
@@ -0,0 +1,85 @@
+import os
+import numpy as np
+
+
+
+class ResultStore:
+
+    def __init__(self, store_dir, n_cases, n_data, n_iter, n_mid_points, mode='r'):
+        """
+        Consolidated reports of all jobs of an experiment, one memory-mapped npy file per report
+
+        Args:
+            store_dir (path string to directory): directory holding the store
+            n_cases (int): number of methods
+            n_data (int): number of data points per method
+            n_iter (int): number of total iteration of optimization
+            n_mid_points (int): number of middle control points
+            mode ('r' or 'a'): 'r' to open an existing store read only, 'a' to create the store if
+                needed and write into it
+
+        Note:
+            params has shape (n_cases, n_data, n_iter + 2, 5), p3d_poses has shape
+                (n_cases, n_data, n_iter + 2, n_mid_points + 1, 3), and p2d_poses has shape
+                (n_cases, n_data, n_iter + 2, n_mid_points + 1, 2), so the reports of one job are contiguous.
+            filled is a (n_cases, n_data) boolean array marking which jobs have been written
+        """
+        self.store_dir = store_dir
+        self.shapes = {
+            'params': (n_cases, n_data, n_iter + 2, 5),
+            'p3d_poses': (n_cases, n_data, n_iter + 2, n_mid_points + 1, 3),
+            'p2d_poses': (n_cases, n_data, n_iter + 2, n_mid_points + 1, 2),
+            'filled': (n_cases, n_data),
+        }
+
+        if mode == 'a':
+            os.makedirs(store_dir, exist_ok=True)
+
+        for name, shape in self.shapes.items():
+            path = os.path.join(store_dir, name + '.npy')
+
+            if mode == 'r':
+                arr = np.load(path, mmap_mode='r')
+            elif os.path.isfile(path):
+                arr = np.load(path, mmap_mode='r+')
+            else:
+                dtype = np.bool_ if name == 'filled' else np.float64
+                arr = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=shape)
+
+            if arr.shape != shape:
+                print('[ERROR] [ResultStore] ' + path + ' has shape ' + str(arr.shape) + ', expected ' + str(shape))
+                exit()
+
+            setattr(self, name, arr)
+
+    def write(self, case_index, data_index, params, p3d_poses, p2d_poses):
+        """
+        Write the reports of one job
+
+        Args:
+            case_index (int): index of the method, see identifier_conversions.identifier_to_index
+            data_index (int): index of the data point
+            params ((n_iter + 2, 5) numpy array): output of CCCatheter.write_reports
+            p3d_poses ((n_iter + 2, n_mid_points + 1, 3) numpy array): output of CCCatheter.write_reports
+            p2d_poses ((n_iter + 2, n_mid_points + 1, 2) numpy array): output of CCCatheter.write_reports
+        """
+        self.params[case_index, data_index] = params
+        self.p3d_poses[case_index, data_index] = p3d_poses
+        self.p2d_poses[case_index, data_index] = p2d_poses
+        self.filled[case_index, data_index] = True
+
+    def write_from_dir(self, case_index, data_index, data_dir):
+        """
+        Copy the reports written by CCCatheter.write_reports in data_dir into the store
+        """
+        self.write(case_index, data_index,
+                   np.load(os.path.join(data_dir, 'params.npy')),
+                   np.load(os.path.join(data_dir, 'p3d_poses.npy')),
+                   np.load(os.path.join(data_dir, 'p2d_poses.npy')))
+
+    def flush(self):
+        """
+        Write the changes of a store opened with mode 'a' to disk
+        """
+        for name in self.shapes:
+            getattr(self, name).flush()
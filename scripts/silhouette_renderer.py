@@ -0,0 +1,235 @@
+import numpy as np
+import cv2
+
+import camera_settings
+
+
+
+def blender_camera_extrinsics(location, rotation_euler):
+    """
+    Calculate the world to camera RT matrix of a Blender camera
+
+    Args:
+        location ((3,) array-like): camera location
+        rotation_euler ((3,) array-like): (in radians) XYZ Euler rotation of camera
+
+    Returns:
+        ((4, 4) numpy array): RT matrix mapping world points to camera points with x pointing right,
+            y pointing down, and z pointing forward, as expected by transforms.world_to_image_transform
+
+    Note:
+        Blender cameras look along their local -z axis with local y pointing up
+    """
+    a, b, c = rotation_euler
+    R_x = np.array([[1, 0, 0], [0, np.cos(a), -np.sin(a)], [0, np.sin(a), np.cos(a)]])
+    R_y = np.array([[np.cos(b), 0, np.sin(b)], [0, 1, 0], [-np.sin(b), 0, np.cos(b)]])
+    R_z = np.array([[np.cos(c), -np.sin(c), 0], [np.sin(c), np.cos(c), 0], [0, 0, 1]])
+    R_blender = R_z @ R_y @ R_x
+
+    R = np.diag([1.0, -1.0, -1.0]) @ R_blender.T
+
+    RT = np.eye(4)
+    RT[:3, :3] = R
+    RT[:3, 3] = -R @ np.asarray(location, dtype=np.float64)
+
+    return RT
+
+
+## Camera location, rotation, and clip start of each viewpoint_mode, as set up in render_bezier_blender.py
+BLENDER_CAMERAS = {
+    1: ((0, 0, 0), (0.0, np.pi, np.pi), 0.01),
+    2: ((1, 0, 0), (0.0, np.pi / 2, 0.0), 0.01),
+    3: ((0, -0.2, -0.2), (0.0, 150.0 * np.pi / 180, 270.0 * np.pi / 180), 0.1),
+}
+
+
+class SilhouetteRenderer:
+
+    def __init__(self, radius=0.0015, n_samples=50, target_radius=0.002):
+        """
+        CPU replacement for render_bezier_blender.py that rasterizes the catheter tube with OpenCV
+
+        Args:
+            radius (float): tube radius, same as the bevel depth used in Blender
+            n_samples (int): number of segments per Bezier curve, same as the curve resolution used in Blender
+            target_radius (float): radius of the target spheres
+        """
+        self.radius = radius
+        self.n_samples = n_samples
+        self.target_radius = target_radius
+
+        self.fx = camera_settings.a
+        self.fy = camera_settings.b
+        self.cx = camera_settings.center_x
+        self.cy = camera_settings.center_y
+        self.size_x = int(camera_settings.image_size_x)
+        self.size_y = int(camera_settings.image_size_y)
+
+        ## Colors (BGR) measured from Blender renders
+        self.background_color = (70, 70, 70)
+        self.catheter_color = (224, 180, 166)
+        self.target_color = (0, 0, 255)
+
+        ## Fixed-point precision of OpenCV drawing
+        self.shift = 4
+
+        s = np.linspace(0, 1, self.n_samples + 1).reshape(-1, 1)
+        self.bernstein = np.concatenate(((1 - s) ** 3, 3 * s * (1 - s) ** 2, 3 * s ** 2 * (1 - s), s ** 3), axis=1)
+
+    def sample_beziers(self, specs):
+        """
+        Sample points on each Bezier curve
+
+        Args:
+            specs ((n, 4, 3) numpy array): start point, end point, control point 1, and control point 2
+                of each Bezier curve, as written by BezierSet.write_specs
+
+        Returns:
+            ((n, n_samples + 1, 3) numpy array): points on each Bezier curve
+        """
+        control_pts = np.asarray(specs, dtype=np.float64)[:, [0, 2, 3, 1], :]
+
+        return np.einsum('sk,nkd->nsd', self.bernstein, control_pts)
+
+    def to_camera(self, points, viewpoint_mode):
+        """
+        Args:
+            points ((..., 3) numpy array): points in world frame
+            viewpoint_mode (1, 2, or 3): camera view
+
+        Returns:
+            ((..., 3) numpy array): points in camera frame
+        """
+        location, rotation_euler, _ = BLENDER_CAMERAS[viewpoint_mode]
+        RT = blender_camera_extrinsics(location, rotation_euler)
+
+        return points @ RT[:3, :3].T + RT[:3, 3]
+
+    def to_fixed_point(self, points_2d):
+        """
+        Convert pixel coordinates to the fixed-point integers used by OpenCV drawing functions
+        """
+        bound = 1 << 20
+        return np.round(np.clip(points_2d, -bound, bound) * (1 << self.shift)).astype(np.int32)
+
+    def draw_tube(self, img, points_cam, clip_start, color):
+        """
+        Draw the silhouette of a tube of constant radius along a polyline as the union of the projected
+            cross sections and the quads connecting them
+
+        Args:
+            img ((size_y, size_x, c) numpy array): image to draw on
+            points_cam ((m, 3) numpy array): tube centerline in camera frame
+            clip_start (float): near clipping distance
+            color (tuple): drawing color
+        """
+        a = points_cam[:-1].copy()
+        b = points_cam[1:].copy()
+
+        ## Clip segments against the near plane
+        visible = (a[:, 2] >= clip_start) | (b[:, 2] >= clip_start)
+        a = a[visible]
+        b = b[visible]
+
+        t = (clip_start - a[:, 2]) / (b[:, 2] - a[:, 2])
+        clip_a = a[:, 2] < clip_start
+        clip_b = b[:, 2] < clip_start
+        a[clip_a] = a[clip_a] + t[clip_a, None] * (b[clip_a] - a[clip_a])
+        b[clip_b] = a[clip_b] + t[clip_b, None] * (b[clip_b] - a[clip_b])
+
+        if len(a) == 0:
+            return
+
+        a_2d = np.stack((a[:, 0] * self.fx / a[:, 2] + self.cx, a[:, 1] * self.fy / a[:, 2] + self.cy), axis=1)
+        b_2d = np.stack((b[:, 0] * self.fx / b[:, 2] + self.cx, b[:, 1] * self.fy / b[:, 2] + self.cy), axis=1)
+        r_a = self.radius * self.fx / a[:, 2]
+        r_b = self.radius * self.fx / b[:, 2]
+
+        direction = b_2d - a_2d
+        normal = np.stack((-direction[:, 1], direction[:, 0]), axis=1)
+        normal /= np.maximum(np.linalg.norm(normal, axis=1, keepdims=True), 1e-12)
+
+        quads = np.stack((a_2d + r_a[:, None] * normal, b_2d + r_b[:, None] * normal,
+                          b_2d - r_b[:, None] * normal, a_2d - r_a[:, None] * normal), axis=1)
+
+        for quad in self.to_fixed_point(quads):
+            cv2.fillConvexPoly(img, quad, color, cv2.LINE_AA, self.shift)
+
+        centers = self.to_fixed_point(np.concatenate((a_2d, b_2d[-1:])))
+        radii = self.to_fixed_point(np.concatenate((r_a, r_b[-1:])))
+
+        for center, r in zip(centers, radii):
+            cv2.circle(img, tuple(int(x) for x in center), int(r), color, -1, cv2.LINE_AA, self.shift)
+
+    def draw_spheres(self, img, centers_cam, radius, clip_start, color):
+        """
+        Draw spheres as projected discs
+
+        Args:
+            img ((size_y, size_x, c) numpy array): image to draw on
+            centers_cam ((m, 3) numpy array): sphere centers in camera frame
+            radius (float): sphere radius
+            clip_start (float): near clipping distance
+            color (tuple): drawing color
+        """
+        for p in centers_cam:
+            if p[2] < clip_start:
+                continue
+
+            center = self.to_fixed_point(np.array([p[0] * self.fx / p[2] + self.cx, p[1] * self.fy / p[2] + self.cy]))
+            r = self.to_fixed_point(radius * self.fx / p[2])
+            cv2.circle(img, tuple(int(x) for x in center), int(r), color, -1, cv2.LINE_AA, self.shift)
+
+    def render(self, specs, target_specs=None, viewpoint_mode=1, transparent_mode=0):
+        """
+        Render the Bezier curves
+
+        Args:
+            specs ((n, 4, 3) numpy array): specs of the Bezier curves to render
+            target_specs ((m, 3) numpy array or None): 3D positions of target points to render
+            viewpoint_mode (1, 2, or 3): camera view of rendered image, 1 for endoscopic view, 2 for side view
+            transparent_mode (0 or 1): whether to make the background transparent for the rendered image
+
+        Returns:
+            ((size_y, size_x, 3) uint8 numpy array): BGR image, or a BGRA image if transparent_mode is 1
+        """
+        _, _, clip_start = BLENDER_CAMERAS[int(viewpoint_mode)]
+
+        img = np.zeros((self.size_y, self.size_x, 3), dtype=np.uint8)
+        img[:] = self.background_color
+
+        mask = np.zeros((self.size_y, self.size_x), dtype=np.uint8)
+
+        for curve in self.sample_beziers(specs):
+            curve_cam = self.to_camera(curve, int(viewpoint_mode))
+            self.draw_tube(img, curve_cam, clip_start, self.catheter_color)
+            self.draw_tube(mask, curve_cam, clip_start, 255)
+
+        if target_specs is not None:
+            targets_cam = self.to_camera(np.asarray(target_specs, dtype=np.float64), int(viewpoint_mode))
+            self.draw_spheres(img, targets_cam, self.target_radius, clip_start, self.target_color)
+            self.draw_spheres(mask, targets_cam, self.target_radius, clip_start, 255)
+
+        if int(transparent_mode) == 1:
+            img = np.concatenate((img, mask[:, :, None]), axis=2)
+
+        return img
+
+    def render_to_file(self, specs, img_save_path, target_specs=None, viewpoint_mode=1, transparent_mode=0):
+        """
+        Render the Bezier curves and save the image as PNG
+
+        Args:
+            specs ((n, 4, 3) numpy array): specs of the Bezier curves to render
+            img_save_path (path string to png file): path to save the rendered image
+            target_specs ((m, 3) numpy array or None): 3D positions of target points to render
+            viewpoint_mode (1, 2, or 3): camera view of rendered image, 1 for endoscopic view, 2 for side view
+            transparent_mode (0 or 1): whether to make the background transparent for the rendered image
+
+        Returns:
+            ((size_y, size_x, 3) uint8 numpy array): rendered image
+        """
+        img = self.render(specs, target_specs, viewpoint_mode, transparent_mode)
+        cv2.imwrite(img_save_path, img)
+
+        return img
@@ -3,6 +3,7 @@ import torch
 
 import camera_settings
 import path_settings
+from bezier_set import wait_for_image_writes
 from cc_catheter import CCCatheter
 from reconstruction_scripts.reconst_sim_opt2pts import reconstructCurve
 
@@ -10,7 +11,7 @@ from reconstruction_scripts.reconst_sim_opt2pts import reconstructCurve
 
 class SimulationExperiment:
 
-    def __init__(self, dof, loss_2d, tip_loss, use_reconstruction, interspace, viewpoint_mode, damping_weights, noise_percentage, n_iter, render_mode):
+    def __init__(self, dof, loss_2d, tip_loss, use_reconstruction, interspace, viewpoint_mode, damping_weights, noise_percentage, n_iter, render_mode, render_backend='blender', save_images=True, reconstruction_solver='adam'):
         """
         Args:
             dof (1, 2, or 3): DoF of control (1 DoF is not fully implemented currently)
@@ -26,6 +27,11 @@ class SimulationExperiment:
             n_iter (int): number of total iteration of optimization
             render_mode (0, 1, or 2): 0 for rendering no image, 1 for only rendering the image after
                 the last iteration, 2 for rendering all image 
+            render_backend ('blender' or 'software'): 'blender' renders with Blender, 'software' rasterizes
+                the catheter silhouette on the CPU and does not need Blender
+            save_images (bool): whether to write rendered images to images_save_dir. With the 'software'
+                backend, images are handed to the reconstruction in memory either way
+            reconstruction_solver ('adam', 'lbfgs', or 'lm'): optimizer of the reconstruction, see reconstructCurve
         """
         self.dof = dof
         self.loss_2d = loss_2d
@@ -37,6 +43,9 @@ class SimulationExperiment:
         self.noise_percentage = noise_percentage
         self.n_iter = n_iter
         self.render_mode = render_mode
+        self.render_backend = render_backend
+        self.save_images = save_images
+        self.reconstruction_solver = reconstruction_solver
 
         self.use_2d_pos_target = False
 
@@ -234,7 +243,7 @@ class SimulationExperiment:
             catheter.write_target_specs(target_specs_path, show_mid_points=True)
 
         if self.render_mode == 2: 
-            catheter.render_beziers(cc_specs_path, image_save_path, target_specs_path, self.viewpoint_mode, transparent_mode=0)
+            catheter.render_beziers(cc_specs_path, self.get_image_save_path(image_save_path), target_specs_path, self.viewpoint_mode, transparent_mode=0, render_backend=self.render_backend)
 
         for i in range(self.n_iter):
             print('------------------------- Start of Iteration ' + str(i) + ' -------------------------')
@@ -266,11 +275,13 @@ class SimulationExperiment:
             image_save_path = os.path.join(self.images_save_dir, str(i + 1).zfill(3) + '.png')
 
 
+            image = None
+
             if self.render_mode > 0:
                 if i == (self.n_iter - 1):
-                    catheter.render_beziers(cc_specs_path, image_save_path, target_specs_path, self.viewpoint_mode, transparent_mode=1)
+                    image = catheter.render_beziers(cc_specs_path, self.get_image_save_path(image_save_path), target_specs_path, self.viewpoint_mode, transparent_mode=1, render_backend=self.render_backend)
                 elif self.render_mode == 2:
-                    catheter.render_beziers(cc_specs_path, image_save_path, target_specs_path, self.viewpoint_mode, transparent_mode=0)
+                    image = catheter.render_beziers(cc_specs_path, self.get_image_save_path(image_save_path), target_specs_path, self.viewpoint_mode, transparent_mode=0, render_backend=self.render_backend)
 
             if self.use_reconstruction:
 
@@ -283,7 +294,11 @@ class SimulationExperiment:
                 p_0 = torch.tensor(catheter.p_0)
 
                 ## Detect actual bezier
-                bezier_reconstruction = reconstructCurve(image_save_path, catheter.l, p_0, bezier_specs_torch, bezier_specs_init_torch, loss_weight, total_itr=50)
+                ## Use the rendered image directly when the renderer kept it in memory
+                if image is None:
+                    image = image_save_path
+
+                bezier_reconstruction = reconstructCurve(image, catheter.l, p_0, bezier_specs_torch, bezier_specs_init_torch, loss_weight, total_itr=50, solver=self.reconstruction_solver)
                 bezier_reconstruction.getOptimize(None, p_0)
                 #bezier_reconstruction.plotProjCenterline()
 
@@ -298,5 +313,21 @@ class SimulationExperiment:
             print('-------------------------- End of Iteration ' + str(i) + ' --------------------------')
 
         catheter.write_reports(self.params_report_path, self.p3d_report_path, self.p2d_report_path)
+        wait_for_image_writes()
 
         return catheter.get_params()
+
+
+    def get_image_save_path(self, image_save_path):
+        """
+        Args:
+            image_save_path (path string to png file): path of the rendered image of current iteration
+
+        Returns:
+            (path string to png file or None): path to pass to the renderer, None if the image is kept
+                in memory only. The 'blender' backend always needs a path since it returns no image
+        """
+        if self.save_images or self.render_backend != 'software':
+            return image_save_path
+
+        return None
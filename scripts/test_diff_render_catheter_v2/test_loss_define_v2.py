@@ -14,6 +14,13 @@ import cv2
 
 from test_reconst_v2 import ConstructionBezier
 
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from reference_preprocessing import get_reference_data
+from distance_field_chamfer import DistanceFieldChamferLoss
+
 
 class GenerateRefData(): 
     '''
@@ -28,54 +35,11 @@ class GenerateRefData():
         '''
 
         # convert to numpy array
-        img_ref = self.img_ref.cpu().detach().numpy().copy()
-
-        img_height = img_ref.shape[0]
-        img_width = img_ref.shape[1]
-
-        # perform skeletonization, need to extend the boundary of the image because of the way the skeletonization algorithm works (it looks at the 8 neighbors of each pixel)
-        extend_dim = int(60)
-        img_thresh_extend = np.zeros((img_height, img_width + extend_dim))
-        img_thresh_extend[0:img_height, 0:img_width] = img_ref / 1.0
-
-        # get the left boundary of the image
-        left_boundarylineA_id = np.squeeze(np.argwhere(img_thresh_extend[:, img_width - 1]))
-        left_boundarylineB_id = np.squeeze(np.argwhere(img_thresh_extend[:, img_width - 10]))
-
-        # get the center of the left boundary
-        extend_vec_pt1_center = np.array([img_width, (left_boundarylineA_id[0] + left_boundarylineA_id[-1]) / 2])
-        extend_vec_pt2_center = np.array(
-            [img_width - 5, (left_boundarylineB_id[0] + left_boundarylineB_id[-1]) / 2])
-        exten_vec = extend_vec_pt2_center - extend_vec_pt1_center
-
-        # avoid dividing by zero
-        if exten_vec[1] == 0:
-            exten_vec[1] += 0.00000001
-
-        # get the slope and intercept of the line
-        k_extend = exten_vec[0] / exten_vec[1]
-        b_extend_up = img_width - k_extend * left_boundarylineA_id[0]
-        b_extend_dw = img_width - k_extend * left_boundarylineA_id[-1]
-
-        # extend the ROI to the right, so that the skeletonization algorithm could be able to get the centerline
-        # then it could be able to get the intersection point with boundary
-        extend_ROI = np.array([
-            np.array([img_width, left_boundarylineA_id[0]]),
-            np.array([img_width, left_boundarylineA_id[-1]]),
-            np.array([img_width + extend_dim,
-                      int(((img_width + extend_dim) - b_extend_dw) / k_extend)]),
-            np.array([img_width + extend_dim,
-                      int(((img_width + extend_dim) - b_extend_up) / k_extend)])
-        ])
-
-        # fill the extended ROI with 1
-        img_thresh_extend = cv2.fillPoly(img_thresh_extend, [extend_ROI], 1)
-
-        # skeletonize the image
-        skeleton = skimage_morphology.skeletonize(img_thresh_extend)
-
-        # get the centerline of the image
-        img_raw_skeleton = np.argwhere(skeleton[:, 0:img_width] == 1)
+        img_ref = self.img_ref.cpu().detach().numpy()
+
+        # skeletonize the image with its boundary extended to the right (see reference_preprocessing.extend_mask_boundary),
+        # the skeleton is computed once per reference image and cached
+        img_raw_skeleton = get_reference_data(img_ref, ['skeleton'], extend_boundary=True)['skeleton']
 
         self.img_raw_skeleton = torch.as_tensor(img_raw_skeleton).float()
 
@@ -86,20 +50,14 @@ class GenerateRefData():
         Method to compute the raw contour of the catheter from the reference image.
         '''
 
-        # Convert reference image to numpy array of type np.uint8 to be able to use OpenCV
-        img_ref = self.img_ref.cpu().detach().numpy().copy().astype(np.uint8)
-
-        # Find contours in the binary mask
-        contours, _ = cv2.findContours(img_ref, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-        # Extract the largest contour (assuming it's the tube)
-        largest_contour = max(contours, key=cv2.contourArea)
-
-        # Extract coordinates of contour pixels
-        ref_catheter_contour_coordinates = largest_contour.squeeze()
+        # Extract coordinates of the pixels of the largest contour (assuming it's the tube),
+        # the contour and its distance field (used by ContourChamferLoss) are computed once per reference image and cached
+        img_ref = self.img_ref.cpu().detach().numpy()
+        ref_data = get_reference_data(img_ref, ['contour', 'contour_dist_field'])
 
         # Convert coordinates to PyTorch tensor
-        self.ref_catheter_contour_point_cloud = torch.tensor(ref_catheter_contour_coordinates, dtype=torch.float)
+        self.ref_catheter_contour_point_cloud = torch.tensor(ref_data['contour'], dtype=torch.float)
+        self.ref_catheter_contour_dist_field = torch.as_tensor(ref_data['contour_dist_field'])
 
         return self.ref_catheter_contour_point_cloud
         
@@ -114,6 +72,9 @@ class ChamferLossWholeImage(nn.Module):
         super(ChamferLossWholeImage, self).__init__()
         self.device = device
 
+        # distance field of the grid of points, rebuilt only when the image size changes
+        self.chamfer_loss = DistanceFieldChamferLoss(device)
+
     def forward(self, img_render_points, img_ref):
         """
         Calculate the Chamfer loss between rendered points and grid of points
@@ -128,29 +89,14 @@ class ChamferLossWholeImage(nn.Module):
         """
         self.prepare_data(img_render_points, img_ref)
 
-        # Calculate pairwise Euclidean distances
-        distances = torch.norm(self.img_render_point_cloud[:, None, :] - self.coordinates_point_cloud[None, :, :], dim=2)
-
-        # print("distances.shape: ", distances.shape)
-        # print("distances: ", distances)
-        
-        # Find the minimum distance for each point in points1
-        min_distances_1 = torch.min(distances, dim=1)[0]
-
-        # print("min_distances_1.shape: ", min_distances_1.shape)
-        # print("min_distances_1: ", min_distances_1)
-        
-        # Find the minimum distance for each point in points2
-        min_distances_2 = torch.min(distances, dim=0)[0]
+        # Minimum distances in both directions by distance field lookups instead of pairwise distances
+        # (see distance_field_chamfer.DistanceFieldChamferLoss)
+        self.chamfer_loss.setReference(self.coordinates_point_cloud, (self.height, self.width))
 
-        # print("min_distances_2.shape: ", min_distances_2.shape)
-        # print("min_distances_2: ", min_distances_2)
-        
         # Calculate Chamfer loss
-        chamfer_loss = torch.sum(min_distances_1) + torch.sum(min_distances_2)
+        chamfer_loss = self.chamfer_loss(self.img_render_point_cloud)
         # print("chamfer_loss: ", chamfer_loss)
 
-        
         return chamfer_loss
 
     def prepare_data(self, img_render_points, img_ref): 
@@ -187,7 +133,10 @@ class ContourChamferLoss(nn.Module):
         super(ContourChamferLoss, self).__init__()
         self.device = device
 
-    def forward(self, img_render_points, ref_catheter_contour_point_cloud):
+        # distance field of the reference contour, rebuilt only when the reference changes
+        self.chamfer_loss = DistanceFieldChamferLoss(device)
+
+    def forward(self, img_render_points, ref_catheter_contour_point_cloud, ref_catheter_contour_dist_field=None):
         """
         Calculate the Chamfer loss between projected points and reference image's catheter contour.
         
@@ -196,6 +145,8 @@ class ContourChamferLoss(nn.Module):
             ref_catheter_contour_point_cloud (Tensor): Reference contour of catheter 
                                                        (coordinates of pixels on catheter border), 
                                                        Reshape to shape (# of pixels inside the contour , 2).      
+            ref_catheter_contour_dist_field (Tensor): Distance field of the reference contour, shape (3, height, width)
+                                                      (see GenerateRefData.get_raw_contour), computed here if None.
         Returns:
             loss (Tensor): Contour Chamfer loss.
         """
@@ -205,26 +156,15 @@ class ContourChamferLoss(nn.Module):
         # print("self.img_render_point_cloud shape: ", self.img_render_point_cloud.shape)
         # print("self.img_render_point_cloud: ", self.img_render_point_cloud)
 
-        # Calculate pairwise Euclidean distances
-        distances = torch.norm(self.img_render_point_cloud[:, None, :] - ref_catheter_contour_point_cloud[None, :, :], dim=2)
-
-        # print("distances.shape: ", distances.shape)
-        # print("distances: ", distances)
-        
-        # Find the minimum distance for each point in points1
-        min_distances_1 = torch.min(distances, dim=1)[0]
+        # Minimum distances in both directions by distance field lookups instead of pairwise distances
+        # (see distance_field_chamfer.DistanceFieldChamferLoss)
+        if ref_catheter_contour_dist_field is None:
+            self.chamfer_loss.setReference(ref_catheter_contour_point_cloud, (0, 0))
+        else:
+            self.chamfer_loss.setReference(ref_catheter_contour_point_cloud, ref_catheter_contour_dist_field.shape[1:], ref_catheter_contour_dist_field)
 
-        # print("min_distances_1.shape: ", min_distances_1.shape)
-        # print("min_distances_1: ", min_distances_1)
-        
-        # Find the minimum distance for each point in points2
-        min_distances_2 = torch.min(distances, dim=0)[0]
-
-        # print("min_distances_2.shape: ", min_distances_2.shape)
-        # print("min_distances_2: ", min_distances_2)
-        
         # Calculate Chamfer loss
-        chamfer_loss = torch.sum(min_distances_1) + torch.sum(min_distances_2)
+        chamfer_loss = self.chamfer_loss(self.img_render_point_cloud)
         # print("chamfer_loss: ", chamfer_loss)
 
         return chamfer_loss
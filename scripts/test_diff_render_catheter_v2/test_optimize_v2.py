@@ -112,6 +112,7 @@ class CatheterOptimizeModel(nn.Module):
         self.generate_ref_data = GenerateRefData(self.image_ref)
         ref_catheter_contour = self.generate_ref_data.get_raw_contour()
         self.register_buffer('ref_catheter_contour', ref_catheter_contour)
+        self.register_buffer('ref_catheter_contour_dist_field', self.generate_ref_data.ref_catheter_contour_dist_field)
         ref_catheter_centerline = self.generate_ref_data.get_raw_centerline()
         self.register_buffer('ref_catheter_centerline', ref_catheter_centerline)
 
@@ -193,7 +194,7 @@ class CatheterOptimizeModel(nn.Module):
         # loss_boundary_point_distance_loss = self.boundary_point_distance_loss(self.build_bezier.bezier_proj_img, self.image_ref)
 
         # loss_whole_image = self.chamfer_loss_whole_image(self.build_bezier.bezier_proj_img, self.image_ref)
-        loss_contour = self.contour_chamfer_loss(self.build_bezier.bezier_proj_img, self.ref_catheter_contour)
+        loss_contour = self.contour_chamfer_loss(self.build_bezier.bezier_proj_img, self.ref_catheter_contour, self.ref_catheter_contour_dist_field)
         # loss_tip = self.tip_chamfer_loss(self.build_bezier.bezier_proj_img, self.ref_catheter_centerline)
         # loss_boundary = self.boundary_point_chamfer_loss(self.build_bezier.bezier_proj_img, self.ref_catheter_centerline)
         loss_tip_distance, self.tip_euclidean_distance_loss = self.tip_distance_loss(self.build_bezier.bezier_proj_centerline_img, self.ref_catheter_centerline)
@@ -1,3 +1,4 @@
+import math
 import numpy as np
 
 
@@ -14,13 +15,48 @@ def world_to_image_transform(p, camera_extrinsics, fx, fy, cx, cy):
         cx (float): horizontal center of image
         cy (float): vertical center of image
     """
-    p_4d = np.append(p, 1)
-    p_cam = camera_extrinsics @ p_4d
+    return world_to_image_transform_batch(p, camera_extrinsics, fx, fy, cx, cy)
 
-    p_x = p_cam[0] * fx / p_cam[2] + cx
-    p_y = p_cam[1] * fy / p_cam[2] + cy
 
-    return np.array([p_x, p_y])
+def world_to_camera_transform_batch(p, camera_extrinsics):
+    """
+    Convert 3D points to camera coordinates
+
+    Args:
+        p ((..., 3) numpy array): points in 3D
+        camera_extrinsics ((4, 4) numpy array): RT matrix
+
+    Returns:
+        ((..., 3) numpy array): points in camera coordinates
+    """
+    p = np.asarray(p, dtype=np.float64)
+    p_4d = np.concatenate((p, np.ones(p.shape[:-1] + (1,))), axis=-1)
+
+    return (p_4d @ np.asarray(camera_extrinsics, dtype=np.float64).T)[..., :3]
+
+
+def world_to_image_transform_batch(p, camera_extrinsics, fx, fy, cx, cy):
+    """
+    Convert 3D points to 2D given camera parameters
+
+    Args:
+        p ((..., 3) numpy array): points in 3D
+        camera_extrinsics ((4, 4) numpy array): RT matrix
+        fx (float): horizontal direction focal length
+        fy (float): vertical direction focal length
+        cx (float): horizontal center of image
+        cy (float): vertical center of image
+
+    Returns:
+        ((..., 2) numpy array): points in 2D
+    """
+    p_cam = world_to_camera_transform_batch(p, camera_extrinsics)
+
+    p_2d = np.empty(p_cam.shape[:-1] + (2,))
+    p_2d[..., 0] = p_cam[..., 0] * fx / p_cam[..., 2] + cx
+    p_2d[..., 1] = p_cam[..., 1] * fy / p_cam[..., 2] + cy
+
+    return p_2d
 
 
 def image_to_world_transform(p_2d, camera_extrinsics, fx, fy, cx, cy, z):
@@ -55,24 +91,61 @@ def world_to_image_interaction_matrix(p, camera_extrinsics, fx, fy):
         fx (float): horizontal direction focal length
         fy (float): vertical direction focal length
     """
-    p_4d = np.append(p, 1)
-    p_cam = camera_extrinsics @ p_4d
+    return world_to_image_interaction_matrix_batch(p, camera_extrinsics, fx, fy)
+
+
+def world_to_image_interaction_matrix_batch(p, camera_extrinsics, fx, fy):
+    """
+    Calculate world to image interaction matrices of a batch of points
+
+    Args:
+        p ((..., 3) numpy array): points in 3D
+        camera_extrinsics ((4, 4) numpy array): RT matrix
+        fx (float): horizontal direction focal length
+        fy (float): vertical direction focal length
+
+    Returns:
+        ((..., 2, 3) numpy array): interaction matrix of each point
+    """
+    p_cam = world_to_camera_transform_batch(p, camera_extrinsics)
 
-    p_X = p_cam[0]
-    p_Y = p_cam[1]
-    p_Z = p_cam[2]
+    p_X = p_cam[..., 0]
+    p_Y = p_cam[..., 1]
+    p_Z = p_cam[..., 2]
 
     #L = np.array([
     #    [-1 * fx / p_Z, 0, fx * p_X / p_Z / p_Z],
     #    [0, -1 * fy / p_Z, fy * p_Y / p_Z / p_Z]])
 
-    L = np.array([
-        [-1 * fx / p_Z, 0, -1 * fx * p_X / p_Z / p_Z],
-        [0, -1 * fy / p_Z, -1 * fy * p_Y / p_Z / p_Z]])
-    
+    L = np.zeros(p_cam.shape[:-1] + (2, 3))
+    L[..., 0, 0] = -1 * fx / p_Z
+    L[..., 0, 2] = -1 * fx * p_X / p_Z / p_Z
+    L[..., 1, 1] = -1 * fy / p_Z
+    L[..., 1, 2] = -1 * fy * p_Y / p_Z / p_Z
+
     return L
 
 
+def block_diag_interaction_matrix(L):
+    """
+    Assemble the interaction matrices of n points into one block diagonal matrix, which maps the stacked
+        3D positions of the points to their stacked 2D positions
+
+    Args:
+        L ((..., n, 2, 3) numpy array): interaction matrix of each point
+
+    Returns:
+        ((..., 2 * n, 3 * n) numpy array): block diagonal interaction matrix
+    """
+    n = L.shape[-3]
+    L_diag = np.zeros(L.shape[:-3] + (n, 2, n, 3))
+
+    idx = np.arange(n)
+    L_diag[..., idx, :, idx, :] = np.moveaxis(L, -3, 0)
+
+    return L_diag.reshape(L.shape[:-3] + (2 * n, 3 * n))
+
+
 def cc_transform_1dof(p_0, phi, u, l, r, s=1):
     """
     Calculate constant curvature 1DoF transformation
@@ -122,6 +195,176 @@ def cc_transform_3dof(p_0, ux, uy, l, r, s=1):
     return (T @ p_0_4d)[:3]
 
 
+def cc_transform_1dof_batch(p_0, phi, u, l, r, s_list):
+    """
+    Calculate constant curvature 1DoF transformation for a batch of configurations and s values
+
+    Args:
+        p_0 ((3,) numpy array): start point of catheter
+        phi ((n_configs,) numpy array or float): (in radians) phi parameter of each configuration
+        u ((n_configs,) numpy array or float): tendon length of each configuration
+        l ((n_configs,) numpy array or float): length of catheter of each configuration
+        r (float): cross section radius of catheter
+        s_list ((n_s,) numpy array or list): s values representing positions on the CC curve
+
+    Returns:
+        ((n_configs, n_s, 3) numpy array): points on the CC curves
+
+    Note:
+        Matches cc_transform_1dof, which does not use l
+    """
+    phi, u, l = np.broadcast_arrays(*[np.atleast_1d(np.asarray(x, dtype=np.float64)) for x in (phi, u, l)])
+    s = np.asarray(s_list, dtype=np.float64).reshape(1, -1)
+    p_0 = np.asarray(p_0, dtype=np.float64)
+
+    k = (u / r)[:, None]
+    c_phi = np.cos(phi)[:, None]
+    s_phi = np.sin(phi)[:, None]
+    c_ks = np.cos(k * s)
+    s_ks = np.sin(k * s)
+
+    x = (c_phi ** 2 * (c_ks - 1) + 1) * p_0[0] + s_phi * c_phi * (c_ks - 1) * p_0[1] + c_phi * s_ks * p_0[2] + c_phi * (1 - c_ks) / k
+    y = s_phi * c_phi * (c_ks - 1) * p_0[0] + (c_phi ** 2 * (1 - c_ks) + c_ks) * p_0[1] + s_phi * s_ks * p_0[2] + s_phi * (1 - c_ks) / k
+    z = -1 * c_phi * s_ks * p_0[0] - s_phi * s_ks * p_0[1] + c_ks * p_0[2] + s_ks / k
+
+    return np.stack((x, y, z), axis=-1)
+
+
+def cc_transform_3dof_batch(p_0, ux, uy, l, r, s_list):
+    """
+    Calculate constant curvature 3DoF transformation for a batch of configurations and s values
+
+    Args:
+        p_0 ((3,) numpy array): start point of catheter
+        ux ((n_configs,) numpy array or float): 1st pair of tendon length of each configuration
+        uy ((n_configs,) numpy array or float): 2nd pair of tendon length of each configuration
+        l ((n_configs,) numpy array or float): length of catheter of each configuration
+        r (float): cross section radius of catheter
+        s_list ((n_s,) numpy array or list): s values representing positions on the CC curve
+
+    Returns:
+        ((n_configs, n_s, 3) numpy array): points on the CC curves
+    """
+    if is_single_config(ux, uy, l):
+        return np.array([cc_transform_3dof_single(p_0, float(ux), float(uy), float(l), r, s_list)])
+
+    ux, uy, l = np.broadcast_arrays(*[np.atleast_1d(np.asarray(x, dtype=np.float64)) for x in (ux, uy, l)])
+    s = np.asarray(s_list, dtype=np.float64).reshape(1, -1)
+    p_0x, p_0y, p_0z = np.asarray(p_0, dtype=np.float64).tolist()
+
+    u = np.sqrt(ux ** 2 + uy ** 2)[:, None]
+    a_x = ux[:, None] / u
+    a_y = uy[:, None] / u
+    rl = r * l[:, None]
+
+    c_ks = np.cos(u / r * s)
+    s_ks = np.sin(u / r * s)
+
+    ## Expanded form of T @ p_0 with a = (ux, uy) / u: x = p_0x + a_x * m, y = p_0y + a_y * m,
+    ##     z = s_ks * q + c_ks * p_0z + rl * s_ks / u
+    q = a_x * p_0x + a_y * p_0y
+    m = (c_ks - 1) * q - s_ks * p_0z + rl * (1 - c_ks) / u
+
+    p = np.empty(c_ks.shape + (3,))
+    p[..., 0] = p_0x + a_x * m
+    p[..., 1] = p_0y + a_y * m
+    p[..., 2] = s_ks * q + c_ks * p_0z + rl * s_ks / u
+
+    return p
+
+
+def is_single_config(ux, uy, l):
+    """
+    Returns:
+        (bool): whether ux, uy, and l are scalars of a bent configuration, which the *_single functions handle
+    """
+    return np.ndim(ux) == 0 and np.ndim(uy) == 0 and np.ndim(l) == 0 and (ux != 0 or uy != 0)
+
+
+def cc_transform_3dof_single(p_0, ux, uy, l, r, s_list):
+    """
+    cc_transform_3dof_batch for a single configuration, evaluated on floats since numpy calls on a few points
+        cost more in overhead than in arithmetic. The operations are those of cc_transform_3dof_batch in the same order,
+        with squares written as products since numpy squares arrays that way, so both give identical results
+
+    Args:
+        p_0 ((3,) numpy array): start point of catheter
+        ux (float): 1st pair of tendon length (responsible for catheter bending), not 0 together with uy
+        uy (float): 2nd pair of tendon length (responsible for catheter bending)
+        l (float): length of catheter
+        r (float): cross section radius of catheter
+        s_list ((n_s,) numpy array or list): s values representing positions on the CC curve
+
+    Returns:
+        (list of (3,) lists): points on the CC curve
+    """
+    p_0x, p_0y, p_0z = np.asarray(p_0, dtype=np.float64).tolist()
+
+    u = math.sqrt(ux * ux + uy * uy)
+    a_x = ux / u
+    a_y = uy / u
+    rl = r * l
+    q = a_x * p_0x + a_y * p_0y
+
+    p = []
+
+    for s in np.asarray(s_list, dtype=np.float64).tolist():
+        c_ks = math.cos(u / r * s)
+        s_ks = math.sin(u / r * s)
+        m = (c_ks - 1) * q - s_ks * p_0z + rl * (1 - c_ks) / u
+
+        p.append([p_0x + a_x * m, p_0y + a_y * m, s_ks * q + c_ks * p_0z + rl * s_ks / u])
+
+    return p
+
+
+def d_cc_transform_3dof_single(p_0, ux, uy, l, r, s_list):
+    """
+    d_cc_transform_3dof_batch for a single configuration, evaluated on floats, see cc_transform_3dof_single
+
+    Args:
+        p_0 ((3,) numpy array): start point of catheter
+        ux (float): 1st pair of tendon length (responsible for catheter bending), not 0 together with uy
+        uy (float): 2nd pair of tendon length (responsible for catheter bending)
+        l (float): length of catheter
+        r (float): cross section radius of catheter
+        s_list ((n_s,) numpy array or list): s values representing positions on the CC curve
+
+    Returns:
+        (list of (3, 3) lists): positional Jacobian of each CC point, columns as in d_cc_transform_3dof_batch
+    """
+    p_0x, p_0y, p_0z = np.asarray(p_0, dtype=np.float64).tolist()
+
+    u = math.sqrt(ux * ux + uy * uy)
+    a_x = ux / u
+    a_y = uy / u
+    rl = r * l
+    q = a_x * p_0x + a_y * p_0y
+
+    d_ax = (a_y * a_y / u, -1 * a_x * a_y / u)
+    d_ay = (-1 * a_x * a_y / u, a_x * a_x / u)
+    d_u = (a_x, a_y)
+    d_q = [d_ax[j] * p_0x + d_ay[j] * p_0y for j in range(2)]
+
+    J = []
+
+    for s in np.asarray(s_list, dtype=np.float64).tolist():
+        c_ks = math.cos(u / r * s)
+        s_ks = math.sin(u / r * s)
+        m = (c_ks - 1) * q - s_ks * p_0z + rl * (1 - c_ks) / u
+
+        d_ks = [d_u[j] * s / r for j in range(2)]
+        d_m = [(c_ks - 1) * d_q[j] - (s_ks * q + c_ks * p_0z - rl * s_ks / u) * d_ks[j] - rl * (1 - c_ks) / (u * u) * d_u[j]
+               for j in range(2)]
+        d_z = [(c_ks * q - s_ks * p_0z + rl * c_ks / u) * d_ks[j] + s_ks * d_q[j] - rl * s_ks / (u * u) * d_u[j] for j in range(2)]
+
+        J.append([[d_ax[0] * m + a_x * d_m[0], d_ax[1] * m + a_x * d_m[1], r * a_x * (1 - c_ks) / u],
+                  [d_ay[0] * m + a_y * d_m[0], d_ay[1] * m + a_y * d_m[1], r * a_y * (1 - c_ks) / u],
+                  [d_z[0], d_z[1], r * s_ks / u]])
+
+    return J
+
+
 def d_u_cc_transform_1dof(p_0, phi, u, l, r, s=1):
     """
     Calculate derivative of constant curvature 1DoF transformation with respect to u
@@ -243,3 +486,62 @@ def d_l_cc_transform_3dof(p_0, ux, uy, l, r, s=1):
         [0, 0, 0, 0]])
 
     return (dT_dl @ p_0_4d)[:3]
+
+
+def d_cc_transform_3dof_batch(p_0, ux, uy, l, r, s_list):
+    """
+    Calculate derivatives of constant curvature 3DoF transformation with respect to ux, uy, and l
+        for a batch of configurations and s values
+
+    Args:
+        p_0 ((3,) numpy array): start point of catheter
+        ux ((n_configs,) numpy array or float): 1st pair of tendon length of each configuration
+        uy ((n_configs,) numpy array or float): 2nd pair of tendon length of each configuration
+        l ((n_configs,) numpy array or float): length of catheter of each configuration
+        r (float): cross section radius of catheter
+        s_list ((n_s,) numpy array or list): s values representing positions on the CC curve
+
+    Returns:
+        ((n_configs, n_s, 3, 3) numpy array): positional Jacobian of each CC point;
+            the last axis holds the derivatives with respect to ux, uy, and l respectively
+    """
+    if is_single_config(ux, uy, l):
+        return np.array([d_cc_transform_3dof_single(p_0, float(ux), float(uy), float(l), r, s_list)])
+
+    ux, uy, l = np.broadcast_arrays(*[np.atleast_1d(np.asarray(x, dtype=np.float64)) for x in (ux, uy, l)])
+    s = np.asarray(s_list, dtype=np.float64).reshape(1, -1, 1)
+    p_0x, p_0y, p_0z = np.asarray(p_0, dtype=np.float64).tolist()
+
+    ## Arrays are shaped (n_configs, n_s, 2) where the last axis indexes the derivative with
+    ##     respect to ux and uy respectively
+    ux = ux.reshape(-1, 1, 1)
+    uy = uy.reshape(-1, 1, 1)
+    u = np.sqrt(ux ** 2 + uy ** 2)
+    a_x = ux / u
+    a_y = uy / u
+    rl = r * l.reshape(-1, 1, 1)
+
+    c_ks = np.cos(u / r * s)
+    s_ks = np.sin(u / r * s)
+
+    ## Differentiate the expanded form used in cc_transform_3dof_batch
+    q = a_x * p_0x + a_y * p_0y
+    m = (c_ks - 1) * q - s_ks * p_0z + rl * (1 - c_ks) / u
+
+    d_ax = np.concatenate((a_y ** 2 / u, -1 * a_x * a_y / u), axis=-1)
+    d_ay = np.concatenate((-1 * a_x * a_y / u, a_x ** 2 / u), axis=-1)
+    d_u = np.concatenate((a_x, a_y), axis=-1)
+    d_ks = d_u * s / r
+
+    d_q = d_ax * p_0x + d_ay * p_0y
+    d_m = (c_ks - 1) * d_q - (s_ks * q + c_ks * p_0z - rl * s_ks / u) * d_ks - rl * (1 - c_ks) / u ** 2 * d_u
+
+    J = np.empty(d_ks.shape[:2] + (3, 3))
+    J[..., 0, :2] = d_ax * m + a_x * d_m
+    J[..., 1, :2] = d_ay * m + a_y * d_m
+    J[..., 2, :2] = (c_ks * q - s_ks * p_0z + rl * c_ks / u) * d_ks + s_ks * d_q - rl * s_ks / u ** 2 * d_u
+    J[..., 0, 2] = (r * a_x * (1 - c_ks) / u)[..., 0]
+    J[..., 1, 2] = (r * a_y * (1 - c_ks) / u)[..., 0]
+    J[..., 2, 2] = (r * s_ks / u)[..., 0]
+
+    return J
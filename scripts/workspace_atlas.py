@@ -0,0 +1,197 @@
+'''
+Workspace atlas: a dense sampling of the actuation space (ux, uy, l) with the 3D and projected 2D positions of points on
+the constant curvature curve, indexed by KD-trees so that the nearest sample of any 2D or 3D target can be used to
+warm-start the optimization instead of a fixed initial guess.
+'''
+
+import os
+import json
+import numpy as np
+import scipy.spatial
+
+import camera_settings
+import transforms
+from result_cache import save_npy_atomic, to_builtin
+
+
+## Bump when the content of the atlas changes for identical settings, so that stale atlases are rebuilt
+ATLAS_VERSION = 1
+
+
+class WorkspaceAtlas:
+
+    def __init__(self, atlas_dir, p_0, r, s_list=(0.5, 1), ux_range=(-0.01, 0.01), uy_range=(-0.01, 0.01),
+                 l_range=(0.1, 0.3), n_ux=200, n_uy=200, n_l=21):
+        """
+        Open the atlas saved in atlas_dir, or build and save it if it is missing or was built with other settings
+
+        Args:
+            atlas_dir (path string to directory): directory holding the atlas
+            p_0 ((3,) numpy array): start point of catheter
+            r (float): cross section radius of catheter
+            s_list (list of s values): s values of points on the constant curvature curve except for the start point,
+                the last one being the tip. s values are floats from 0 to 1 inclusive
+            ux_range, uy_range, l_range ((2,) tuple): range of each parameter, both ends included
+            n_ux, n_uy, n_l (int): number of grid values of each parameter
+
+        Note:
+            params has shape (n_samples, 3) and holds (ux, uy, l), p3d_points has shape (n_samples, n_s, 3), and
+                p2d_points has shape (n_samples, n_s, 2) and holds (x, y) in the image convention of
+                CCCatheter.convert_cc_points_to_2d, without rounding. Only the samples whose points all fall inside
+                the image are kept. The arrays are memory-mapped read only; the KD-trees are built from them on
+                first use, which is much cheaper than sampling the workspace again
+        """
+        self.atlas_dir = atlas_dir
+        self.p_0 = np.asarray(p_0, dtype=np.float64)
+        self.r = r
+        self.s_list = list(s_list)
+
+        self.ux_values = np.linspace(ux_range[0], ux_range[1], n_ux)
+        self.uy_values = np.linspace(uy_range[0], uy_range[1], n_uy)
+        self.l_values = np.linspace(l_range[0], l_range[1], n_l)
+
+        self.settings = {
+            'atlas_version': ATLAS_VERSION, 'p_0': self.p_0, 'r': r, 's_list': self.s_list,
+            'ux_range': ux_range, 'uy_range': uy_range, 'l_range': l_range, 'n_ux': n_ux, 'n_uy': n_uy, 'n_l': n_l,
+            'camera': [camera_settings.a, camera_settings.b, camera_settings.center_x, camera_settings.center_y,
+                       camera_settings.image_size_x, camera_settings.image_size_y, camera_settings.extrinsics],
+        }
+        self.settings = json.loads(json.dumps(self.settings, default=to_builtin))
+
+        if not self.is_built():
+            self.build()
+
+        for name in ('params', 'p3d_points', 'p2d_points'):
+            setattr(self, name, np.load(os.path.join(atlas_dir, name + '.npy'), mmap_mode='r'))
+
+        ## KD-trees built on first use, keyed by (space, tip_only, l)
+        self.trees = {}
+
+    def is_built(self):
+        """
+        Returns:
+            (bool): whether atlas_dir holds a complete atlas built with the settings of this atlas
+        """
+        settings_path = os.path.join(self.atlas_dir, 'atlas.json')
+
+        if not os.path.isfile(settings_path):
+            return False
+
+        with open(settings_path) as f:
+            return json.load(f) == self.settings
+
+    def build(self):
+        """
+        Sample the parameter grid, keep the configurations in view, and save the atlas to atlas_dir
+
+        Note:
+            atlas.json is written last, so an interrupted build is redone by the next run
+        """
+        os.makedirs(self.atlas_dir, exist_ok=True)
+
+        settings_path = os.path.join(self.atlas_dir, 'atlas.json')
+        if os.path.isfile(settings_path):
+            os.remove(settings_path)
+
+        ux, uy, l = np.meshgrid(self.ux_values, self.uy_values, self.l_values, indexing='ij')
+        params = np.stack([ux.ravel(), uy.ravel(), l.ravel()], axis=1)
+
+        p3d_points = transforms.cc_transform_3dof_batch(self.p_0, params[:, 0], params[:, 1], params[:, 2], self.r, self.s_list)
+        p2d_points = transforms.world_to_image_transform_batch(p3d_points, camera_settings.extrinsics, camera_settings.a,
+                                                               camera_settings.b, camera_settings.center_x, camera_settings.center_y)
+        p2d_points[..., 0] = camera_settings.image_size_x - p2d_points[..., 0]
+
+        ## Same bounds as CCCatheter.convert_cc_points_to_2d; straight configurations (ux = uy = 0) give nan and fail
+        p_x = np.round(p2d_points[..., 0])
+        p_y = np.round(p2d_points[..., 1])
+        in_view = np.all((p_x >= 0) & (p_x < camera_settings.image_size_x) & (p_y >= 0) & (p_y < camera_settings.image_size_y), axis=1)
+
+        if not np.any(in_view):
+            print('[ERROR] [WorkspaceAtlas] No sample of the parameter ranges falls inside the image')
+            exit()
+
+        save_npy_atomic(os.path.join(self.atlas_dir, 'params.npy'), params[in_view])
+        save_npy_atomic(os.path.join(self.atlas_dir, 'p3d_points.npy'), p3d_points[in_view])
+        save_npy_atomic(os.path.join(self.atlas_dir, 'p2d_points.npy'), p2d_points[in_view])
+
+        with open(settings_path, 'w') as f:
+            json.dump(self.settings, f)
+
+    def get_tree(self, space, tip_only, l=None):
+        """
+        Args:
+            space (2 or 3): whether to index the 2D or the 3D positions
+            tip_only (bool): whether to index the tip only or all points in s_list
+            l (float or None): length of catheter of the indexed samples, None to index all samples
+
+        Returns:
+            (scipy.spatial.cKDTree): tree of the positions
+            ((n_indexed,) numpy array): index of the sample of each position of the tree
+        """
+        if l is not None:
+            l_matches = np.isclose(self.l_values, l, rtol=0, atol=1e-9)
+
+            if not np.any(l_matches):
+                print('[ERROR] [WorkspaceAtlas] l = ' + str(l) + ' is not one of the lengths of the atlas: ', self.l_values)
+                exit()
+
+            l = float(self.l_values[np.argmax(l_matches)])
+
+        tree_key = (space, tip_only, l)
+
+        if tree_key not in self.trees:
+            if l is None:
+                sample_index = np.arange(len(self.params))
+            else:
+                sample_index = np.nonzero(self.params[:, 2] == l)[0]
+
+            points = self.p2d_points if space == 2 else self.p3d_points
+            points = points[sample_index, -1] if tip_only else points[sample_index].reshape(len(sample_index), -1)
+
+            self.trees[tree_key] = (scipy.spatial.cKDTree(points), sample_index)
+
+        return self.trees[tree_key]
+
+    def query(self, targets, l=None):
+        """
+        Nearest samples of a batch of targets
+
+        Args:
+            targets ((n, 2), (n, 3), (n, n_s, 2), or (n, n_s, 3) numpy array): 2D (x, y) pixel positions or 3D positions
+                of the tip of each target, or of all points in s_list
+            l (float or None): length of catheter, which must be one of the grid values, to search only the samples
+                of that length (e.g. for 2DoF methods), None to search all samples
+
+        Returns:
+            ((n, 3) numpy array): (ux, uy, l) of the nearest sample of each target
+            ((n,) numpy array): distance of each target to its nearest sample, in pixels for 2D targets
+        """
+        targets = np.asarray(targets, dtype=np.float64)
+        tip_only = targets.ndim == 2
+        space = targets.shape[-1]
+
+        if space not in (2, 3) or targets.ndim not in (2, 3) or (not tip_only and targets.shape[1] != len(self.s_list)):
+            print('[ERROR] [WorkspaceAtlas] Targets of shape ' + str(targets.shape) + ' invalid for s_list ', self.s_list)
+            exit()
+
+        tree, sample_index = self.get_tree(space, tip_only, l)
+        distances, tree_index = tree.query(targets.reshape(len(targets), -1))
+
+        return np.array(self.params[sample_index[tree_index]]), distances
+
+    def seed(self, target, l=None):
+        """
+        Initial parameters for a single target, see query
+
+        Args:
+            target ((2,), (3,), (n_s, 2), or (n_s, 3) numpy array): position of the tip, or of all points in s_list
+            l (float or None): length of catheter to search, None to search all samples
+
+        Returns:
+            ux (float): 1st pair of tendon length
+            uy (float): 2nd pair of tendon length
+            l (float): length of catheter
+        """
+        params, _ = self.query(np.asarray(target)[None], l)
+
+        return tuple(params[0].tolist())
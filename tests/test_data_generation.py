@@ -0,0 +1,27 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+import camera_settings
+from data_generation import DataGeneration
+
+
+def test_stratified_covers_every_stratum(tmp_path):
+    n_data = 50
+    range_min = np.array([-0.005, -0.005, 0.1])
+    range_max = np.array([0.005, 0.005, 0.5])
+
+    data_gen = DataGeneration(n_data, np.array([2e-2, 2e-3, 0]), 0.01, 0.2, [0.5, 1], str(tmp_path / 'D00.npy'), sampling='stratified')
+    data_gen.set_target_ranges(range_min[0], range_max[0], range_min[1], range_max[1], range_min[2], range_max[2])
+    data_gen.set_camera_params(camera_settings.a, camera_settings.b, camera_settings.center_x, camera_settings.center_y,
+                               camera_settings.image_size_x, camera_settings.image_size_y, camera_settings.extrinsics)
+    data_gen.generate_data()
+
+    target_parameters = np.load(str(tmp_path / 'D00.npy'))
+    strata = np.floor((target_parameters - range_min) / (range_max - range_min) * n_data).astype(int)
+
+    assert np.all(data_gen.is_valid_batch(target_parameters))
+    assert all(sorted(strata[:, j]) == list(range(n_data)) for j in range(3))
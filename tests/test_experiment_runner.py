@@ -0,0 +1,72 @@
+import os
+import sys
+import multiprocessing
+import multiprocessing.pool
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+from experiment_setup import experiments
+import experiment_runner
+from experiment_runner import ParallelExperimentRunner, make_job, run_batched_jobs
+import bezier_set
+
+
+def write_blank_image(img_save_path):
+    bezier_set.write_image_async(img_save_path, np.zeros((8, 8, 3), dtype=np.uint8))
+    bezier_set.wait_for_image_writes()
+
+    return os.path.isfile(img_save_path)
+
+
+def test_image_writer_after_fork(tmp_path):
+    ## The parent starts its writer thread before the pool forks
+    assert write_blank_image(str(tmp_path / 'parent.png'))
+
+    with multiprocessing.get_context('fork').Pool(2) as pool:
+        results = [pool.apply_async(write_blank_image, (str(tmp_path / (str(i) + '.png')),)) for i in range(4)]
+
+        assert all(result.get(timeout=60) for result in results)
+
+
+def test_batched_jobs_then_pool(tmp_path):
+    p_0 = np.array([2e-2, 2e-3, 0])
+    jobs = []
+
+    for i in range(3):
+        ## Batchable: controlled in lockstep in this process, rendered once at the end in the pool workers
+        jobs.append(make_job('UN000', experiments['UN000'], i, str(tmp_path / 'UN000' / str(i)), p_0, 0.01, 3, 0, 'software',
+                             0.00001, 0.00001, 0.2, ux_target=0.001 * (i + 1), uy_target=0.001))
+
+        ## Not batchable: rendered on every iteration, in the pool workers
+        job = make_job('UN002', experiments['UN002'], i, str(tmp_path / 'UN002' / str(i)), p_0, 0.01, 3, 0, 'software',
+                       0.00001, 0.00001, 0.2, ux_target=0.001 * (i + 1), uy_target=0.001)
+        job['render_mode'] = 2
+        jobs.append(job)
+
+    runner = ParallelExperimentRunner(2)
+    pool = multiprocessing.pool.ThreadPool(1)
+    records = pool.apply_async(runner.run, (jobs,), {'batch_simulation': True}).get(timeout=240)
+    pool.terminate()
+
+    assert len(records) == len(jobs)
+    assert [record for record in records if record['status'] != 'ok'] == []
+
+
+def test_render_failure_fails_own_job_only(tmp_path, monkeypatch):
+    p_0 = np.array([2e-2, 2e-3, 0])
+    jobs = [make_job('UN000', experiments['UN000'], i, str(tmp_path / 'UN000' / str(i)), p_0, 0.01, 3, 0, 'software',
+                     0.00001, 0.00001, 0.2, ux_target=0.001 * (i + 1), uy_target=0.001) for i in range(3)]
+    render_final_image = experiment_runner.render_final_image
+
+    def render_or_fail(render_job):
+        if str(tmp_path / 'UN000' / '1') in render_job['cc_specs_path']:
+            raise RuntimeError('render failed')
+
+        render_final_image(render_job)
+
+    monkeypatch.setattr(experiment_runner, 'render_final_image', render_or_fail)
+    records = run_batched_jobs(jobs)
+
+    assert sorted((record['data_index'], record['status']) for record in records) == [(0, 'ok'), (1, 'failed'), (2, 'ok')]
@@ -0,0 +1,60 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+import transforms
+
+
+P_0 = np.array([2e-2, 2e-3, 0])
+R = 0.01
+S_LIST = [0.25, 0.5, 1]
+
+## (ux, uy, l) of bent configurations, from nearly straight to strongly bent
+CONFIGS = [(0.00001, 0.00001, 0.2), (0.001, -0.002, 0.1), (-0.004, 0.003, 0.3), (0.005, 0, 0.5), (0, -0.0005, 0.15)]
+
+
+def baseline_points(ux, uy, l):
+    return np.array([transforms.cc_transform_3dof(P_0, ux, uy, l, R, s) for s in S_LIST], dtype=np.float64)
+
+
+def baseline_jacobians(ux, uy, l):
+    return np.array([np.stack([np.asarray(d(P_0, ux, uy, l, R, s), dtype=np.float64)
+                               for d in (transforms.d_ux_cc_transform_3dof, transforms.d_uy_cc_transform_3dof, transforms.d_l_cc_transform_3dof)], axis=-1)
+                     for s in S_LIST])
+
+
+def test_single_config_matches_batch_and_baseline():
+    for ux, uy, l in CONFIGS:
+        assert transforms.is_single_config(ux, uy, l)
+
+        p_single = transforms.cc_transform_3dof_batch(P_0, ux, uy, l, R, S_LIST)
+        p_batch = transforms.cc_transform_3dof_batch(P_0, np.array([ux]), np.array([uy]), np.array([l]), R, S_LIST)
+        J_single = transforms.d_cc_transform_3dof_batch(P_0, ux, uy, l, R, S_LIST)
+        J_batch = transforms.d_cc_transform_3dof_batch(P_0, np.array([ux]), np.array([uy]), np.array([l]), R, S_LIST)
+
+        assert np.array_equal(p_single, p_batch)
+        assert np.array_equal(J_single, J_batch)
+
+        np.testing.assert_allclose(p_single[0], baseline_points(ux, uy, l), rtol=1e-12, atol=1e-15)
+        np.testing.assert_allclose(J_single[0], baseline_jacobians(ux, uy, l), rtol=1e-9, atol=1e-10)
+
+
+def test_batch_matches_baseline():
+    ux, uy, l = np.array(CONFIGS).T
+
+    p_batch = transforms.cc_transform_3dof_batch(P_0, ux, uy, l, R, S_LIST)
+    J_batch = transforms.d_cc_transform_3dof_batch(P_0, ux, uy, l, R, S_LIST)
+
+    assert p_batch.shape == (len(CONFIGS), len(S_LIST), 3)
+    assert J_batch.shape == (len(CONFIGS), len(S_LIST), 3, 3)
+
+    for k, config in enumerate(CONFIGS):
+        np.testing.assert_allclose(p_batch[k], baseline_points(*config), rtol=1e-12, atol=1e-15)
+        np.testing.assert_allclose(J_batch[k], baseline_jacobians(*config), rtol=1e-9, atol=1e-10)
+
+    ## Broadcast of a scalar length against arrays of tendon lengths
+    np.testing.assert_array_equal(transforms.cc_transform_3dof_batch(P_0, ux, uy, 0.2, R, S_LIST),
+                                  transforms.cc_transform_3dof_batch(P_0, ux, uy, np.full(len(CONFIGS), 0.2), R, S_LIST))